@@ -2,6 +2,7 @@ from runhouse.resources.blobs import blob, Blob, file, File
 from runhouse.resources.envs import conda_env, CondaEnv, env, Env
 from runhouse.resources.folders import Folder, folder, GCSFolder, S3Folder
 from runhouse.resources.function import function, Function
+from runhouse.resources.futures import as_completed, wait
 from runhouse.resources.hardware import (
     _current_cluster,
     cluster,
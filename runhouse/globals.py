@@ -5,6 +5,7 @@ import logging.config
 # from runhouse.logger import LOGGING_CONFIG
 from runhouse.rns.defaults import Defaults
 from runhouse.rns.rns_client import RNSClient
+from runhouse.servers.call_cache import CallCache
 from runhouse.servers.obj_store import ObjStore
 
 # Configure the logger once
@@ -22,4 +23,6 @@ rns_client = RNSClient(configs=configs)
 # Note: this initalizes a dummy global object. The obj_store must
 # be properly initialized by a servlet via set_name.
 obj_store = ObjStore()
+# Likewise configured by a servlet, see `CallCache.configure`
+call_cache = CallCache()
 env_servlets = {}
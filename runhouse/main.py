@@ -108,6 +108,7 @@ def _start_server(
     use_nginx=False,
     certs_address=None,
     use_local_telemetry=False,
+    workers=None,
 ):
     from runhouse.resources.hardware.cluster import Cluster
 
@@ -126,6 +127,7 @@ def _start_server(
         use_nginx=use_nginx,
         certs_address=certs_address,
         use_local_telemetry=use_local_telemetry,
+        workers=workers,
     )
 
     try:
@@ -198,6 +200,11 @@ def start(
     use_local_telemetry: bool = typer.Option(
         False, help="Whether to use local telemetry"
     ),
+    workers: Optional[int] = typer.Option(
+        None,
+        help="Number of API server worker processes. If not specified will run a single worker, or the "
+        "number of workers set in the cluster config.",
+    ),
 ):
     """Start the HTTP or HTTPS server on the cluster."""
     _start_server(
@@ -212,6 +219,7 @@ def start(
         use_nginx=use_nginx,
         certs_address=certs_address,
         use_local_telemetry=use_local_telemetry,
+        workers=workers,
     )
 
 
@@ -261,6 +269,11 @@ def restart(
         False,
         help="Whether to use local telemetry",
     ),
+    workers: Optional[int] = typer.Option(
+        None,
+        help="Number of API server worker processes. If not specified will run a single worker, or the "
+        "number of workers set in the cluster config.",
+    ),
 ):
     """Restart the HTTP server on the cluster."""
     if name:
@@ -283,6 +296,7 @@ def restart(
         use_nginx=use_nginx,
         certs_address=certs_address,
         use_local_telemetry=use_local_telemetry,
+        workers=workers,
     )
 
 
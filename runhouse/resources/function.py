@@ -29,6 +29,7 @@ class Function(Module):
         env: Optional[Env] = None,
         dryrun: bool = False,
         access: Optional[str] = None,
+        cache: bool = False,
         **kwargs,  # We have this here to ignore extra arguments when calling from from_config
     ):
         """
@@ -40,6 +41,7 @@ class Function(Module):
         """
         self.fn_pointers = fn_pointers
         self.access = access or self.DEFAULT_ACCESS
+        self.cache = cache
         super().__init__(name=name, dryrun=dryrun, system=system, env=env, **kwargs)
 
     # ----------------- Constructor helper methods -----------------
@@ -152,6 +154,9 @@ class Function(Module):
                 Defaults to ``True``.
              run_name (Optional[str]): Name of the Run to create. If provided, a Run will be created
                 for this function call, which will be executed synchronously on the cluster before returning its result
+             cache_key (Optional[str]): Key to cache the result of this call under on the cluster, so later calls
+                with the same key return the cached result rather than running the function again (in place of the
+                args, which key the cached results of Functions created with ``cache=True``). See :func:`clear_cache`.
              **kwargs: Optional kwargs for the Function
 
         Returns:
@@ -229,6 +234,17 @@ class Function(Module):
         key = self.call.run(*args, **kwargs)
         return key
 
+    def submit(self, *args, local=True, **kwargs):
+        """Call the Function on its cluster in the cluster's shared thread pool, and return a future for the
+        result right away.
+
+        Example:
+            >>> remote_fn = rh.function(local_fn).to(gpu)
+            >>> futures = [remote_fn.submit(i) for i in range(100)]
+            >>> results = [future.result() for future in futures]
+        """
+        return self.call.submit(*args, **kwargs)
+
     def get(self, run_key):
         """Get the result of a Function call that was submitted as async using `run`.
 
@@ -249,6 +265,7 @@ class Function(Module):
         config.update(
             {
                 "fn_pointers": self.fn_pointers,
+                "cache": self.cache,
             }
         )
         return config
@@ -330,6 +347,15 @@ class Function(Module):
 
         return self.call(*args, **kwargs, run_name=run_name)
 
+    def clear_cache(self) -> int:
+        """Drop the cached results of the Function's calls on its cluster (see ``cache``), so the next calls run the
+        function again. Returns the number of results dropped.
+
+        Example:
+            >>> remote_fn.clear_cache()
+        """
+        return globals.call_cache.invalidate(self.name)
+
     def keep_warm(
         self,
         autostop_mins=None,
@@ -385,6 +411,7 @@ def function(
     dryrun: bool = False,
     load_secrets: bool = False,
     serialize_notebook_fn: bool = False,
+    cache: bool = False,
     # args below are deprecated
     reqs: Optional[List[str]] = None,
     setup_cmds: Optional[List[str]] = None,
@@ -405,6 +432,9 @@ def function(
             (Default: ``False``)
         serialize_notebook_fn (bool): If function is of a notebook setting, whether or not to serialized the function.
             (Default: ``False``)
+        cache (bool): Whether the function is deterministic, so the results of its calls can be cached on the
+            cluster by their args, and returned for later calls with the same args without running it again.
+            See :func:`Function.clear_cache` and the cluster's ``call_cache_max_*`` limits. (Default: ``False``)
 
     Returns:
         Function: The resulting Function object.
@@ -491,6 +521,7 @@ def function(
         access=Function.DEFAULT_ACCESS,
         name=name,
         dryrun=dryrun,
+        cache=cache,
     ).to(system=system, env=env)
 
     if load_secrets and not dryrun:
@@ -0,0 +1,44 @@
+import concurrent.futures
+from concurrent.futures import ALL_COMPLETED, Future
+from typing import Iterable, Iterator, Optional, Set, Tuple
+
+
+def wait(
+    futures: Iterable[Future],
+    timeout: Optional[float] = None,
+    return_when: str = ALL_COMPLETED,
+) -> Tuple[Set[Future], Set[Future]]:
+    """Wait for futures returned by ``submit`` calls (e.g. ``my_fn.submit(...)``) to finish.
+
+    Args:
+        futures (Iterable[Future]): The futures to wait for.
+        timeout (Optional[float]): Max number of seconds to wait. (Default: ``None``, wait indefinitely)
+        return_when (str): When to return: ``"FIRST_COMPLETED"``, ``"FIRST_EXCEPTION"``, or
+            ``"ALL_COMPLETED"``. (Default: ``"ALL_COMPLETED"``)
+
+    Returns:
+        A ``(done, not_done)`` tuple of sets of futures.
+
+    Example:
+        >>> futures = [remote_fn.submit(i) for i in range(100)]
+        >>> done, not_done = rh.wait(futures, timeout=60)
+    """
+    return concurrent.futures.wait(futures, timeout=timeout, return_when=return_when)
+
+
+def as_completed(
+    futures: Iterable[Future], timeout: Optional[float] = None
+) -> Iterator[Future]:
+    """Iterate over futures returned by ``submit`` calls in the order they finish.
+
+    Args:
+        futures (Iterable[Future]): The futures to iterate over.
+        timeout (Optional[float]): Max number of seconds to wait for all of them to finish, after which a
+            ``TimeoutError`` is raised. (Default: ``None``, wait indefinitely)
+
+    Example:
+        >>> futures = [remote_fn.submit(i) for i in range(100)]
+        >>> for future in rh.as_completed(futures):
+        >>>     print(future.result())
+    """
+    return concurrent.futures.as_completed(futures, timeout=timeout)
@@ -1,3 +1,4 @@
+import asyncio
 import contextlib
 import copy
 import logging
@@ -9,6 +10,7 @@ import sys
 import threading
 import time
 import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple, Union
 
@@ -62,6 +64,7 @@ class Cluster(Resource):
     # We need to use this instead of ray stop to make sure we don't stop the SkyPilot ray server,
     # which runs on other ports but is required to preserve autostop and correct cluster status.
     RAY_KILL_CMD = 'pkill -f ".*ray.*6379.*"'
+    _executor_lock = threading.Lock()
 
     def __init__(
         self,
@@ -77,6 +80,19 @@ class Cluster(Resource):
         ssl_certfile: str = None,
         den_auth: bool = False,
         use_local_telemetry: bool = False,
+        server_workers: int = None,
+        client_pool_size: int = None,
+        compression: Union[bool, str] = True,
+        compression_threshold: int = None,
+        obj_store_memory_limit: int = None,
+        obj_store_snapshots: bool = False,
+        obj_store_backend: str = None,
+        results_max_age: int = None,
+        results_max_count: int = None,
+        results_max_bytes: int = None,
+        call_cache_max_age: int = None,
+        call_cache_max_count: int = None,
+        call_cache_max_bytes: int = None,
         dryrun=False,
         **kwargs,  # We have this here to ignore extra arguments when calling from from_config
     ):
@@ -95,6 +111,7 @@ class Cluster(Resource):
         self._ssh_creds = ssh_creds
         self.ips = ips
         self._rpc_tunnel = None
+        self._executor = None
 
         self.client = None
         self.den_auth = den_auth
@@ -108,6 +125,25 @@ class Cluster(Resource):
         self.ssh_port = ssh_port or self.DEFAULT_SSH_PORT
         self.server_host = server_host
         self.use_local_telemetry = use_local_telemetry
+        self.server_workers = server_workers
+        self.client_pool_size = client_pool_size
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.obj_store_memory_limit = obj_store_memory_limit
+        # Whether the objects and resources put in each env's object store (e.g. with `put` and `put_resource`, but
+        # not run results) are snapshotted to disk, so they're restored after the server restarts
+        self.obj_store_snapshots = obj_store_snapshots
+        # "disk" to store each env's object store in an embedded database on disk rather than in memory. Resources
+        # (e.g. modules and run results) are still kept in memory.
+        self.obj_store_backend = obj_store_backend
+        # Retention limits for the results of runs in each env, past which servlets reclaim the oldest results
+        self.results_max_age = results_max_age
+        self.results_max_count = results_max_count
+        self.results_max_bytes = results_max_bytes
+        # Limits for the cached results of deterministic calls in each env, see ``rh.function(..., cache=True)``
+        self.call_cache_max_age = call_cache_max_age
+        self.call_cache_max_count = call_cache_max_count
+        self.call_cache_max_bytes = call_cache_max_bytes
 
     @property
     def address(self):
@@ -161,8 +197,21 @@ class Cluster(Resource):
                 "server_connection_type",
                 "den_auth",
                 "use_local_telemetry",
+                "server_workers",
                 "ssh_port",
                 "client_port",
+                "client_pool_size",
+                "compression",
+                "compression_threshold",
+                "obj_store_memory_limit",
+                "obj_store_snapshots",
+                "obj_store_backend",
+                "results_max_age",
+                "results_max_count",
+                "results_max_bytes",
+                "call_cache_max_age",
+                "call_cache_max_count",
+                "call_cache_max_bytes",
             ],
         )
         if self.is_up():
@@ -302,6 +351,27 @@ class Cluster(Resource):
             return default
         return res
 
+    async def get_async(
+        self, key: str, default: Any = None, remote=False, stream_logs: bool = False
+    ):
+        """Async version of :func:`get`."""
+        await self._check_server_async()
+        if self.on_this_cluster():
+            return obj_store.get(key, default=default)
+        try:
+            res = await self.client.call_module_method_async(
+                key,
+                None,
+                remote=remote,
+                stream_logs=stream_logs,
+                system=self,
+            )
+        except KeyError as e:
+            if default == KeyError:
+                raise e
+            return default
+        return res
+
     # TODO deprecate
     def get_run(self, run_name: str, folder_path: str = None):
         self.check_server()
@@ -318,9 +388,24 @@ class Cluster(Resource):
         """Put the given object on the cluster's object store at the given key."""
         self.check_server()
         if self.on_this_cluster():
-            return obj_store.put(key, obj, env=env)
+            return obj_store.put(key, obj, env=env, snapshot=True)
         return self.client.put_object(key, obj, env=env)
 
+    def put_many(self, mapping: Dict[str, Any], env=None):
+        """Put many objects on the cluster's object store at once, given a dict of keys to objects."""
+        self.check_server()
+        if self.on_this_cluster():
+            return obj_store.put_many(mapping, env=env, snapshot=True)
+        return self.client.put_many(mapping, env=env)
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Get many objects from the cluster's object store at once. Returns a dict of keys to objects,
+        leaving out any keys which aren't found."""
+        self.check_server()
+        if self.on_this_cluster():
+            return obj_store.get_many(keys)
+        return self.client.get_many(keys)
+
     def put_resource(self, resource: Resource, state=None, dryrun=False):
         """Put the given resource on the cluster's object store. Returns the key (important if name is not set)."""
         self.check_server()
@@ -332,7 +417,9 @@ class Cluster(Resource):
             else None
         )
         if self.on_this_cluster():
-            return obj_store.put(key=resource.name, value=resource, env=env)
+            return obj_store.put(
+                key=resource.name, value=resource, env=env, snapshot=True
+            )
         return self.client.put_resource(
             resource, state=state or {}, env=env, dryrun=dryrun
         )
@@ -344,14 +431,39 @@ class Cluster(Resource):
             return obj_store.rename(old_key, new_key)
         return self.client.rename_object(old_key, new_key)
 
-    def keys(self, env=None):
-        """List all keys in the cluster's object store."""
+    def keys(
+        self,
+        env=None,
+        prefix: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ):
+        """List all keys in the cluster's object store. If a ``prefix`` or ``limit`` is given, only the matching
+        keys are listed, in sorted order, and the next page of keys can be listed by passing the last key listed as
+        the ``cursor``.
+
+        Example:
+            >>> page = cluster.keys(prefix="run_", limit=100)
+            >>> next_page = cluster.keys(prefix="run_", limit=100, cursor=page[-1])
+        """
         self.check_server()
         if self.on_this_cluster():
-            return obj_store.keys()
-        res = self.client.keys(env=env)
+            return obj_store.keys(prefix=prefix, limit=limit, cursor=cursor)
+        res = self.client.keys(env=env, prefix=prefix, limit=limit, cursor=cursor)
         return res
 
+    def obj_store_stats(self, env=None):
+        """Memory and disk usage, spill/reload counters and per-key sizes of an env's object store (by default
+        the base env), and how many run results its servlet has reclaimed. See ``obj_store_memory_limit`` to bound
+        the memory used by each env's object store (or ``obj_store_backend="disk"`` to keep it on disk), and
+        ``results_max_age``, ``results_max_count`` and ``results_max_bytes`` to limit how long the results of runs
+        are kept. Also includes the hit/miss counters of the env's cache of call results (see ``call_cache_max_*``).
+        """
+        self.check_server()
+        if self.on_this_cluster():
+            return obj_store.stats()
+        return self.client.obj_store_stats(env=env)
+
     def cancel(self, key: str, force=False):
         """Cancel a given run on cluster by its key."""
         self.check_server()
@@ -396,6 +508,9 @@ class Cluster(Resource):
             self._rpc_tunnel.close()
 
         self._rpc_tunnel, connected_port = get_open_tunnel(self.address, self.ssh_port)
+        # Pooled connections from an old client may point at a tunnel which no longer exists
+        if self.client:
+            self.client.close()
 
         if (
             self.server_connection_type
@@ -437,6 +552,9 @@ class Cluster(Resource):
                 auth=auth,
                 cert_path=cert_path,
                 use_https=use_https,
+                pool_size=self.client_pool_size,
+                compression=self.compression,
+                compression_threshold=self.compression_threshold,
             )
         else:
             self.client = HTTPClient(
@@ -444,6 +562,9 @@ class Cluster(Resource):
                 port=self.client_port,
                 cert_path=cert_path,
                 use_https=use_https,
+                pool_size=self.client_pool_size,
+                compression=self.compression,
+                compression_threshold=self.compression_threshold,
             )
 
     def check_server(self, restart_server=True):
@@ -617,6 +738,7 @@ class Cluster(Resource):
         use_nginx,
         certs_address,
         use_local_telemetry,
+        workers=None,
     ):
         cmds = []
         if restart:
@@ -686,6 +808,11 @@ class Cluster(Resource):
             logger.info("Configuring local telemetry on the cluster.")
             flags.append(use_local_telemetry_flag)
 
+        workers_flag = f" --workers {workers}" if workers else ""
+        if workers_flag:
+            logger.info(f"Starting API server with {workers} workers.")
+            flags.append(workers_flag)
+
         logger.info(
             f"Starting API server using the following command: {server_start_cmd}."
         )
@@ -773,6 +900,7 @@ class Cluster(Resource):
             + (f" --ssl-certfile {cluster_cert_path}" if use_custom_cert else "")
             + (f" --ssl-keyfile {cluster_key_path}" if use_custom_key else "")
             + (" --use-local-telemetry" if use_local_telemetry else "")
+            + (f" --workers {self.server_workers}" if self.server_workers else "")
             + f" --port {self.server_port}"
         )
 
@@ -813,6 +941,7 @@ class Cluster(Resource):
         remote=False,
         run_async=False,
         save=False,
+        cache_key=None,
         **kwargs,
     ):
         """Call a method on a module that is in the cluster's object store.
@@ -824,6 +953,8 @@ class Cluster(Resource):
             run_name (str): Name for the run.
             remote (bool): Return a remote object from the function, rather than the result proper.
             run_async (bool): Run the method asynchronously and return a run_key to retreive results and logs later.
+            cache_key (str): Key to cache the result of the call under, so later calls with the same key return the
+                cached result rather than calling the method again.
             *args: Positional arguments to pass to the method.
             **kwargs: Keyword arguments to pass to the method.
 
@@ -846,8 +977,95 @@ class Cluster(Resource):
             args=args,
             kwargs=kwargs,
             system=self,
+            cache_key=cache_key,
         )
 
+    async def call_async(
+        self,
+        module_name,
+        method_name,
+        *args,
+        stream_logs=True,
+        run_name=None,
+        remote=False,
+        run_async=False,
+        save=False,
+        cache_key=None,
+        **kwargs,
+    ):
+        """Async version of :func:`call`, which awaits the call on the running event loop rather than in a thread.
+        If the method is a generator, returns an async generator of its results.
+
+        Example:
+            >>> await cluster.call_async("my_module", "my_method", arg1, arg2, kwarg1=kwarg1)
+        """
+        await self._check_server_async()
+        return await self.client.call_module_method_async(
+            module_name,
+            method_name,
+            stream_logs=stream_logs,
+            run_name=run_name,
+            remote=remote,
+            run_async=run_async,
+            save=save,
+            args=args,
+            kwargs=kwargs,
+            system=self,
+            cache_key=cache_key,
+        )
+
+    async def _check_server_async(self):
+        # Like `check_server`, which is a no-op once the cluster has an address and the client is connected, so only
+        # hop to a thread when it has to connect the client or look up (and maybe up) the cluster
+        if self.address and self.client:
+            return
+        if not self.on_this_cluster():
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.check_server
+            )
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Thread pool shared by all the concurrent calls to this cluster (e.g. ``my_fn.submit``). It's sized to
+        the client's connection pool, so each call reuses a pooled connection to the server."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.client_pool_size or HTTPClient.DEFAULT_POOL_SIZE,
+                    thread_name_prefix=f"rh-{self.name or 'cluster'}",
+                )
+        return self._executor
+
+    def submit(self, module_name, method_name, *args, **kwargs) -> Future:
+        """Like :func:`call`, but returns a future for the result right away rather than waiting for the call to
+        finish. Calls run concurrently in the cluster's shared thread pool.
+
+        Example:
+            >>> futures = [cluster.submit("my_module", "my_method", i) for i in range(100)]
+            >>> results = [future.result() for future in rh.as_completed(futures)]
+        """
+        return self.executor.submit(
+            self.call, module_name, method_name, *args, **kwargs
+        )
+
+    def call_batch(self, calls, return_exceptions: bool = False):
+        """Call many methods on modules in the cluster's object store in one round trip. The calls run
+        concurrently on the cluster.
+
+        Args:
+            calls (list): ``(module_name, method_name, args, kwargs)`` tuples, where args and kwargs are optional.
+            return_exceptions (bool): Return the exception in place of the result for calls which fail, rather
+                than raising the first one. (Default: ``False``)
+
+        Returns:
+            The results of the calls, in the same order as the calls.
+
+        Example:
+            >>> cluster.call_batch([("my_module", "my_method", [arg1]), ("my_module", "other_method")])
+        """
+        self.check_server()
+        return self.client.call_batch(calls, return_exceptions=return_exceptions)
+
     def is_connected(self):
         """Whether the RPC tunnel is up.
 
@@ -870,6 +1088,7 @@ class Cluster(Resource):
         state = self.__dict__.copy()
         state["client"] = None
         state["_rpc_tunnel"] = None
+        state["_executor"] = None
         return state
 
     # ----------------- SSH Methods ----------------- #
@@ -1,8 +1,10 @@
+import copy
 import logging
 import os
 import pathlib
 import shlex
 import subprocess
+import threading
 import time
 from enum import Enum
 from pathlib import Path
@@ -31,6 +33,12 @@ logger = logging.getLogger(__name__)
 
 RESERVED_SYSTEM_NAMES = ["file", "s3", "gs", "azure", "here", "ssh", "sftp"]
 
+CLUSTER_CONFIG_PATH = "~/.rh/cluster_config.yaml"
+
+# Parsed contents of the cluster config, keyed by the file's mtime and size so we only re-parse it when it changes
+_cluster_config_cache = {}
+_cluster_config_lock = threading.Lock()
+
 
 # Get rid of the constant "Found credentials in shared credentials file: ~/.aws/credentials" message
 try:
@@ -92,21 +100,44 @@ class ServerConnectionType(str, Enum):
 def _current_cluster(key="name"):
     """Retrive key value from the current cluster config.
     If key is "config", returns entire config."""
-    if Path("~/.rh/cluster_config.yaml").expanduser().exists():
-        cluster_config = _load_cluster_config()
-        if key == "config":
-            return cluster_config
-        elif key == "cluster_name":
-            return cluster_config["name"].rsplit("/", 1)[-1]
-        return cluster_config[key]
-    else:
+    stamp = _cluster_config_stamp()
+    if stamp is None:
+        return None
+
+    cluster_config = _cached_cluster_config(stamp)
+    if key == "config":
+        return copy.deepcopy(cluster_config)
+    elif key == "cluster_name":
+        return cluster_config["name"].rsplit("/", 1)[-1]
+    return copy.deepcopy(cluster_config[key])
+
+
+def _cluster_config_stamp():
+    """Modification time and size of the cluster config file, or None if there is no config (i.e. we're not on a
+    cluster). Used to tell whether the cached config is stale."""
+    try:
+        stat = os.stat(Path(CLUSTER_CONFIG_PATH).expanduser())
+    except FileNotFoundError:
         return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _cached_cluster_config(stamp):
+    """Return the parsed cluster config, only re-reading the file if it has changed since it was last parsed.
+    Shared across the process, so callers must not mutate the returned dict."""
+    with _cluster_config_lock:
+        if _cluster_config_cache.get("stamp") != stamp:
+            with open(Path(CLUSTER_CONFIG_PATH).expanduser()) as f:
+                _cluster_config_cache["config"] = yaml.safe_load(f)
+            _cluster_config_cache["stamp"] = stamp
+        return _cluster_config_cache["config"]
 
 
 def _load_cluster_config():
-    with open(Path("~/.rh/cluster_config.yaml").expanduser()) as f:
-        cluster_config = yaml.safe_load(f)
-    return cluster_config
+    stamp = _cluster_config_stamp()
+    if stamp is None:
+        raise FileNotFoundError(f"No cluster config found at {CLUSTER_CONFIG_PATH}")
+    return copy.deepcopy(_cached_cluster_config(stamp))
 
 
 def _get_cluster_from(system, dryrun=False):
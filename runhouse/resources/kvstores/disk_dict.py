@@ -0,0 +1,272 @@
+import heapq
+import logging
+import pickle
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from runhouse.resources.kvstores.sorted_key_dict import _entry, _MAX_CHAR, scan_keys
+from runhouse.resources.kvstores.tiered_dict import _is_spillable, estimate_size
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class DiskDict(MutableMapping):
+    """Dict stored in an embedded SQLite database at ``path``, for working sets bigger than memory. Values are
+    serialized once on put (with `pickle_oob`) and read through SQLite's memory-mapped I/O, and bytes and arrays
+    in them are unpickled as read-only views into the row read rather than copied again. Keys are indexed by their
+    string form, so they can be listed by prefix like a `SortedKeyDict`.
+
+    Resources (including Blobs, e.g. run results, whose status is updated after they're put) are kept in memory
+    as live objects, as are values which can't be stored on disk (Ray ObjectRefs, or values which fail to pickle),
+    and are lost when the process exits. The rest persist in ``path``, so a
+    DiskDict opened on the same path later (e.g. after a restart) sees them. Like a spilled `TieredDict` value, a
+    value read from disk is a copy rather than the object put, so changes to it aren't saved unless it's put again.
+    """
+
+    # Upper bound on how much of the database file SQLite maps into memory for reads
+    MMAP_SIZE = 1 << 30  # 1 GB
+    # Max keys per query in bulk ops, under SQLite's limit on the number of query parameters
+    BATCH_SIZE = 500
+
+    def __init__(self, path: str):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={self.MMAP_SIZE}")
+        with self._conn:
+            # Keys are stored pickled, along with their `_entry` (string form and type name) for ordered scans
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key BLOB PRIMARY KEY, key_str TEXT NOT NULL, "
+                "key_type TEXT NOT NULL, value BLOB NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS kv_key_str ON kv (key_str, key_type)"
+            )
+
+        self._memory = {}  # Values which aren't stored on disk
+        self._lock = threading.RLock()
+
+        self.reads = 0
+        self.writes = 0
+        self.read_bytes = 0
+        self.written_bytes = 0
+
+    @staticmethod
+    def _encode_key(key) -> bytes:
+        return pickle.dumps(key, protocol=4)
+
+    def _serialize(self, key, value) -> Optional[bytes]:
+        """Serialize a value to store on disk, or return None if it should be kept in memory."""
+        from runhouse.resources.resource import Resource
+        from runhouse.servers.http.http_utils import pickle_oob
+
+        if isinstance(value, Resource) or not _is_spillable(value):
+            return None
+        try:
+            return b"".join(pickle_oob(value))
+        except Exception as e:
+            logger.debug(f"Keeping {key} in memory, as it can't be pickled: {e}")
+            return None
+
+    def _deserialize(self, data: bytes):
+        from runhouse.servers.http.http_utils import unpickle_oob
+
+        self.reads += 1
+        self.read_bytes += len(data)
+        return unpickle_oob(data)
+
+    def _rows(self, query: str, keys: List[Any]):
+        """Run a query with a ``{}`` placeholder for a list of encoded keys, in batches."""
+        rows = []
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            batch = [
+                self._encode_key(key) for key in keys[start : start + self.BATCH_SIZE]
+            ]
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(self._conn.execute(query.format(placeholders), batch))
+        return rows
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ?", (self._encode_key(key),)
+            ).fetchone()
+            if row is None:
+                raise KeyError(key)
+            return self._deserialize(row[0])
+
+    def __setitem__(self, key, value):
+        self.put_many({key: value})
+
+    def __delitem__(self, key):
+        with self._lock:
+            if key in self._memory:
+                del self._memory[key]
+                return
+            with self._conn:
+                deleted = self._conn.execute(
+                    "DELETE FROM kv WHERE key = ?", (self._encode_key(key),)
+                ).rowcount
+            if not deleted:
+                raise KeyError(key)
+
+    def __contains__(self, key):
+        # Overridden so checking for a key doesn't read its value
+        with self._lock:
+            if key in self._memory:
+                return True
+            return (
+                self._conn.execute(
+                    "SELECT 1 FROM kv WHERE key = ?", (self._encode_key(key),)
+                ).fetchone()
+                is not None
+            )
+
+    def __iter__(self):
+        with self._lock:
+            keys = list(self._memory)
+            keys.extend(
+                pickle.loads(key) for (key,) in self._conn.execute("SELECT key FROM kv")
+            )
+        return iter(keys)
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM kv").fetchone()
+            return count + len(self._memory)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path})"
+
+    def pop(self, key, default=_MISSING):
+        popped = self.pop_many([key])
+        if key in popped:
+            return popped[key]
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def get_many(self, keys: List[Any]) -> Dict[Any, Any]:
+        with self._lock:
+            found = {key: self._memory[key] for key in keys if key in self._memory}
+            rows = self._rows(
+                "SELECT key, value FROM kv WHERE key IN ({})",
+                [key for key in keys if key not in found],
+            )
+            found.update(
+                {pickle.loads(key): self._deserialize(value) for key, value in rows}
+            )
+            return found
+
+    def put_many(self, mapping: Dict[Any, Any]):
+        # Serialize outside of the lock, as that's the slow part for large values
+        serialized = {
+            key: self._serialize(key, value) for key, value in mapping.items()
+        }
+        rows = [
+            (self._encode_key(key), *_entry(key), data)
+            for key, data in serialized.items()
+            if data is not None
+        ]
+        with self._lock:
+            in_memory = [key for key, data in serialized.items() if data is None]
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO kv (key, key_str, key_type, value) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                if in_memory:
+                    self._rows("DELETE FROM kv WHERE key IN ({})", in_memory)
+            for key, data in serialized.items():
+                if data is None:
+                    self._memory[key] = mapping[key]
+                else:
+                    self._memory.pop(key, None)
+            self.writes += len(rows)
+            self.written_bytes += sum(len(row[-1]) for row in rows)
+
+    def pop_many(self, keys: List[Any]) -> Dict[Any, Any]:
+        with self._lock:
+            popped = self.get_many(keys)
+            for key in keys:
+                self._memory.pop(key, None)
+            with self._conn:
+                self._rows("DELETE FROM kv WHERE key IN ({})", keys)
+            return popped
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            with self._conn:
+                self._conn.execute("DELETE FROM kv")
+
+    def scan(
+        self,
+        prefix: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> List[Any]:
+        """Like `SortedKeyDict.scan`, using the index on the keys' string forms."""
+        prefix = prefix or ""
+        query = "SELECT key FROM kv WHERE key_str >= ? AND key_str < ?"
+        params = [prefix, prefix + _MAX_CHAR]
+        if cursor is not None:
+            query += " AND key_str > ?"
+            params.append(cursor)
+        query += " ORDER BY key_str, key_type"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            on_disk = [
+                pickle.loads(key) for (key,) in self._conn.execute(query, params)
+            ]
+            in_memory = scan_keys(list(self._memory), prefix, limit, cursor)
+        merged = heapq.merge(on_disk, in_memory, key=_entry)
+        return (
+            list(merged)
+            if limit is None
+            else [key for _, key in zip(range(limit), merged)]
+        )
+
+    def sizes(self) -> Dict[Any, int]:
+        """Size on disk of each value on disk, and estimated size in memory of each value kept in memory."""
+        with self._lock:
+            sizes = {
+                pickle.loads(key): size
+                for key, size in self._conn.execute("SELECT key, LENGTH(value) FROM kv")
+            }
+            sizes.update(
+                {key: estimate_size(value) for key, value in self._memory.items()}
+            )
+            return sizes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            disk_keys, disk_usage = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM kv"
+            ).fetchone()
+            return {
+                "path": str(self.path),
+                "disk_keys": disk_keys,
+                "disk_usage": disk_usage,
+                "memory_keys": len(self._memory),
+                "reads": self.reads,
+                "writes": self.writes,
+                "read_bytes": self.read_bytes,
+                "written_bytes": self.written_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,12 +1,19 @@
-from typing import Any, Optional, Union
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
 
 from runhouse import Cluster, Env
+from runhouse.resources.kvstores.disk_dict import DiskDict
+from runhouse.resources.kvstores.sharded_dict import ShardedDict
+from runhouse.resources.kvstores.sorted_key_dict import scan_keys, SortedKeyDict
+from runhouse.resources.kvstores.tiered_dict import estimate_size, TieredDict
 from runhouse.resources.module import Module
 
 
 class Kvstore(Module):
     RESOURCE_TYPE = "kvstore"
     DEFAULT_CACHE_FOLDER = ".cache/runhouse/kvstores"
+    BACKENDS = ["memory", "disk"]
 
     """Simple dict wrapper to act as key-value/object storage. Wrapping this in an actor allows us to
     access it across Ray processes and nodes, and even keep some things pinned to Python memory."""
@@ -17,16 +24,62 @@ class Kvstore(Module):
         system: Union[Cluster] = None,
         env: Optional[Env] = None,
         dryrun: bool = False,
+        memory_limit: Optional[int] = None,
+        spill_dir: Optional[str] = None,
+        num_shards: Optional[int] = None,
+        backend: str = "memory",
+        path: Optional[str] = None,
         **kwargs,
     ):
         """
         Runhouse KVStore object
 
+        If ``memory_limit`` (in bytes) is given, values beyond it are spilled to ``spill_dir`` on local disk,
+        least recently used first, and loaded back transparently when accessed (see :class:`TieredDict`).
+
+        If ``num_shards`` is given, the data is split across that many Ray actors by consistent hashing, so ops
+        on different keys don't all go through one process (see :class:`ShardedDict`).
+
+        Otherwise the data is held in a :class:`SortedKeyDict`, so keys can be listed by prefix and paginated
+        without going through every key.
+
+        With ``backend="disk"``, the data is instead stored in an embedded SQLite database at ``path`` on local
+        disk, for working sets bigger than memory, and persists across processes (see :class:`DiskDict`). This
+        can't be combined with ``memory_limit`` or ``num_shards``.
+
         .. note::
                 To build a KVStore, please use the factory method :func:`kvstore`.
         """
         super().__init__(name=name, system=system, env=env, dryrun=dryrun, **kwargs)
-        self.data = {}
+        if backend not in self.BACKENDS:
+            raise ValueError(
+                f"Invalid backend {backend}, must be one of {self.BACKENDS}"
+            )
+
+        if backend == "disk":
+            if memory_limit is not None or num_shards is not None:
+                raise ValueError(
+                    "memory_limit and num_shards are not supported with the disk backend"
+                )
+            path = path or str(
+                Path("~")
+                / self.DEFAULT_CACHE_FOLDER
+                / (name or uuid.uuid4().hex)
+                / "data.db"
+            )
+            self.data = DiskDict(path=path)
+        elif num_shards is not None:
+            self.data = ShardedDict(num_shards=num_shards, name=name)
+        elif memory_limit is not None:
+            spill_dir = spill_dir or str(
+                Path("~")
+                / self.DEFAULT_CACHE_FOLDER
+                / (name or uuid.uuid4().hex)
+                / "spill"
+            )
+            self.data = TieredDict(memory_limit=memory_limit, spill_dir=spill_dir)
+        else:
+            self.data = SortedKeyDict()
 
     def put(self, key: str, value: Any):
         self.data[key] = value
@@ -36,13 +89,45 @@ class Kvstore(Module):
             return self.data[key]
         return self.data.get(key, default)
 
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Get the values for many keys at once, omitting keys which aren't present."""
+        if isinstance(self.data, (ShardedDict, DiskDict)):
+            return self.data.get_many(keys)
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def put_many(self, mapping: Dict[str, Any]):
+        if isinstance(self.data, (ShardedDict, DiskDict)):
+            return self.data.put_many(mapping)
+        self.data.update(mapping)
+
+    def pop_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Pop many keys at once, returning the popped values and ignoring keys which aren't present."""
+        if isinstance(self.data, (ShardedDict, DiskDict)):
+            return self.data.pop_many(keys)
+        return {key: self.data.pop(key) for key in keys if key in self.data}
+
     def pop(self, key: str, *args):
         # We accept *args here to match the signature of dict.pop (throw an error if key is not found,
         # unless another arg is provided as a default)
         return self.data.pop(key, *args)
 
-    def keys(self):
-        return list(self.data.keys())
+    def keys(
+        self,
+        prefix: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ):
+        """List the keys in the store. If a ``prefix``, ``limit`` or ``cursor`` (the last key of the previous page)
+        is given, only the matching keys are listed, in sorted order."""
+        if prefix is None and limit is None and cursor is None:
+            return list(self.data.keys())
+        if isinstance(self.data, SortedKeyDict):
+            return self.data.scan(prefix=prefix, limit=limit, cursor=cursor)
+        if isinstance(self.data, (ShardedDict, DiskDict)):
+            return self.data.scan(prefix=prefix, limit=limit, cursor=cursor)
+        return scan_keys(
+            list(self.data.keys()), prefix=prefix, limit=limit, cursor=cursor
+        )
 
     def values(self):
         return list(self.data.values())
@@ -51,7 +136,28 @@ class Kvstore(Module):
         return list(self.data.items())
 
     def clear(self):
-        self.data = {}
+        self.data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of keys, plus memory and disk usage and spill/reload counters if the store is memory-bounded, the
+        number of keys in each shard if it's sharded, or disk usage and read/write counters if it's on disk."""
+        if isinstance(self.data, (TieredDict, ShardedDict, DiskDict)):
+            return {"keys": len(self.data), **self.data.stats()}
+        return {"keys": len(self.data)}
+
+    def sizes(self) -> Dict[str, int]:
+        """Estimated size in bytes of the value for each key (or its size on disk, if spilled or on disk)."""
+        if isinstance(self.data, (TieredDict, ShardedDict, DiskDict)):
+            return self.data.sizes()
+        return {key: estimate_size(value) for key, value in list(self.data.items())}
+
+    def add_shards(self, num_shards: int):
+        """Add shards to a sharded store, moving the keys the new shards now own over to them."""
+        if not isinstance(self.data, ShardedDict):
+            raise ValueError(
+                "Shards can only be added to a Kvstore created with num_shards"
+            )
+        self.data.add_shards(num_shards)
 
     def rename_key(self, old_key, new_key, *args):
         # We accept *args here to match the signature of dict.pop (throw an error if key is not found,
@@ -0,0 +1,195 @@
+import bisect
+import hashlib
+import heapq
+from collections.abc import MutableMapping
+from typing import Any, Dict, List, Optional
+
+import ray
+
+from runhouse.resources.kvstores.sorted_key_dict import _entry
+
+_MISSING = object()
+
+
+def _hash(value: str) -> int:
+    # Python's hash() of strings differs between processes, so it can't be used to route keys to shards
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class ShardedDict(MutableMapping):
+    """Dict split across Ray actor shards (each holding a plain Kvstore), so ops on different keys are spread over
+    processes rather than all going through one. Keys are assigned to shards by consistent hashing, with
+    ``VIRTUAL_NODES`` points on the hash ring per shard, so adding shards only moves the keys the new shards take
+    over. Bulk ops (``get_many``, ``put_many``, ``pop_many``) make one call to each shard, all at once.
+
+    If a name is given, the shards are named detached actors, so other processes on the cluster can use the same
+    store by creating a ShardedDict with the same name and number of shards. Shards should only be added from one
+    process, after which the others need to be recreated with the new number of shards."""
+
+    VIRTUAL_NODES = 100
+    NAMESPACE = "runhouse"
+
+    def __init__(self, num_shards: int, name: Optional[str] = None):
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        self.name = name
+        self.shards = []
+        self._ring = []  # Sorted hashes of the points on the ring
+        self._ring_shards = []  # Index of the shard owning each point
+        self.add_shards(num_shards, reshard=False)
+
+    def _create_shard(self, index: int):
+        from runhouse.resources.kvstores.kvstore import Kvstore
+
+        if self.name is None:
+            return ray.remote(Kvstore).remote()
+        return (
+            ray.remote(Kvstore)
+            .options(
+                name=f"kvstore_shard:{self.name}:{index}",
+                get_if_exists=True,
+                lifetime="detached",
+                namespace=self.NAMESPACE,
+            )
+            .remote()
+        )
+
+    def add_shards(self, num_shards: int, reshard: bool = True):
+        """Add shards to the ring, moving the keys they now own over to them from the existing shards."""
+        old_num_shards = len(self.shards)
+        for index in range(old_num_shards, old_num_shards + num_shards):
+            self.shards.append(self._create_shard(index))
+            for point in range(self.VIRTUAL_NODES):
+                point_hash = _hash(f"{self.name}:{index}:{point}")
+                position = bisect.bisect(self._ring, point_hash)
+                self._ring.insert(position, point_hash)
+                self._ring_shards.insert(position, index)
+
+        if reshard and old_num_shards:
+            shard_keys = ray.get(
+                [shard.keys.remote() for shard in self.shards[:old_num_shards]]
+            )
+            moves = []
+            for index, keys in enumerate(shard_keys):
+                moved = [key for key in keys if self.shard_for(key) != index]
+                if moved:
+                    moves.append(self.shards[index].pop_many.remote(moved))
+            for moved in ray.get(moves):
+                self._put_grouped(moved)
+
+    def shard_for(self, key) -> int:
+        """Index of the shard which owns a key: the first point on the ring at or after the key's hash."""
+        position = bisect.bisect(self._ring, _hash(str(key))) % len(self._ring)
+        return self._ring_shards[position]
+
+    def _group(self, keys) -> Dict[int, List[Any]]:
+        keys_for_shard = {}
+        for key in keys:
+            keys_for_shard.setdefault(self.shard_for(key), []).append(key)
+        return keys_for_shard
+
+    def _put_grouped(self, mapping: Dict[Any, Any]):
+        mapping_for_shard = {}
+        for key, value in mapping.items():
+            mapping_for_shard.setdefault(self.shard_for(key), {})[key] = value
+        ray.get(
+            [
+                self.shards[index].put_many.remote(shard_mapping)
+                for index, shard_mapping in mapping_for_shard.items()
+            ]
+        )
+
+    def _fan_out(self, method: str, *args) -> list:
+        return ray.get([getattr(shard, method).remote(*args) for shard in self.shards])
+
+    def __getitem__(self, key):
+        found = ray.get(self.shards[self.shard_for(key)].get_many.remote([key]))
+        if key not in found:
+            raise KeyError(key)
+        return found[key]
+
+    def __setitem__(self, key, value):
+        ray.get(self.shards[self.shard_for(key)].put.remote(key, value))
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __contains__(self, key):
+        return ray.get(self.shards[self.shard_for(key)].contains.remote(key))
+
+    def __iter__(self):
+        return iter([key for keys in self._fan_out("keys") for key in keys])
+
+    def __len__(self):
+        return sum(stats["keys"] for stats in self._fan_out("stats"))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({len(self.shards)} shards)"
+
+    def get(self, key, default=None):
+        return ray.get(self.shards[self.shard_for(key)].get.remote(key, default))
+
+    def pop(self, key, default=_MISSING):
+        popped = ray.get(self.shards[self.shard_for(key)].pop_many.remote([key]))
+        if key in popped:
+            return popped[key]
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def get_many(self, keys: List[Any]) -> Dict[Any, Any]:
+        found = {}
+        for shard_found in ray.get(
+            [
+                self.shards[index].get_many.remote(shard_keys)
+                for index, shard_keys in self._group(keys).items()
+            ]
+        ):
+            found.update(shard_found)
+        return found
+
+    def put_many(self, mapping: Dict[Any, Any]):
+        self._put_grouped(mapping)
+
+    def pop_many(self, keys: List[Any]) -> Dict[Any, Any]:
+        popped = {}
+        for shard_popped in ray.get(
+            [
+                self.shards[index].pop_many.remote(shard_keys)
+                for index, shard_keys in self._group(keys).items()
+            ]
+        ):
+            popped.update(shard_popped)
+        return popped
+
+    def scan(
+        self,
+        prefix: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> List[Any]:
+        """Like `SortedKeyDict.scan`, merging the (already sorted) page from each shard."""
+        pages = self._fan_out("keys", prefix, limit, cursor)
+        merged = heapq.merge(*pages, key=_entry)
+        if limit is not None:
+            return [key for _, key in zip(range(limit), merged)]
+        return list(merged)
+
+    def items(self):
+        return [item for items in self._fan_out("items") for item in items]
+
+    def values(self):
+        return [value for values in self._fan_out("values") for value in values]
+
+    def clear(self):
+        self._fan_out("clear")
+
+    def sizes(self) -> Dict[Any, int]:
+        sizes = {}
+        for shard_sizes in self._fan_out("sizes"):
+            sizes.update(shard_sizes)
+        return sizes
+
+    def stats(self) -> Dict[str, Any]:
+        shard_keys = [stats["keys"] for stats in self._fan_out("stats")]
+        return {"shards": len(self.shards), "shard_keys": shard_keys}
@@ -0,0 +1,124 @@
+import bisect
+import heapq
+from typing import Any, Iterable, List, Optional
+
+# Sorts after any character, for finding the end of a prefix's range of keys
+_MAX_CHAR = chr(0x10FFFF)
+
+
+def _entry(key):
+    # Keys are sorted by their string form (with the type name breaking ties, e.g. between 1 and "1") so keys of
+    # different types can be listed together
+    return (key, "") if isinstance(key, str) else (str(key), type(key).__name__)
+
+
+class SortedKeyDict(dict):
+    """Dict which can also list its keys in sorted order (by their string form) starting from a prefix and cursor,
+    in time proportional to the number of keys listed rather than the size of the dict. The sorted index is
+    built on the first `scan`, and kept up to date on every change from then on."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sorted = None  # Sorted entries for the keys
+        self._non_str_keys = {}  # Entry -> key, for keys which aren't strings
+
+    def __reduce__(self):
+        # By default unpickling sets the items before the attributes, so rebuild the index lazily instead
+        return type(self), (dict(self),)
+
+    def _index_add(self, key):
+        if self._sorted is None:
+            return
+        entry = _entry(key)
+        position = bisect.bisect_left(self._sorted, entry)
+        if position == len(self._sorted) or self._sorted[position] != entry:
+            self._sorted.insert(position, entry)
+            if entry[1]:
+                self._non_str_keys[entry] = key
+
+    def _index_remove(self, key):
+        if self._sorted is None:
+            return
+        entry = _entry(key)
+        position = bisect.bisect_left(self._sorted, entry)
+        if position < len(self._sorted) and self._sorted[position] == entry:
+            del self._sorted[position]
+            self._non_str_keys.pop(entry, None)
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._index_add(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._index_remove(key)
+
+    def pop(self, key, *args):
+        if key in self:
+            self._index_remove(key)
+        return super().pop(key, *args)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._index_remove(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._index_add(key)
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        super().clear()
+        if self._sorted is not None:
+            self._sorted = []
+            self._non_str_keys = {}
+
+    def scan(
+        self,
+        prefix: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> List[Any]:
+        """List keys in sorted order, only those starting with ``prefix`` and after ``cursor`` (the last key from
+        the previous page, to list the next page), up to ``limit`` keys."""
+        if self._sorted is None:
+            self._sorted = sorted(_entry(key) for key in self)
+            self._non_str_keys = {
+                _entry(key): key for key in self if not isinstance(key, str)
+            }
+
+        prefix = prefix or ""
+        start = bisect.bisect_left(self._sorted, (prefix, ""))
+        if cursor is not None:
+            start = max(start, bisect.bisect_right(self._sorted, (cursor, _MAX_CHAR)))
+        end = bisect.bisect_left(self._sorted, (prefix + _MAX_CHAR, ""))
+        if limit is not None:
+            end = min(end, start + limit)
+        return [
+            entry[0] if not entry[1] else self._non_str_keys[entry]
+            for entry in self._sorted[start:end]
+        ]
+
+
+def scan_keys(
+    keys: Iterable[Any],
+    prefix: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> List[Any]:
+    """Like `SortedKeyDict.scan`, for any keys (e.g. of stores without a sorted index), by sorting them."""
+    prefix = prefix or ""
+    matching = (
+        key
+        for key in keys
+        if str(key).startswith(prefix) and (cursor is None or str(key) > cursor)
+    )
+    if limit is None:
+        return sorted(matching, key=_entry)
+    return heapq.nsmallest(limit, matching, key=_entry)
@@ -0,0 +1,246 @@
+import hashlib
+import logging
+import shutil
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(obj: Any, depth: int = 2) -> int:
+    """Rough estimate of the memory held by ``obj`` in bytes. Uses ``nbytes`` for arrays and buffers, pandas'
+    own accounting for DataFrames, and otherwise looks ``depth`` levels into containers and object attributes
+    (e.g. the data of a Blob), extrapolating from a sample for large containers."""
+    if isinstance(obj, (bytes, bytearray, str)):
+        return sys.getsizeof(obj)
+    if isinstance(obj, memoryview):
+        return obj.nbytes
+
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+
+    memory_usage = getattr(obj, "memory_usage", None)
+    if callable(memory_usage) and type(obj).__module__.startswith("pandas"):
+        try:
+            usage = memory_usage(deep=True)
+            return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+        except Exception:
+            pass
+
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+
+    sample_size = 100
+    if isinstance(obj, dict):
+        items = obj.items()
+        if len(obj) <= sample_size:
+            return size + sum(
+                estimate_size(k, depth - 1) + estimate_size(v, depth - 1)
+                for k, v in items
+            )
+        sample = [kv for _, kv in zip(range(sample_size), items)]
+        per_item = sum(
+            estimate_size(k, depth - 1) + estimate_size(v, depth - 1) for k, v in sample
+        ) / len(sample)
+        return size + int(per_item * len(obj))
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        if len(obj) <= sample_size:
+            return size + sum(estimate_size(item, depth - 1) for item in obj)
+        sample = [item for _, item in zip(range(sample_size), obj)]
+        per_item = sum(estimate_size(item, depth - 1) for item in sample) / len(sample)
+        return size + int(per_item * len(obj))
+
+    attrs = getattr(obj, "__dict__", None)
+    if isinstance(attrs, dict):
+        return size + estimate_size(attrs, depth)
+    return size
+
+
+def _is_spillable(value: Any) -> bool:
+    """Resources (e.g. Modules) in the object store may hold live state like threads, open connections or
+    GPU memory, so only plain values and Blobs (e.g. persisted results) are spilled. Ray ObjectRefs (which the
+    object store keeps wrapped in a list) are tiny, and pickling them outside of Ray would leak their objects."""
+    import ray
+
+    from runhouse.resources.blobs import Blob
+    from runhouse.resources.resource import Resource
+
+    if isinstance(value, list) and len(value) == 1:
+        value = value[0]
+    if isinstance(value, ray.ObjectRef):
+        return False
+    return not isinstance(value, Resource) or type(value) is Blob
+
+
+class TieredDict(MutableMapping):
+    """Dict which keeps its values in memory up to ``memory_limit`` bytes (by `estimate_size`), and beyond that
+    spills the least recently used values to files in ``spill_dir``. Spilled values are loaded back into memory
+    transparently when they're accessed. Values which can't be spilled (Resources other than Blobs, or values
+    which fail to pickle) always stay in memory, even if that puts it over budget.
+
+    Note that spilling only drops the dict's own reference to a value, so a value which is still referenced
+    elsewhere isn't freed, and after a reload is a copy rather than the same object."""
+
+    def __init__(self, memory_limit: int, spill_dir: str):
+        self.memory_limit = memory_limit
+        self.spill_dir = Path(spill_dir).expanduser()
+        # Spill files left behind by a previous process can't be loaded, as the index of them lived in its memory
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+
+        self._memory = OrderedDict()  # Least recently used first
+        self._sizes = {}  # Estimated size of each value in memory
+        self._spilled = {}  # Key -> (path, size on disk)
+        self._unspillable = set()
+        self._lock = threading.RLock()
+
+        self.memory_usage = 0
+        self.disk_usage = 0
+        self.spills = 0
+        self.reloads = 0
+        self.spilled_bytes = 0
+        self.reloaded_bytes = 0
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            if key not in self._spilled:
+                raise KeyError(key)
+            value = self._reload(key)
+            self._insert(key, value)
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._discard(key)
+            self._insert(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            if key not in self:
+                raise KeyError(key)
+            self._discard(key)
+
+    def __contains__(self, key):
+        # Overridden so checking for a spilled key doesn't load it back from disk
+        return key in self._memory or key in self._spilled
+
+    def __iter__(self):
+        with self._lock:
+            keys = list(self._memory) + list(self._spilled)
+        return iter(keys)
+
+    def __len__(self):
+        return len(self._memory) + len(self._spilled)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({len(self._memory)} in memory, {len(self._spilled)} on disk)"
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._sizes.clear()
+            self._spilled.clear()
+            self._unspillable.clear()
+            self.memory_usage = 0
+            self.disk_usage = 0
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+
+    def sizes(self) -> Dict[str, int]:
+        """Estimated size in memory of each in-memory value, and size on disk of each spilled value."""
+        with self._lock:
+            sizes = dict(self._sizes)
+            sizes.update({key: size for key, (_, size) in self._spilled.items()})
+            return sizes
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        with self._lock:
+            return {
+                "memory_limit": self.memory_limit,
+                "memory_usage": self.memory_usage,
+                "memory_keys": len(self._memory),
+                "disk_usage": self.disk_usage,
+                "disk_keys": len(self._spilled),
+                "spills": self.spills,
+                "reloads": self.reloads,
+                "spilled_bytes": self.spilled_bytes,
+                "reloaded_bytes": self.reloaded_bytes,
+            }
+
+    def _insert(self, key, value):
+        size = estimate_size(value)
+        self._memory[key] = value
+        self._sizes[key] = size
+        self.memory_usage += size
+        self._evict(keep=key)
+
+    def _discard(self, key):
+        if key in self._memory:
+            del self._memory[key]
+            self.memory_usage -= self._sizes.pop(key)
+            self._unspillable.discard(key)
+        elif key in self._spilled:
+            path, size = self._spilled.pop(key)
+            self.disk_usage -= size
+            if path.exists():
+                path.unlink()
+
+    def _evict(self, keep):
+        """Spill least recently used values until memory usage is within the limit, never spilling ``keep``
+        (the value just put or accessed)."""
+        if self.memory_usage <= self.memory_limit:
+            return
+        for key in list(self._memory):
+            if self.memory_usage <= self.memory_limit:
+                break
+            if key == keep or key in self._unspillable:
+                continue
+            if not _is_spillable(self._memory[key]):
+                self._unspillable.add(key)
+                continue
+            self._spill(key)
+
+    def _spill(self, key):
+        from runhouse.servers.http.http_utils import pickle_oob
+
+        value = self._memory[key]
+        try:
+            parts = pickle_oob(value)
+        except Exception as e:
+            logger.warning(f"Could not spill {key} to disk, keeping it in memory: {e}")
+            self._unspillable.add(key)
+            return
+
+        path = self.spill_dir / hashlib.sha256(str(key).encode()).hexdigest()
+        with open(path, "wb") as f:
+            f.writelines(parts)
+        size = sum(memoryview(part).nbytes for part in parts)
+
+        del self._memory[key]
+        self.memory_usage -= self._sizes.pop(key)
+        self._spilled[key] = (path, size)
+        self.disk_usage += size
+        self.spills += 1
+        self.spilled_bytes += size
+
+    def _reload(self, key):
+        from runhouse.servers.http.http_utils import unpickle_oob
+
+        path, size = self._spilled.pop(key)
+        data = bytearray(size)
+        with open(path, "rb") as f:
+            f.readinto(data)
+        path.unlink()
+        self.disk_usage -= size
+        self.reloads += 1
+        self.reloaded_bytes += size
+        return unpickle_oob(data)
@@ -5,7 +5,6 @@ import inspect
 import logging
 import os
 import sys
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Callable, List, Optional, Tuple, Type, Union
 
@@ -248,24 +247,32 @@ class Module(Resource):
 
     @staticmethod
     def _get_obj_from_pointers(module_path, module_name, obj_name, reload=True):
-        """Helper method to load a class or function from a module path, module name, and class name."""
+        """Helper method to load a class or function from a module path, module name, and class name.
+
+        Imported modules are cached in the obj_store. With ``reload=True``, a cached module is only reloaded if
+        its source file has changed since it was imported (e.g. because the code was redeployed)."""
+        module = obj_store.imported_modules.get(module_name)
+        if module is not None:
+            stamp = obj_store.imported_module_stamps.get(module_name)
+            if not reload or _source_stamp(module) == stamp:
+                return getattr(module, obj_name)
+
         if module_path:
             abs_path = str((Path.home() / module_path).expanduser().resolve())
-            sys.path.insert(0, abs_path)
-            logger.debug(f"Appending {module_path} to sys.path")
+            if abs_path not in sys.path:
+                sys.path.insert(0, abs_path)
+                logger.debug(f"Appending {module_path} to sys.path")
 
-        if module_name in obj_store.imported_modules and reload:
+        if module is None:
+            logger.debug(f"Importing module {module_name}")
+            module = importlib.import_module(module_name)
+        else:
             importlib.invalidate_caches()
-            obj_store.imported_modules[module_name] = importlib.reload(
-                obj_store.imported_modules[module_name]
-            )
+            module = importlib.reload(module)
             logger.debug(f"Reloaded module {module_name}")
-        else:
-            logger.debug(f"Importing module {module_name}")
-            obj_store.imported_modules[module_name] = importlib.import_module(
-                module_name
-            )
-        return getattr(obj_store.imported_modules[module_name], obj_name)
+        obj_store.imported_modules[module_name] = module
+        obj_store.imported_module_stamps[module_name] = _source_stamp(module)
+        return getattr(module, obj_name)
 
     def to(
         self,
@@ -433,36 +440,34 @@ class Module(Resource):
                 if local_default_true and kwargs.pop("local", True):
                     return attr(*args, **kwargs)
 
-                # If the method is a coroutine, we need to wrap it in a function so we can await it
+                # If the method is a coroutine, call it with the async client so it can be awaited
                 if (
                     inspect.iscoroutinefunction(attr)
                     or inspect.isasyncgenfunction(attr)
                     or is_async
                 ):
-
-                    def call_wrapper():
-                        return system.call(
-                            name,
-                            item,
-                            *args,
-                            **kwargs,
-                        )
-
                     if inspect.isasyncgenfunction(attr) or is_async_gen:
 
                         async def async_gen():
-                            for res in call_wrapper():
+                            results = await system.call_async(
+                                name,
+                                item,
+                                *args,
+                                **kwargs,
+                            )
+                            async for res in results:
                                 yield res
 
                         return async_gen()
 
-                    _executor = ThreadPoolExecutor(1)
-
-                    async def async_call():
-                        return await loop.run_in_executor(_executor, call_wrapper)
-
-                    loop = asyncio.get_event_loop()
-                    return asyncio.create_task(async_call())
+                    return asyncio.create_task(
+                        system.call_async(
+                            name,
+                            item,
+                            *args,
+                            **kwargs,
+                        )
+                    )
 
                 return system.call(
                     name,
@@ -489,6 +494,18 @@ class Module(Resource):
                     **kwargs,
                 )
 
+            def submit(self, *args, stream_logs=False, run_name=None, **kwargs):
+                """Call the method in the cluster's shared thread pool, and return a future for its result right
+                away."""
+                return system.submit(
+                    name,
+                    item,
+                    *args,
+                    stream_logs=stream_logs,
+                    run_name=run_name,
+                    **kwargs,
+                )
+
             def local(self, *args, **kwargs):
                 """Allows us to call a function with fn.local(*args) instead of fn(*args, local=True)"""
                 return self.__call__(
@@ -659,37 +676,20 @@ class Module(Resource):
         system = super().__getattribute__("_system")
         name = super().__getattribute__("_name")
 
-        def call_wrapper():
-            if not key:
-                return system.get(name, remote=remote, stream_logs=stream_logs)
-
-            if isinstance(system, Cluster) and name and system.on_this_cluster():
-                obj_store_obj = obj_store.get(name, check_other_envs=True)
-                if obj_store_obj:
-                    return obj_store_obj.__getattribute__(key)
-                else:
-                    return self.__getattribute__(key)
-            return system.call(name, key, remote=remote, stream_logs=stream_logs)
-
-        if (
-            key
-            and hasattr(self, key)
-            and inspect.isasyncgenfunction(super().__getattribute__(key))
-        ):
-
-            async def async_gen():
-                for res in call_wrapper():
-                    yield res
-
-            return async_gen()
-
-        _executor = ThreadPoolExecutor(1)
+        if not key:
+            return await system.get_async(name, remote=remote, stream_logs=stream_logs)
 
-        async def async_call():
-            return await loop.run_in_executor(_executor, call_wrapper)
+        if isinstance(system, Cluster) and name and system.on_this_cluster():
+            obj_store_obj = obj_store.get(name, check_other_envs=True)
+            if obj_store_obj:
+                return obj_store_obj.__getattribute__(key)
+            else:
+                return self.__getattribute__(key)
 
-        loop = asyncio.get_event_loop()
-        return await asyncio.create_task(async_call())
+        # For async generator methods, this is an async generator of the results
+        return await system.call_async(
+            name, key, remote=remote, stream_logs=stream_logs
+        )
 
     async def set_async(self, key: str, value):
         """Async version of property setter.
@@ -706,21 +706,12 @@ class Module(Resource):
         ):
             return super().__setattr__(key, value)
 
-        def call_wrapper():
-            return self._system.call(
-                module_name=self._name,
-                method_name=key,
-                new_value=value,
-                stream_logs=False,
-            )
-
-        _executor = ThreadPoolExecutor(1)
-
-        async def async_call():
-            return await loop.run_in_executor(_executor, call_wrapper)
-
-        loop = asyncio.get_event_loop()
-        return await asyncio.create_task(async_call())
+        return await self._system.call_async(
+            module_name=self._name,
+            method_name=key,
+            new_value=value,
+            stream_logs=False,
+        )
 
     def resolve(self):
         """Specify that the module should resolve to a particular state when passed into a remote method. This is
@@ -909,6 +900,18 @@ class Module(Resource):
     #     full_name = func_name
 
 
+def _source_stamp(module):
+    """Return the modification time and size of a module's source file, used to tell whether it needs reloading."""
+    path = getattr(module, "__file__", None)
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
 def _module_subclass_factory(cls, pointers, signature=None):
     def __init__(
         self,
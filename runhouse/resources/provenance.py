@@ -143,7 +143,7 @@ class Run(Resource):
             self.status = RunStatus.ERROR
             self.error = exc_value
             self.traceback = exc_traceback
-        else:
+        elif self.status != RunStatus.CANCELLED:
             self.status = RunStatus.COMPLETED
 
         # Pop the current Run from the stack of active Runs
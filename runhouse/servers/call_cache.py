@@ -0,0 +1,212 @@
+import hashlib
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CallCache:
+    """Cache of the results of calls to deterministic functions (Functions created with ``cache=True``, or calls
+    given a ``cache_key``), so calling one again with the same args returns the stored result rather than running
+    it again. Results are held in the servlet's object store under ``CACHE_PREFIX``, keyed by a hash of the
+    function's identity (its pointers and source, so editing the function invalidates its results) and of the
+    pickled args, or the call's ``cache_key`` in place of the args.
+
+    Results older than ``max_age`` seconds are treated as misses, and the least recently used results are evicted
+    to stay within ``max_count`` results and ``max_bytes`` (by `estimate_size`). Results bigger than ``max_bytes``
+    on their own aren't cached."""
+
+    CACHE_PREFIX = "_rh_call_cache:"
+    DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+
+    def __init__(self):
+        self.env_name = None
+        self.max_age = None
+        self.max_count = None
+        self.max_bytes = self.DEFAULT_MAX_BYTES
+        # Key -> (time stored, size) for each cached result, least recently used first
+        self.entries = OrderedDict()
+        # (module name, method name) -> (module, identity hash), so the source is only hashed once per module put
+        self._identities = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def configure(
+        self,
+        env_name: str,
+        max_age: Optional[int] = None,
+        max_count: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        """Set up the cache for a servlet, deleting any results cached by a previous process (e.g. restored from a
+        snapshot), as they aren't tracked for eviction."""
+        from runhouse.globals import obj_store
+
+        self.env_name = env_name
+        self.max_age = max_age
+        self.max_count = max_count
+        self.max_bytes = max_bytes if max_bytes is not None else self.DEFAULT_MAX_BYTES
+
+        try:
+            leftover = [
+                key
+                for key in obj_store.keys(prefix=self._prefix())
+                if obj_store.get_env(key) == env_name
+            ]
+            if leftover:
+                obj_store.delete_many(leftover, check_other_envs=False)
+        except Exception as e:
+            logger.warning(f"Failed to clear results cached by a previous process: {e}")
+
+    def _prefix(self, module_name: Optional[str] = None) -> str:
+        prefix = f"{self.CACHE_PREFIX}{self.env_name}:"
+        return f"{prefix}{module_name}:" if module_name else prefix
+
+    def _identity(self, module_name: str, module: Any, method_name: str) -> str:
+        cached = self._identities.get((module_name, method_name))
+        if cached and cached[0] is module:
+            return cached[1]
+
+        fn_pointers = getattr(module, "fn_pointers", None)
+        if fn_pointers and method_name == "call":
+            fn = module._get_obj_from_pointers(*fn_pointers)
+        else:
+            fn = getattr(module, method_name)
+        try:
+            source = inspect.getsource(fn).encode()
+        except (OSError, TypeError):
+            # E.g. functions defined in a notebook or with exec, for which the bytecode has to do
+            code = getattr(fn, "__code__", None)
+            source = code.co_code if code else b""
+
+        identity = hashlib.sha256(
+            repr((module_name, method_name, fn_pointers)).encode() + source
+        ).hexdigest()
+        self._identities[(module_name, method_name)] = (module, identity)
+        return identity
+
+    def key_for(
+        self,
+        module_name: str,
+        module: Any,
+        method_name: str,
+        data: Any,
+        cache_key: Optional[str] = None,
+    ) -> str:
+        """Key of the cached result for a call, where ``data`` is the call's pickled args as sent by the client."""
+        digest = hashlib.sha256(
+            self._identity(module_name, module, method_name).encode()
+        )
+        if cache_key is not None:
+            digest.update(b"cache_key:" + str(cache_key).encode())
+        elif isinstance(data, str):
+            digest.update(data.encode())
+        elif data is not None:
+            digest.update(data)
+        return self._prefix(module_name) + digest.hexdigest()
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        """Return whether there's a cached result for the key, and the result if so."""
+        from runhouse.globals import obj_store
+
+        with self._lock:
+            entry = self.entries.get(key)
+            expired = (
+                entry is not None
+                and self.max_age is not None
+                and time.time() - entry[0] > self.max_age
+            )
+            if entry is None or expired:
+                self.misses += 1
+                if expired:
+                    self.entries.pop(key)
+                    self.expirations += 1
+            else:
+                self.entries.move_to_end(key)
+
+        if entry is None:
+            return False, None
+        if expired:
+            obj_store.delete_many([key], check_other_envs=False)
+            return False, None
+
+        try:
+            value = obj_store.get(key, default=KeyError, check_other_envs=False)
+        except KeyError:
+            # Deleted from the object store by the user
+            with self._lock:
+                self.entries.pop(key, None)
+                self.misses += 1
+            return False, None
+
+        with self._lock:
+            self.hits += 1
+        return True, value
+
+    def store(self, key: str, value: Any):
+        from runhouse.globals import obj_store
+        from runhouse.resources.kvstores.tiered_dict import estimate_size
+
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        obj_store.put(key, value)
+
+        evicted = []
+        with self._lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time(), size)
+            self.stores += 1
+            total_bytes = sum(size for _, size in self.entries.values())
+            while len(self.entries) > 1 and (
+                (self.max_count is not None and len(self.entries) > self.max_count)
+                or total_bytes > self.max_bytes
+            ):
+                evicted_key, (_, evicted_size) = self.entries.popitem(last=False)
+                evicted.append(evicted_key)
+                total_bytes -= evicted_size
+            self.evictions += len(evicted)
+
+        if evicted:
+            obj_store.delete_many(evicted, check_other_envs=False)
+
+    def invalidate(self, module_name: Optional[str] = None) -> int:
+        """Drop the cached results of a module's (e.g. Function's) calls, or of all calls if no module is given.
+        Returns the number of results dropped."""
+        from runhouse.globals import obj_store
+
+        prefix = self._prefix(module_name)
+        with self._lock:
+            keys = [key for key in self.entries if key.startswith(prefix)]
+            for key in keys:
+                self.entries.pop(key)
+            self.invalidations += len(keys)
+        if keys:
+            obj_store.delete_many(keys, check_other_envs=False)
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": sum(size for _, size in self.entries.values()),
+                "max_age": self.max_age,
+                "max_count": self.max_count,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -1,7 +1,11 @@
+import asyncio
 import hashlib
 import json
 import logging
-from typing import Union
+import threading
+import time
+from collections import deque, OrderedDict
+from typing import Callable, Optional, Union
 
 import ray
 import requests
@@ -15,6 +19,20 @@ logger = logging.getLogger(__name__)
 class AuthCache:
     # Maps a user's token to all the resources they have access to
     CACHE = {}
+    # Env servlets which keep their own local copy of the cache, and need to be told when a user's resources change
+    SERVLETS = set()
+    # When each user's resources were last loaded from Den, which they're reloaded from once older than the TTL
+    LOADED_AT = {}
+    TTL = 60
+    # Number of recent invalidations kept for processes which aren't servlets (e.g. the API server workers) to catch
+    # up on, as (version, token hash), before they have to drop their whole local cache
+    MAX_INVALIDATIONS = 10000
+    # How long ``invalidations_since`` waits for an invalidation before returning
+    WAIT_TIMEOUT = 30
+    VERSION = 0
+    INVALIDATIONS = deque(maxlen=MAX_INVALIDATIONS)
+    _loop = None
+    _waiters = []
 
     @classmethod
     def get_user_resources(cls, token_hash: str) -> dict:
@@ -29,8 +47,23 @@ class AuthCache:
         return resources.get(resource_uri)
 
     @classmethod
-    def add_user(cls, token):
+    def register_servlet(cls, servlet_name: str):
+        cls.SERVLETS.add(servlet_name)
+
+    @classmethod
+    def get_or_add_user(cls, token) -> dict:
+        """Get a user's resources from the cache, only loading them from Den if they aren't cached or have
+        expired"""
+        token_hash = hash_token(token)
+        loaded_at = cls.LOADED_AT.get(token_hash)
+        if token_hash in cls.CACHE and time.monotonic() < loaded_at + cls.TTL:
+            return cls.CACHE[token_hash]
+        return cls.add_user(token)
+
+    @classmethod
+    def add_user(cls, token) -> dict:
         """Refresh the server cache with the latest resources and access levels for a particular user"""
+        token_hash = hash_token(token)
         resp = requests.get(
             f"{rns_client.api_server_url}/resource",
             headers={"Authorization": f"Bearer {token}"},
@@ -39,14 +72,166 @@ class AuthCache:
             logger.error(
                 f"Failed to load resources for user: {load_resp_content(resp)}"
             )
-            return
+            return cls.get_user_resources(token_hash)
 
         resp_data = json.loads(resp.content)
         all_resources: dict = {
             resource["name"]: resource["access_type"] for resource in resp_data["data"]
         }
         # Update server cache with a user's resources and access type
-        cls.CACHE[hash_token(token)] = all_resources
+        cls.CACHE[token_hash] = all_resources
+        cls.LOADED_AT[token_hash] = time.monotonic()
+        cls._invalidate_servlets(token_hash)
+        return all_resources
+
+    @classmethod
+    def _invalidate_servlets(cls, token_hash: str):
+        cls._record_invalidation(token_hash)
+
+        invalidations = []
+        for servlet_name in list(cls.SERVLETS):
+            try:
+                servlet = ray.get_actor(servlet_name, namespace="runhouse")
+            except ValueError:
+                # Servlet no longer exists
+                cls.SERVLETS.discard(servlet_name)
+                continue
+            invalidations.append(servlet.invalidate_auth_cache.remote(token_hash))
+
+        # Wait for the servlets, so that once a refresh returns no servlet will use the user's old resources
+        for invalidation in invalidations:
+            try:
+                ray.get(invalidation)
+            except Exception as e:
+                logger.warning(f"Failed to invalidate servlet auth cache: {e}")
+
+    @classmethod
+    def _record_invalidation(cls, token_hash: str):
+        cls.VERSION += 1
+        cls.INVALIDATIONS.append((cls.VERSION, token_hash))
+        if cls._loop is not None:
+            cls._loop.call_soon_threadsafe(cls._wake_waiters)
+
+    @classmethod
+    def _wake_waiters(cls):
+        for waiter in cls._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @classmethod
+    async def invalidations_since(cls, version: Optional[int], timeout: float = None):
+        """Wait until a user's resources change after ``version``, then return the current version and the hashes
+        of the tokens whose resources changed since ``version``. If those are no longer available (or no version is
+        given), returns None in place of the token hashes, and the whole local cache should be dropped."""
+        if version == cls.VERSION:
+            cls._loop = asyncio.get_running_loop()
+            waiter = cls._loop.create_future()
+            cls._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout or cls.WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                cls._waiters.remove(waiter)
+
+        if (
+            version is None
+            or version > cls.VERSION
+            or (cls.INVALIDATIONS and cls.INVALIDATIONS[0][0] > version + 1)
+        ):
+            return cls.VERSION, None
+
+        return cls.VERSION, [
+            token_hash
+            for invalidation_version, token_hash in cls.INVALIDATIONS
+            if invalidation_version > version
+        ]
+
+
+class LocalAuthCache:
+    """Per-process LRU cache of users' resources and access levels, in front of the shared ``AuthCache`` actor, so
+    that checking access on every authenticated call doesn't cost an actor round trip. Entries expire after ``ttl``
+    seconds, or after ``negative_ttl`` seconds if the user has no resources (e.g. for an invalid token). Entries
+    looked up shortly before they expire are reloaded in the background."""
+
+    TTL = 60
+    NEGATIVE_TTL = 10
+    MAX_SIZE = 1024
+    # Fraction of an entry's TTL after which looking it up triggers a background reload
+    REFRESH_AFTER = 0.8
+
+    def __init__(
+        self,
+        ttl: float = TTL,
+        negative_ttl: float = NEGATIVE_TTL,
+        max_size: int = MAX_SIZE,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        # Maps a token hash to its resources, the time they were loaded, and when they expire
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        # Bumped on invalidation, so loads which started before it don't store stale resources
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, token_hash: str, load: Callable[[], Optional[dict]]) -> dict:
+        """Get a user's resources, calling ``load`` to fetch them if they aren't cached or have expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None or now >= entry[2]:
+                entry = None
+            else:
+                self._entries.move_to_end(token_hash)
+                resources, loaded_at, expires_at = entry
+                refresh = (
+                    now >= loaded_at + (expires_at - loaded_at) * self.REFRESH_AFTER
+                    and token_hash not in self._refreshing
+                )
+                if refresh:
+                    self._refreshing.add(token_hash)
+
+        if entry is None:
+            return self._load(token_hash, load)
+
+        if refresh:
+            threading.Thread(
+                target=self._refresh, args=(token_hash, load), daemon=True
+            ).start()
+        return resources
+
+    def invalidate(self, token_hash: Optional[str] = None):
+        """Drop a user's cached resources, or all cached resources if no token hash is given."""
+        with self._lock:
+            self._generation += 1
+            if token_hash is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(token_hash, None)
+
+    def _load(self, token_hash: str, load: Callable[[], Optional[dict]]) -> dict:
+        generation = self._generation
+        resources = load() or {}
+        now = time.monotonic()
+        ttl = self.ttl if resources else self.negative_ttl
+        with self._lock:
+            if generation == self._generation:
+                self._entries[token_hash] = (resources, now, now + ttl)
+                self._entries.move_to_end(token_hash)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return resources
+
+    def _refresh(self, token_hash: str, load: Callable[[], Optional[dict]]):
+        try:
+            self._load(token_hash, load)
+        except Exception as e:
+            logger.warning(f"Failed to refresh cached resources for user: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(token_hash)
 
 
 def verify_cluster_access(
@@ -59,19 +244,12 @@ def verify_cluster_access(
 
     token_hash = hash_token(token)
 
-    # Check if user already has saved resources in cache
-    cached_resources: dict = obj_store.user_resources(token_hash)
+    # Loads the user's resources from Den if they aren't already cached in this process
+    cached_resources: dict = obj_store.user_resources(token_hash, token=token)
 
     # e.g. {"/jlewitt1/bert-preproc": "read"}
     cluster_access_type = cached_resources.get(cluster_uri)
 
-    if cluster_access_type is None:
-        # Reload from cache and check again
-        update_cache_for_user(token)
-
-        cached_resources: dict = obj_store.user_resources(token_hash)
-        cluster_access_type = cached_resources.get(cluster_uri)
-
     if cluster_access_type in [ResourceAccess.WRITE, ResourceAccess.READ]:
         return True
 
@@ -85,4 +263,4 @@ def hash_token(token: str) -> str:
 
 def update_cache_for_user(token):
     auth_cache_actor = ray.get_actor("auth_cache", namespace="runhouse")
-    ray.get(auth_cache_actor.add_user.remote(token))
+    return ray.get(auth_cache_actor.add_user.remote(token))
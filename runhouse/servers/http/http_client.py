@@ -1,18 +1,43 @@
+import asyncio
+import codecs
 import json
 import logging
 import time
+import uuid
 import warnings
+import weakref
 from pathlib import Path
 from typing import Dict, Union
+from urllib.parse import urlencode
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 
 from runhouse.globals import rns_client
 
 from runhouse.resources.envs.utils import _get_env_from
 
 from runhouse.resources.resource import Resource
-from runhouse.servers.http.http_utils import handle_response, OutputType, pickle_b64
+from runhouse.servers.http.http_utils import (
+    ACCEPT_COMPRESSION_HEADER,
+    compress as compress_data,
+    compression_codecs,
+    COMPRESSION_HEADER,
+    compression_summary,
+    COMPRESSION_THRESHOLD_HEADER,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    FRAMED_MEDIA_TYPE,
+    FramedBody,
+    handle_response,
+    MESSAGE_HEADER,
+    OutputType,
+    pickle_b64,
+    pickle_oob,
+    read_frames,
+    read_frames_async,
+    record_compression,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,9 +50,21 @@ class HTTPClient:
     DEFAULT_PORT = 32300
     MAX_MESSAGE_LENGTH = 1 * 1024 * 1024 * 1024  # 1 GB
     CHECK_TIMEOUT_SEC = 10
+    DEFAULT_POOL_SIZE = 10
+    # Call args larger than this are uploaded to the server in chunks before the call, rather than in its body
+    STREAM_UPLOAD_THRESHOLD = 256 * 1024 * 1024  # 256 MB
+    UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024  # 16 MB
 
     def __init__(
-        self, host: str, port: int, auth=None, cert_path=None, use_https=False
+        self,
+        host: str,
+        port: int,
+        auth=None,
+        cert_path=None,
+        use_https=False,
+        pool_size: int = None,
+        compression: Union[bool, str] = True,
+        compression_threshold: int = None,
     ):
         self.host = host
         self.port = port
@@ -35,6 +72,65 @@ class HTTPClient:
         self.cert_path = cert_path
         self.use_https = use_https
         self.verify = self._use_cert_verification()
+        self.pool_size = pool_size or self.DEFAULT_POOL_SIZE
+        self.session = self._new_session()
+        # Async clients are bound to the event loop they're used in, so we keep one per loop
+        self._async_clients = weakref.WeakKeyDictionary()
+        self.compression_codecs = compression_codecs(compression)
+        self.compression_threshold = (
+            compression_threshold or DEFAULT_COMPRESSION_THRESHOLD
+        )
+        # Turned off if the server turns out not to have our codec installed
+        self.compress_args = bool(self.compression_codecs)
+
+    def _new_session(self):
+        """Keep-alive session shared by all requests (and threads) using this client, so RPCs reuse pooled
+        connections instead of paying a new TCP (and TLS) handshake each time."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def reset_session(self):
+        """Drop all pooled connections, e.g. after the SSH tunnel they were opened through is recreated."""
+        self.close()
+        self.session = self._new_session()
+
+    def close(self):
+        self.session.close()
+        async_clients = list(self._async_clients.items())
+        self._async_clients = weakref.WeakKeyDictionary()
+        for loop, client in async_clients:
+            self._close_async_client(loop, client)
+
+    @staticmethod
+    def _close_async_client(loop, client):
+        """Close an async client on the event loop it's bound to."""
+        if loop.is_closed():
+            # Its connections were closed with the loop
+            return
+        if loop.is_running():
+            # Whether the loop is running in this thread or another, we can't block on it, so schedule the close
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            loop.run_until_complete(client.aclose())
+
+    def _async_client(self):
+        """Async counterpart of the keep-alive session, for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                auth=self.auth,
+                verify=self.verify,
+                timeout=None,
+                limits=httpx.Limits(
+                    max_connections=None, max_keepalive_connections=self.pool_size
+                ),
+            )
+            self._async_clients[loop] = client
+        return client
 
     def _use_cert_verification(self):
         if not self.use_https:
@@ -79,13 +175,13 @@ class HTTPClient:
         # Support use case where we explicitly do not want to provide headers (e.g. requesting a cert)
         headers = rns_client.request_headers if headers != {} else headers
         req_fn = (
-            requests.get
+            self.session.get
             if req_type == "get"
-            else requests.put
+            else self.session.put
             if req_type == "put"
-            else requests.delete
+            else self.session.delete
             if req_type == "delete"
-            else requests.post
+            else self.session.post
         )
         # Note: For localhost (e.g. docker) do not add trailing slash (will lead to connection errors)
         endpoint = endpoint.strip("/")
@@ -118,7 +214,7 @@ class HTTPClient:
         return handle_response(resp_json, output_type, err_str)
 
     def check_server(self):
-        resp = requests.get(
+        resp = self.session.get(
             self._formatted_url("check"),
             timeout=self.CHECK_TIMEOUT_SEC,
             verify=self.verify,
@@ -149,6 +245,116 @@ class HTTPClient:
         with open(self.cert_path, "wb") as file:
             file.write(cert)
 
+    @staticmethod
+    def _iter_responses(res, compression_stats=None):
+        """Iterate over the responses streamed back from call_module_method. Decodes binary frames if the
+        server supports them, and falls back to newline-delimited JSON if not (e.g. an older server)."""
+        if FRAMED_MEDIA_TYPE in res.headers.get("Content-Type", ""):
+            return read_frames(res.iter_content(chunk_size=None), compression_stats)
+        return (json.loads(line) for line in res.iter_lines(chunk_size=None))
+
+    @staticmethod
+    async def _aiter_responses(res, compression_stats=None):
+        """Async version of `_iter_responses`, for an httpx response."""
+        if FRAMED_MEDIA_TYPE in res.headers.get("Content-Type", ""):
+            async for resp in read_frames_async(res.aiter_bytes(), compression_stats):
+                yield resp
+        else:
+            async for line in res.aiter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def upload_data(self, module_name, parts, env=None):
+        """Stream the parts of pickled call args (see `pickle_oob`) to the server's staging endpoint in chunks,
+        without joining them, and return the key to reference them by in `call_module_method`."""
+        data_key = uuid.uuid4().hex
+
+        chunks = []
+        for part in parts:
+            view = memoryview(part).cast("B")
+            for start in range(0, view.nbytes, self.UPLOAD_CHUNK_SIZE):
+                chunks.append(view[start : start + self.UPLOAD_CHUNK_SIZE])
+
+        res = self.session.post(
+            self._formatted_url(f"upload/{module_name}/{data_key}"),
+            data=FramedBody(chunks),
+            params={"env": env} if env else None,
+            headers=rns_client.request_headers,
+            verify=self.verify,
+        )
+        if res.status_code != 200:
+            raise ValueError(
+                f"Error uploading data for {module_name} to server: {res.content.decode()}"
+            )
+        resp = res.json()
+        handle_response(
+            resp, resp["output_type"], f"Error uploading data for {module_name}"
+        )
+        return data_key
+
+    def _call_body(self, message, parts, compress, compression_stats):
+        """Body (as kwargs for requests) and extra headers for a call_module_method request with the given
+        pickled args (see `pickle_oob`). ``parts`` is None if the args were uploaded ahead of the call."""
+        if parts is None:
+            return {"json": message}, {}
+
+        binary_headers = {
+            "Content-Type": FRAMED_MEDIA_TYPE,
+            MESSAGE_HEADER: json.dumps(message),
+        }
+        size = len(FramedBody(parts))
+        if compress and size > self.compression_threshold:
+            codec = self.compression_codecs[0]
+            compressed = compress_data(b"".join(parts), codec)
+            if len(compressed) < size:
+                record_compression(compression_stats, codec, size, len(compressed))
+                return {"data": compressed}, {
+                    **binary_headers,
+                    COMPRESSION_HEADER: codec,
+                }
+
+        if len(parts) > 2:
+            # Args have out-of-band buffers (e.g. large arrays), so send them as a raw body rather than copying
+            # them into a base64 string, with the rest of the message in a header
+            return {"data": FramedBody(parts)}, binary_headers
+
+        return {
+            "json": {"data": codecs.encode(parts[1], "base64").decode(), **message}
+        }, {}
+
+    def _call_request(
+        self,
+        env,
+        stream_logs,
+        save,
+        run_name,
+        remote,
+        run_async,
+        args,
+        kwargs,
+        cache_key=None,
+    ):
+        """Message, headers, and pickled args (see `pickle_oob`) for a call_module_method request."""
+        message = {
+            "env": env,
+            "stream_logs": stream_logs,
+            "save": save,
+            "key": run_name,
+            "remote": remote,
+            "run_async": run_async,
+        }
+        if cache_key is not None:
+            message["cache_key"] = cache_key
+        # Ask for results in binary frames rather than base64 pickles inside JSON
+        headers = {
+            **rns_client.request_headers,
+            "Accept": f"{FRAMED_MEDIA_TYPE}, application/json",
+        }
+        if self.compression_codecs:
+            headers[ACCEPT_COMPRESSION_HEADER] = ", ".join(self.compression_codecs)
+            headers[COMPRESSION_THRESHOLD_HEADER] = str(self.compression_threshold)
+        return message, headers, pickle_oob([args, kwargs])
+
     def call_module_method(
         self,
         module_name,
@@ -162,6 +368,7 @@ class HTTPClient:
         args=None,
         kwargs=None,
         system=None,
+        cache_key=None,
     ):
         """
         Client function to call the rpc for call_module_method
@@ -172,21 +379,41 @@ class HTTPClient:
             f"{'Calling' if method_name else 'Getting'} {module_name}"
             + (f".{method_name}" if method_name else "")
         )
-        res = requests.post(
-            self._formatted_url(f"{module_name}/{method_name}"),
-            json={
-                "data": pickle_b64([args, kwargs]),
-                "env": env,
-                "stream_logs": stream_logs,
-                "save": save,
-                "key": run_name,
-                "remote": remote,
-                "run_async": run_async,
-            },
-            stream=not run_async,
-            headers=rns_client.request_headers,
-            verify=self.verify,
+        message, headers, parts = self._call_request(
+            env,
+            stream_logs,
+            save,
+            run_name,
+            remote,
+            run_async,
+            args,
+            kwargs,
+            cache_key=cache_key,
         )
+        compression_stats = {}
+        if len(FramedBody(parts)) > self.STREAM_UPLOAD_THRESHOLD:
+            data_key = self.upload_data(module_name, parts, env=env)
+            parts = None
+            message.update({"data": None, "data_key": data_key})
+
+        def post(compress):
+            body, body_headers = self._call_body(
+                message, parts, compress, compression_stats
+            )
+            return self.session.post(
+                self._formatted_url(f"{module_name}/{method_name}"),
+                **body,
+                stream=not run_async,
+                headers={**headers, **body_headers},
+                verify=self.verify,
+            )
+
+        res = post(compress=self.compress_args)
+        if res.status_code == 415 and compression_stats:
+            # The server can't decompress our args, so send them as is from now on
+            self.compress_args = False
+            compression_stats.clear()
+            res = post(compress=False)
         if res.status_code != 200:
             raise ValueError(
                 f"Error calling {method_name} on server: {res.content.decode()}"
@@ -196,9 +423,8 @@ class HTTPClient:
         # We get back a stream of intermingled log outputs and results (maybe None, maybe error, maybe single result,
         # maybe a stream of results), so we need to separate these out.
         non_generator_result = None
-        res_iter = res.iter_lines(chunk_size=None)
-        for responses_json in res_iter:
-            resp = json.loads(responses_json)
+        res_iter = self._iter_responses(res, compression_stats)
+        for resp in res_iter:
             output_type = resp["output_type"]
             result = handle_response(resp, output_type, error_str)
             if output_type in [OutputType.RESULT_STREAM, OutputType.SUCCESS_STREAM]:
@@ -208,8 +434,7 @@ class HTTPClient:
                     # If this is supposed to be an empty generator, there's no first result to return
                     if not output_type == OutputType.SUCCESS_STREAM:
                         yield result
-                    for responses_json_inner in res_iter:
-                        resp_inner = json.loads(responses_json_inner)
+                    for resp_inner in res_iter:
                         output_type_inner = resp_inner["output_type"]
                         result_inner = handle_response(
                             resp_inner, output_type_inner, error_str
@@ -226,7 +451,7 @@ class HTTPClient:
                         log_str = f"Time to call {module_name}.{method_name}: {round(end_inner - start, 2)} seconds"
                     else:
                         log_str = f"Time to get {module_name}: {round(end_inner - start, 2)} seconds"
-                    logging.info(log_str)
+                    logging.info(log_str + compression_summary(compression_stats))
 
                 return results_generator()
             elif output_type == OutputType.CONFIG:
@@ -249,9 +474,206 @@ class HTTPClient:
             log_str = f"Time to call {module_name}.{method_name}: {round(end - start, 2)} seconds"
         else:
             log_str = f"Time to get {module_name}: {round(end - start, 2)} seconds"
-        logging.info(log_str)
+        logging.info(log_str + compression_summary(compression_stats))
         return non_generator_result
 
+    async def call_module_method_async(
+        self,
+        module_name,
+        method_name,
+        env=None,
+        stream_logs=True,
+        save=False,
+        run_name=None,
+        remote=False,
+        run_async=False,
+        args=None,
+        kwargs=None,
+        system=None,
+        cache_key=None,
+    ):
+        """
+        Async version of `call_module_method`, which sends the request and streams the responses on the running
+        event loop rather than in a thread. Streamed results are returned as an async generator.
+        """
+        start = time.time()
+        logger.info(
+            f"{'Calling' if method_name else 'Getting'} {module_name}"
+            + (f".{method_name}" if method_name else "")
+        )
+        message, headers, parts = self._call_request(
+            env,
+            stream_logs,
+            save,
+            run_name,
+            remote,
+            run_async,
+            args,
+            kwargs,
+            cache_key=cache_key,
+        )
+        compression_stats = {}
+        if len(FramedBody(parts)) > self.STREAM_UPLOAD_THRESHOLD:
+            # Uploads this large are rare, so reuse the sync chunked upload rather than blocking the loop with it
+            data_key = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.upload_data(module_name, parts, env=env)
+            )
+            parts = None
+            message.update({"data": None, "data_key": data_key})
+
+        client = self._async_client()
+
+        async def post(compress):
+            body, body_headers = self._call_body(
+                message, parts, compress, compression_stats
+            )
+            if isinstance(body.get("data"), FramedBody):
+                # Send the out-of-band buffers as is, without joining them
+                framed_body = body.pop("data")
+
+                async def content():
+                    for part in framed_body:
+                        yield part
+
+                body["content"] = content()
+                body_headers["Content-Length"] = str(len(framed_body))
+            elif "data" in body:
+                body["content"] = body.pop("data")
+
+            request = client.build_request(
+                "POST",
+                self._formatted_url(f"{module_name}/{method_name}"),
+                **body,
+                headers={**headers, **body_headers},
+            )
+            return await client.send(request, stream=True)
+
+        res = await post(compress=self.compress_args)
+        if res.status_code == 415 and compression_stats:
+            # The server can't decompress our args, so send them as is from now on
+            await res.aclose()
+            self.compress_args = False
+            compression_stats.clear()
+            res = await post(compress=False)
+        if res.status_code != 200:
+            content = await res.aread()
+            await res.aclose()
+            raise ValueError(
+                f"Error calling {method_name} on server: {content.decode()}"
+            )
+        error_str = f"Error calling {method_name} on {module_name} on server"
+
+        def log_time():
+            end = time.time()
+            if method_name:
+                log_str = f"Time to call {module_name}.{method_name}: {round(end - start, 2)} seconds"
+            else:
+                log_str = f"Time to get {module_name}: {round(end - start, 2)} seconds"
+            logging.info(log_str + compression_summary(compression_stats))
+
+        # Same as in `call_module_method`, logs and results are intermingled in the stream of responses
+        non_generator_result = None
+        res_iter = self._aiter_responses(res, compression_stats)
+        try:
+            async for resp in res_iter:
+                output_type = resp["output_type"]
+                result = handle_response(resp, output_type, error_str)
+                if output_type in [
+                    OutputType.RESULT_STREAM,
+                    OutputType.SUCCESS_STREAM,
+                ]:
+
+                    async def results_generator(response=res):
+                        try:
+                            if not output_type == OutputType.SUCCESS_STREAM:
+                                yield result
+                            async for resp_inner in res_iter:
+                                output_type_inner = resp_inner["output_type"]
+                                result_inner = handle_response(
+                                    resp_inner, output_type_inner, error_str
+                                )
+                                if output_type_inner in [
+                                    OutputType.RESULT_STREAM,
+                                    OutputType.RESULT,
+                                ]:
+                                    yield result_inner
+                            log_time()
+                        finally:
+                            await response.aclose()
+
+                    # The generator closes the response once it's done with it
+                    res = None
+                    return results_generator()
+                elif output_type == OutputType.CONFIG:
+                    if (
+                        system
+                        and "system" in result
+                        and system.rns_address == result["system"]
+                    ):
+                        result["system"] = system
+                    non_generator_result = Resource.from_config(result, dryrun=True)
+
+                elif output_type == OutputType.RESULT:
+                    non_generator_result = result
+        finally:
+            if res is not None:
+                await res.aclose()
+
+        log_time()
+        return non_generator_result
+
+    def call_batch(self, calls, return_exceptions=False):
+        """
+        Client function to call many module methods in one request. ``calls`` is a list of
+        ``(module_name, method_name, args, kwargs)`` tuples (args and kwargs are optional), which run concurrently
+        on the server. Returns the results in the order of the calls.
+        """
+        start = time.time()
+        batch = []
+        for call in calls:
+            module_name, method_name, *call_args = call
+            args = call_args[0] if len(call_args) > 0 else []
+            kwargs = call_args[1] if len(call_args) > 1 else {}
+            batch.append(
+                {
+                    "module": module_name,
+                    "method": method_name,
+                    "data": pickle_b64([list(args), kwargs]),
+                }
+            )
+
+        res = self.session.post(
+            self._formatted_url("batch"),
+            json={"calls": batch},
+            stream=True,
+            headers=rns_client.request_headers,
+            verify=self.verify,
+        )
+        if res.status_code != 200:
+            raise ValueError(f"Error calling batch on server: {res.content.decode()}")
+
+        # Results come back in the order the calls finish, tagged with the index of their call
+        results = [None] * len(batch)
+        for resp in self._iter_responses(res):
+            index = resp["index"]
+            module_name, method_name = batch[index]["module"], batch[index]["method"]
+            try:
+                results[index] = handle_response(
+                    resp,
+                    resp["output_type"],
+                    f"Error calling {method_name} on {module_name} on server",
+                )
+            except Exception as e:
+                if not return_exceptions:
+                    res.close()
+                    raise e
+                results[index] = e
+
+        logging.info(
+            f"Time to call batch of {len(batch)}: {round(time.time() - start, 2)} seconds"
+        )
+        return results
+
     def put_object(self, key, value, env=None):
         self.request(
             "object",
@@ -262,6 +684,23 @@ class HTTPClient:
             err_str=f"Error putting object {key}",
         )
 
+    def put_many(self, mapping, env=None):
+        self.request(
+            "put_many",
+            req_type="post",
+            data=pickle_b64(mapping),
+            env=env,
+            err_str=f"Error putting {len(mapping)} objects",
+        )
+
+    def get_many(self, keys):
+        return self.request(
+            "get_many",
+            req_type="post",
+            data=pickle_b64(list(keys)),
+            err_str=f"Error getting {len(keys)} objects",
+        )
+
     def put_resource(self, resource, env=None, state=None, dryrun=False):
         if env and not isinstance(env, str):
             env = _get_env_from(env)
@@ -303,11 +742,32 @@ class HTTPClient:
             err_str=f"Error cancelling runs {key}",
         )
 
-    def keys(self, env=None):
+    def keys(self, env=None, prefix=None, limit=None, cursor=None):
         if env is not None and not isinstance(env, str):
             env = _get_env_from(env)
             env = env.name
-        return self.request(f"keys/?env={env}" if env else "keys", req_type="get")
+        params = {
+            name: value
+            for name, value in [
+                ("env", env),
+                ("prefix", prefix),
+                ("limit", limit),
+                ("cursor", cursor),
+            ]
+            if value is not None and value != ""
+        }
+        return self.request(
+            f"keys/?{urlencode(params)}" if params else "keys", req_type="get"
+        )
+
+    def obj_store_stats(self, env=None):
+        if env is not None and not isinstance(env, str):
+            env = _get_env_from(env)
+            env = env.name
+        return self.request(
+            f"obj_store_stats/?env={env}" if env else "obj_store_stats",
+            req_type="get",
+        )
 
     def add_secrets(self, secrets):
         failed_providers = self.request(
@@ -1,8 +1,12 @@
 import argparse
+import asyncio
 import inspect
 import json
 import logging
-import time
+import multiprocessing
+import os
+import signal
+import sys
 import traceback
 from functools import wraps
 from pathlib import Path
@@ -10,26 +14,40 @@ from typing import Optional
 
 import ray
 import requests
-from fastapi import Body, FastAPI, HTTPException, Request
+from fastapi import Body, Depends, FastAPI, HTTPException, Request
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, Response as RawResponse, StreamingResponse
 
 from sky.skylet.autostop_lib import set_last_active_time_to_now
+from starlette.concurrency import run_in_threadpool
 
 from runhouse.globals import configs, env_servlets, rns_client
-from runhouse.resources.hardware.utils import _load_cluster_config
+from runhouse.resources.hardware.utils import _current_cluster, _load_cluster_config
 from runhouse.rns.utils.api import resolve_absolute_path
 from runhouse.rns.utils.names import _generate_default_name
 from runhouse.servers.http.auth import hash_token, verify_cluster_access
 from runhouse.servers.http.certs import TLSCertConfig
 from runhouse.servers.http.http_utils import (
+    ACCEPT_COMPRESSION_HEADER,
     b64_unpickle,
+    BatchMessage,
+    BatchResponse,
+    compression_available,
+    COMPRESSION_HEADER,
+    COMPRESSION_THRESHOLD_HEADER,
+    decompress,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    frame_response,
+    FRAMED_MEDIA_TYPE,
     get_token_from_request,
     load_current_cluster,
     Message,
+    MESSAGE_HEADER,
+    negotiate_compression,
     OutputType,
     pickle_b64,
     Response,
+    serialize_data,
 )
 from runhouse.servers.nginx.config import NginxConfig
 from runhouse.servers.servlet import EnvServlet
@@ -74,7 +92,10 @@ def validate_cluster_access(func):
             )
 
         func_call: bool = func.__name__ in ["call_module_method", "call"]
-        cluster_access = verify_cluster_access(cluster_uri, token)
+        # Verifying access makes a request to Den, so run it in a thread rather than blocking the event loop
+        cluster_access = await run_in_threadpool(
+            verify_cluster_access, cluster_uri, token
+        )
         if not cluster_access and not func_call:
             # Must have cluster access for all the non func calls
             # Note: for func calls will be handling the auth in the object store
@@ -91,19 +112,59 @@ def validate_cluster_access(func):
     return wrapper
 
 
+async def read_call_message(request: Request) -> Optional[dict]:
+    """Read the message for call_module_method, which is JSON unless the args were sent as a binary body with
+    out-of-band buffers or compressed. The binary body is read straight into one preallocated buffer, which the
+    servlet unpickles the args from in place."""
+    if FRAMED_MEDIA_TYPE not in request.headers.get("Content-Type", ""):
+        body = await request.body()
+        return json.loads(body) if body else None
+
+    codec = request.headers.get(COMPRESSION_HEADER)
+    if codec and not compression_available(codec):
+        # The client falls back to sending the args uncompressed
+        raise HTTPException(
+            status_code=415, detail=f"Compression codec {codec} is not installed"
+        )
+
+    data = bytearray(int(request.headers["Content-Length"]))
+    filled = 0
+    async for chunk in request.stream():
+        data[filled : filled + len(chunk)] = chunk
+        filled += len(chunk)
+    if filled != len(data):
+        raise HTTPException(status_code=400, detail="Incomplete request body")
+
+    if codec:
+        data = await run_in_threadpool(decompress, data, codec)
+
+    message = json.loads(request.headers[MESSAGE_HEADER])
+    message["data"] = data
+    return message
+
+
 class HTTPServer:
     MAX_MESSAGE_LENGTH = 1 * 1024 * 1024 * 1024  # 1 GB
     LOGGING_WAIT_TIME = 1
+    UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024  # 16 MB
     DEFAULT_SERVER_HOST = "0.0.0.0"
     DEFAULT_SERVER_PORT = 32300
     DEFAULT_HTTP_PORT = 80
     DEFAULT_HTTPS_PORT = 443
     SKY_YAML = str(Path("~/.sky/sky_ray.yml").expanduser())
+    # Import path of the app, which each worker process loads when the server runs with multiple workers
+    APP_IMPORT_PATH = "runhouse.servers.http.http_server:app"
+    WORKER_CONFIG_ENV_VAR = "RH_SERVER_WORKER_CONFIG"
     memory_exporter = None
     _den_auth = False
 
     def __init__(
-        self, conda_env=None, enable_local_span_collection=None, *args, **kwargs
+        self,
+        conda_env=None,
+        enable_local_span_collection=None,
+        collect_cluster_stats=True,
+        *args,
+        **kwargs,
     ):
         runtime_env = {"conda": conda_env} if conda_env else {}
 
@@ -132,7 +193,7 @@ class HTTPServer:
             @staticmethod
             @app.get("/spans")
             @validate_cluster_access
-            def get_spans(request: Request):
+            async def get_spans(request: Request):
                 return {
                     "spans": [
                         span.to_json()
@@ -147,11 +208,12 @@ class HTTPServer:
                 namespace="runhouse",
             )
 
-        try:
-            # Collect metadata for the cluster immediately on init
-            self._collect_cluster_stats()
-        except Exception as e:
-            logger.error(f"Failed to collect cluster stats: {str(e)}")
+        if collect_cluster_stats:
+            try:
+                # Collect metadata for the cluster immediately on init
+                self._collect_cluster_stats()
+            except Exception as e:
+                logger.error(f"Failed to collect cluster stats: {str(e)}")
 
         base_env = self.get_env_servlet(
             env_name="base",
@@ -162,9 +224,50 @@ class HTTPServer:
         from runhouse.globals import obj_store
 
         obj_store.set_name("server")
+        obj_store.follow_auth_updates()
+
+        if self._obj_store_snapshots():
+            self._restore_snapshotted_envs()
 
         HTTPServer.register_activity()
 
+    @classmethod
+    def initialize_worker(cls, worker_config: dict):
+        """Set up the server state in an API server worker process. The env servlets, object store and auth cache
+        are named detached Ray actors, so the worker attaches to the ones the main server process created."""
+        cls(
+            conda_env=worker_config.get("conda_env"),
+            enable_local_span_collection=worker_config.get(
+                "enable_local_span_collection"
+            ),
+            collect_cluster_stats=False,
+        )
+        if worker_config.get("den_auth"):
+            cls.enable_den_auth()
+
+    @staticmethod
+    def run_workers(host: str, ports: list):
+        """Run an API server worker on each of the ports (e.g. for Nginx to load balance across), and block until
+        they exit."""
+        import uvicorn
+
+        ctx = multiprocessing.get_context("spawn")
+        workers = [
+            ctx.Process(
+                target=uvicorn.run,
+                args=(HTTPServer.APP_IMPORT_PATH,),
+                kwargs={"host": host, "port": port},
+                daemon=True,
+            )
+            for port in ports
+        ]
+        # Exit cleanly on SIGTERM (e.g. the pkill on server restart) so the daemon workers are stopped too
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
     @classmethod
     def get_den_auth(cls):
         return cls._den_auth
@@ -179,7 +282,7 @@ class HTTPServer:
 
     @staticmethod
     @app.get("/cert")
-    def get_cert():
+    async def get_cert():
         """Download the certificate file for this server necessary for enabling HTTPS.
         User must have access to the cluster in order to download the certificate."""
         try:
@@ -206,7 +309,7 @@ class HTTPServer:
 
     @staticmethod
     @app.get("/check")
-    def check_server():
+    async def check_server():
         try:
             HTTPServer.register_activity()
             if not ray.is_initialized():
@@ -225,12 +328,34 @@ class HTTPServer:
                 output_type=OutputType.EXCEPTION,
             )
 
+    @staticmethod
+    def _obj_store_snapshots() -> bool:
+        cluster_config = _current_cluster("config") or {}
+        return bool(cluster_config.get("obj_store_snapshots"))
+
+    @staticmethod
+    def _restore_snapshotted_envs():
+        """Create the servlets of envs with object store snapshots from before the server restarted. Servlets are
+        otherwise only created when their env is next used, and until then the keys in their snapshots aren't
+        registered, so can't be found from other envs."""
+        from runhouse.servers.obj_store import ObjStore
+
+        for env_name, runtime_env in ObjStore.snapshotted_envs().items():
+            if env_name in env_servlets.keys():
+                continue
+            logger.info(f"Creating env {env_name} to restore its object store snapshot")
+            HTTPServer.get_env_servlet(env_name, create=True, runtime_env=runtime_env)
+
     @staticmethod
     def get_env_servlet(env_name, create=False, runtime_env=None):
         if env_name in env_servlets.keys():
             return env_servlets[env_name]
 
         if create:
+            if runtime_env and HTTPServer._obj_store_snapshots():
+                from runhouse.servers.obj_store import ObjStore
+
+                ObjStore.save_snapshot_runtime_env(env_name, runtime_env)
             new_env = (
                 ray.remote(EnvServlet)
                 .options(
@@ -262,6 +387,40 @@ class HTTPServer:
         else:
             return getattr(servlet, method)(*args)
 
+    @staticmethod
+    async def call_servlet_method_async(servlet, method, args):
+        if isinstance(servlet, ray.actor.ActorHandle):
+            return await getattr(servlet, method).remote(*args)
+        else:
+            return getattr(servlet, method)(*args)
+
+    @staticmethod
+    async def call_in_env_servlet_async(
+        method,
+        args=None,
+        env=None,
+        create=False,
+        lookup_env_for_name=None,
+    ):
+        """Like `call_in_env_servlet`, but awaits the servlet's result so the event loop (and the other requests
+        on it) isn't blocked in the meantime."""
+        HTTPServer.register_activity()
+        try:
+            if lookup_env_for_name:
+                env = env or await HTTPServer.lookup_env_for_name_async(
+                    lookup_env_for_name
+                )
+            servlet = HTTPServer.get_env_servlet(env or "base", create=create)
+            return await HTTPServer.call_servlet_method_async(servlet, method, args)
+        except Exception as e:
+            logger.exception(e)
+            HTTPServer.register_activity()
+            return Response(
+                error=pickle_b64(e),
+                traceback=pickle_b64(traceback.format_exc()),
+                output_type=OutputType.EXCEPTION,
+            )
+
     @staticmethod
     def call_in_env_servlet(
         method,
@@ -287,6 +446,39 @@ class HTTPServer:
                 output_type=OutputType.EXCEPTION,
             )
 
+    @staticmethod
+    def _requested_serialization(request: Request):
+        """Use the binary framed protocol if the client asked for it in the Accept header, otherwise JSON."""
+        accept = request.headers.get("accept", "") if request else ""
+        return "pickle" if FRAMED_MEDIA_TYPE in accept else "json"
+
+    @staticmethod
+    def _requested_compression(request: Request):
+        """Compression for result frames, as kwargs for `frame_response`, using the first codec the client
+        accepts which is installed here."""
+        codec = negotiate_compression(
+            request.headers.get(ACCEPT_COMPRESSION_HEADER) if request else None
+        )
+        if not codec:
+            return {}
+        threshold = request.headers.get(COMPRESSION_THRESHOLD_HEADER)
+        return {
+            "compression": codec,
+            "compression_threshold": int(threshold)
+            if threshold
+            else DEFAULT_COMPRESSION_THRESHOLD,
+        }
+
+    @staticmethod
+    def _format_response(resp, serialization, compression=None):
+        """Send a single Response in the serialization (and compression) negotiated with the client."""
+        if serialization == "pickle" and isinstance(resp, Response):
+            return RawResponse(
+                content=b"".join(frame_response(resp, **(compression or {}))),
+                media_type=FRAMED_MEDIA_TYPE,
+            )
+        return resp
+
     @staticmethod
     def lookup_env_for_name(name, check_rns=False):
         from runhouse.globals import obj_store
@@ -303,10 +495,22 @@ class HTTPServer:
 
         return None
 
+    @staticmethod
+    async def lookup_env_for_name_async(name, check_rns=False):
+        from runhouse.globals import obj_store
+
+        env = await obj_store.get_env_async(name)
+        if env or not check_rns:
+            return env
+
+        return await run_in_threadpool(
+            HTTPServer.lookup_env_for_name, name, check_rns=True
+        )
+
     @staticmethod
     @app.post("/resource")
     @validate_cluster_access
-    def put_resource(request: Request, message: Message):
+    async def put_resource(request: Request, message: Message):
         # if resource is env and not yet a servlet, construct env servlet
         if message.env and message.env not in env_servlets.keys():
             resource = b64_unpickle(message.data)[0]
@@ -325,7 +529,7 @@ class HTTPServer:
 
                 env_servlets[message.env] = new_env
 
-        return HTTPServer.call_in_env_servlet(
+        return await HTTPServer.call_in_env_servlet_async(
             "put_resource",
             [message],
             env=message.env,
@@ -333,14 +537,61 @@ class HTTPServer:
             lookup_env_for_name=message.key,
         )
 
+    @staticmethod
+    @app.post("/upload/{module}/{key}")
+    @validate_cluster_access
+    async def upload_data(request: Request, module, key, env: Optional[str] = None):
+        """Stream an upload of call args into the servlet's staging buffer for key, a chunk at a time, so the
+        server never holds more than one chunk. The args are then referenced by key in call_module_method."""
+        HTTPServer.register_activity()
+        chunk = bytearray()
+        try:
+            async for piece in request.stream():
+                chunk += piece
+                if len(chunk) >= HTTPServer.UPLOAD_CHUNK_SIZE:
+                    await HTTPServer._stage_chunk(module, key, env, bytes(chunk))
+                    chunk.clear()
+            if chunk:
+                await HTTPServer._stage_chunk(module, key, env, bytes(chunk))
+            return Response(output_type=OutputType.SUCCESS)
+        except Exception as e:
+            logger.exception(e)
+            await HTTPServer.call_in_env_servlet_async(
+                "discard_staged_data", [key], env=env, lookup_env_for_name=module
+            )
+            return Response(
+                error=pickle_b64(e),
+                traceback=pickle_b64(traceback.format_exc()),
+                output_type=OutputType.EXCEPTION,
+            )
+
+    @staticmethod
+    async def _stage_chunk(module, key, env, chunk):
+        resp = await HTTPServer.call_in_env_servlet_async(
+            "stage_data",
+            [key, chunk],
+            env=env,
+            create=True,
+            lookup_env_for_name=module,
+        )
+        if isinstance(resp, Response):
+            # call_in_env_servlet_async returns exceptions as a Response
+            raise b64_unpickle(resp.error)
+
     @staticmethod
     @app.post("/{module}/{method}")
     @validate_cluster_access
-    def call_module_method(
-        request: Request, module, method=None, message: dict = Body(...)
+    async def call_module_method(
+        request: Request,
+        module,
+        method=None,
+        message: Optional[dict] = Depends(read_call_message),
     ):
+        den_auth = HTTPServer.get_den_auth()
         token = get_token_from_request(request)
         token_hash = hash_token(token) if den_auth else None
+        serialization = HTTPServer._requested_serialization(request)
+        compression = HTTPServer._requested_compression(request)
         # Stream the logs and result (e.g. if it's a generator)
         HTTPServer.register_activity()
         try:
@@ -351,7 +602,8 @@ class HTTPServer:
             message = message or (
                 Message(stream_logs=False, key=module) if not method else Message()
             )
-            env = message.env or HTTPServer.lookup_env_for_name(module)
+            message.serialization = serialization
+            env = message.env or await HTTPServer.lookup_env_for_name_async(module)
             persist = message.run_async or message.remote or message.save or not method
             if method:
                 # TODO fix the way we generate runkeys, it's ugly
@@ -362,7 +614,8 @@ class HTTPServer:
                 # If certain conditions are met, we can return a response immediately
                 fast_resp = not persist and not message.stream_logs
 
-                # Unless we're returning a fast response, we discard this obj_ref
+                # Unless we're returning a fast response, we discard this obj_ref. This doesn't block, it only
+                # submits the call to the servlet.
                 obj_ref = HTTPServer.call_in_env_servlet(
                     "call_module_method",
                     [module, method, message, token_hash, den_auth],
@@ -372,22 +625,31 @@ class HTTPServer:
                 )
 
                 if fast_resp:
-                    res = ray.get(obj_ref)
+                    # call_in_env_servlet returns a Response rather than an obj_ref if it failed
+                    res = (
+                        await obj_ref if isinstance(obj_ref, ray.ObjectRef) else obj_ref
+                    )
                     logger.info(f"Returning fast response for {message.key}")
-                    return res
+                    return HTTPServer._format_response(res, serialization, compression)
 
             else:
                 message.key = module
                 # If this is a "get" call, don't wait for the result, it's either there or not.
                 from runhouse.globals import obj_store
 
-                if not obj_store.contains(message.key):
-                    return Response(output_type=OutputType.NOT_FOUND, data=message.key)
+                if not await obj_store.contains_async(message.key):
+                    return HTTPServer._format_response(
+                        Response(output_type=OutputType.NOT_FOUND, data=message.key),
+                        serialization,
+                    )
 
             if message.run_async:
-                return Response(
-                    data=pickle_b64(message.key),
-                    output_type=OutputType.RESULT,
+                return HTTPServer._format_response(
+                    Response(
+                        data=serialize_data(message.key, serialization),
+                        output_type=OutputType.RESULT,
+                    ),
+                    serialization,
                 )
 
             return StreamingResponse(
@@ -397,16 +659,23 @@ class HTTPServer:
                     stream_logs=message.stream_logs,
                     remote=message.remote,
                     pop=not persist,
+                    serialization=serialization,
+                    compression=compression,
                 ),
-                media_type="application/json",
+                media_type=FRAMED_MEDIA_TYPE
+                if serialization == "pickle"
+                else "application/json",
             )
         except Exception as e:
             logger.exception(e)
             HTTPServer.register_activity()
-            return Response(
-                error=pickle_b64(e),
-                traceback=pickle_b64(traceback.format_exc()),
-                output_type=OutputType.EXCEPTION,
+            return HTTPServer._format_response(
+                Response(
+                    error=pickle_b64(e),
+                    traceback=pickle_b64(traceback.format_exc()),
+                    output_type=OutputType.EXCEPTION,
+                ),
+                serialization,
             )
 
     @staticmethod
@@ -438,43 +707,41 @@ class HTTPServer:
         return open_files
 
     @staticmethod
-    def _get_results_and_logs_generator(key, env, stream_logs, remote=False, pop=False):
+    async def _get_results_and_logs_generator(
+        key,
+        env,
+        stream_logs,
+        remote=False,
+        pop=False,
+        serialization="json",
+        compression=None,
+    ):
         from runhouse.globals import obj_store
 
+        def encode(resp: Response):
+            # Binary frames are yielded as a few separate chunks so large payloads aren't copied again
+            if serialization == "pickle":
+                return frame_response(resp, **(compression or {}))
+            return [json.dumps(jsonable_encoder(resp)) + "\n"]
+
         open_logfiles = []
         waiting_for_results = True
 
         try:
-            obj_ref = None
             while waiting_for_results:
-
-                while not obj_store.contains(key):
-                    time.sleep(0.1)
-
-                if not obj_ref:
-                    obj_ref = HTTPServer.call_in_env_servlet(
-                        "get",
-                        [key, remote, True],
-                        env=env,
-                        block=False,
-                    )
-                try:
-                    ret_val = ray.get(obj_ref, timeout=HTTPServer.LOGGING_WAIT_TIME)
+                # The servlet waits to be notified of the next result, and returns None if there isn't one within
+                # LOGGING_WAIT_TIME (or the call hasn't stored its result yet) so we can stream the logs meanwhile
+                ret_val = await HTTPServer.call_in_env_servlet_async(
+                    "get",
+                    [key, remote, True, None, False, serialization, True],
+                    env=env,
+                )
+                if ret_val is not None:
                     # Last result in a stream will have type RESULT to indicate the end
-                    if ret_val is None:
-                        # Still waiting for results in queue
-                        obj_ref = None
-                        # time.sleep(HTTPServer.LOGGING_WAIT_TIME)
-                        raise ray.exceptions.GetTimeoutError
                     if not ret_val.output_type == OutputType.RESULT_STREAM:
                         waiting_for_results = False
-                    ret_resp = json.dumps(jsonable_encoder(ret_val))
-                    yield ret_resp + "\n"
-                except ray.exceptions.GetTimeoutError:
-                    pass
-
-                # Reset the obj_ref so we make a fresh request for the result next time around
-                obj_ref = None
+                    for part in encode(ret_val):
+                        yield part
 
                 # Grab all the lines written to all the log files since the last time we checked, including
                 # any new log files that have been created
@@ -497,19 +764,19 @@ class HTTPServer:
                         output_type=OutputType.STDOUT,
                     )
                     logger.debug(f"Yielding logs for key {key}")
-                    yield json.dumps(jsonable_encoder(lines_resp)) + "\n"
+                    for part in encode(lines_resp):
+                        yield part
 
         except Exception as e:
             logger.exception(e)
-            yield json.dumps(
-                jsonable_encoder(
-                    Response(
-                        error=pickle_b64(e),
-                        traceback=pickle_b64(traceback.format_exc()),
-                        output_type=OutputType.EXCEPTION,
-                    )
+            for part in encode(
+                Response(
+                    error=pickle_b64(e),
+                    traceback=pickle_b64(traceback.format_exc()),
+                    output_type=OutputType.EXCEPTION,
                 )
-            )
+            ):
+                yield part
         finally:
             if stream_logs and not open_logfiles:
                 logger.warning(f"No logfiles found for call {key}")
@@ -518,58 +785,115 @@ class HTTPServer:
 
             logger.debug(f"Deleting {key}")
             if pop:
-                obj_store.delete(key)
-                HTTPServer.call_in_env_servlet("delete_obj", [[key], True], env=env)
+                await obj_store.delete_async(key)
+                await HTTPServer.call_in_env_servlet_async(
+                    "delete_obj", [[key], True], env=env
+                )
 
     @staticmethod
     @app.post("/object")
     @validate_cluster_access
-    def put_object(request: Request, message: Message):
-        return HTTPServer.call_in_env_servlet(
+    async def put_object(request: Request, message: Message):
+        return await HTTPServer.call_in_env_servlet_async(
             "put_object", [message.key, message.data], env=message.env, create=True
         )
 
     @staticmethod
     @app.put("/object")
     @validate_cluster_access
-    def rename_object(request: Request, message: Message):
-        return HTTPServer.call_in_env_servlet(
+    async def rename_object(request: Request, message: Message):
+        return await HTTPServer.call_in_env_servlet_async(
             "rename_object", [message], env=message.env, lookup_env_for_name=message.key
         )
 
     @staticmethod
     @app.delete("/object")
     @validate_cluster_access
-    def delete_obj(request: Request, message: Message):
-        return HTTPServer.call_in_env_servlet(
+    async def delete_obj(request: Request, message: Message):
+        return await HTTPServer.call_in_env_servlet_async(
             "delete_obj", [message], env=message.env, lookup_env_for_name=message.key
         )
 
+    @staticmethod
+    @app.post("/put_many")
+    @validate_cluster_access
+    async def put_many(request: Request, message: Message):
+        return await HTTPServer.call_in_env_servlet_async(
+            "put_many", [message.data], env=message.env, create=True
+        )
+
+    @staticmethod
+    @app.post("/get_many")
+    @validate_cluster_access
+    async def get_many(request: Request, message: Message):
+        """Get many objects at once, with one call to each env servlet which holds some of them. Keys which
+        aren't found are left out of the result."""
+        from runhouse.globals import obj_store
+
+        keys = b64_unpickle(message.data)
+        keys_for_env = {}
+        for key, env in (await obj_store.get_envs_async(keys)).items():
+            keys_for_env.setdefault(env, []).append(key)
+
+        responses = await asyncio.gather(
+            *[
+                HTTPServer.call_in_env_servlet_async("get_many", [env_keys], env=env)
+                for env, env_keys in keys_for_env.items()
+            ]
+        )
+        data = {}
+        for resp in responses:
+            if resp.output_type == OutputType.EXCEPTION:
+                return resp
+            data.update(resp.data)
+        return Response(data=data, output_type=OutputType.RESULT_DICT)
+
     @staticmethod
     @app.post("/cancel")
     @validate_cluster_access
-    def cancel_run(request: Request, message: Message):
-        return HTTPServer.call_in_env_servlet(
+    async def cancel_run(request: Request, message: Message):
+        return await HTTPServer.call_in_env_servlet_async(
             "cancel_run", [message], env=message.env, lookup_env_for_name=message.key
         )
 
     @staticmethod
     @app.get("/keys")
     @validate_cluster_access
-    def get_keys(request: Request, env: Optional[str] = None):
+    async def get_keys(
+        request: Request,
+        env: Optional[str] = None,
+        prefix: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ):
         from runhouse.globals import obj_store
 
         if not env:
             return Response(
-                output_type=OutputType.RESULT, data=pickle_b64(obj_store.keys())
+                output_type=OutputType.RESULT,
+                data=pickle_b64(
+                    await obj_store.keys_async(
+                        prefix=prefix, limit=limit, cursor=cursor
+                    )
+                ),
             )
-        return HTTPServer.call_in_env_servlet("get_keys", [], env=env)
+        return await HTTPServer.call_in_env_servlet_async(
+            "get_keys", [prefix, limit, cursor], env=env
+        )
+
+    @staticmethod
+    @app.get("/obj_store_stats")
+    @validate_cluster_access
+    async def get_obj_store_stats(request: Request, env: Optional[str] = None):
+        return await HTTPServer.call_in_env_servlet_async(
+            "get_obj_store_stats", [], env=env
+        )
 
     @staticmethod
     @app.post("/secrets")
     @validate_cluster_access
-    def add_secrets(request: Request, message: Message):
-        return HTTPServer.call_in_env_servlet(
+    async def add_secrets(request: Request, message: Message):
+        return await HTTPServer.call_in_env_servlet_async(
             "add_secrets", [message], env=message.env, create=True
         )
 
@@ -585,9 +909,10 @@ class HTTPServer:
     ):
         kwargs = args.get("kwargs", {})
         args = args.get("args", [])
+        den_auth = HTTPServer.get_den_auth()
         token = get_token_from_request(request)
         token_hash = hash_token(token) if den_auth else None
-        resp = HTTPServer.call_in_env_servlet(
+        resp = await HTTPServer.call_in_env_servlet_async(
             "call",
             [module, method, args, kwargs, serialization, token_hash, den_auth],
             create=True,
@@ -596,6 +921,61 @@ class HTTPServer:
 
         return JSONResponse(content=resp)
 
+    @staticmethod
+    @app.post("/batch")
+    @validate_cluster_access
+    async def call_batch(request: Request, message: BatchMessage):
+        """Run many module calls from one request. The calls run concurrently in their env servlets, and each
+        result is streamed back as soon as it's done, tagged with the index of its call."""
+        den_auth = HTTPServer.get_den_auth()
+        token = get_token_from_request(request)
+        token_hash = hash_token(token) if den_auth else None
+        HTTPServer.register_activity()
+
+        # Look up each module's env once, rather than once per call
+        envs = {}
+        for batch_call in message.calls:
+            if not batch_call.env and batch_call.module not in envs:
+                envs[batch_call.module] = await HTTPServer.lookup_env_for_name_async(
+                    batch_call.module
+                )
+
+        async def call(index, batch_call):
+            resp = await HTTPServer.call_in_env_servlet_async(
+                "call",
+                [
+                    batch_call.module,
+                    batch_call.method,
+                    None,
+                    None,
+                    "pickle",
+                    token_hash,
+                    den_auth,
+                    batch_call.data,
+                ],
+                env=batch_call.env or envs[batch_call.module],
+                create=True,
+            )
+            if not isinstance(resp, Response):
+                resp = Response(data=resp, output_type=OutputType.RESULT)
+            return BatchResponse(index=index, **resp.dict())
+
+        async def results():
+            tasks = [
+                asyncio.ensure_future(call(index, batch_call))
+                for index, batch_call in enumerate(message.calls)
+            ]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    resp = await task
+                    yield json.dumps(jsonable_encoder(resp)) + "\n"
+            finally:
+                # e.g. if the client disconnected
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(results(), media_type="application/json")
+
     @staticmethod
     def _collect_cluster_stats():
         """Collect cluster metadata and send to Grafana Loki"""
@@ -672,6 +1052,17 @@ class HTTPServer:
             )
 
 
+if (
+    os.environ.get(HTTPServer.WORKER_CONFIG_ENV_VAR)
+    and __name__ == HTTPServer.APP_IMPORT_PATH.split(":")[0]
+):
+    # This is a worker process of a multi-worker server, which imports the app by name (spawned processes also
+    # re-run the main module as __mp_main__, which we skip)
+    HTTPServer.initialize_worker(
+        json.loads(os.environ[HTTPServer.WORKER_CONFIG_ENV_VAR])
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -735,6 +1126,13 @@ if __name__ == "__main__":
         action="store_true",  # if providing --use-nginx will be set to True
         help="Configure Nginx as a reverse proxy",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of API server worker processes. With Nginx, each worker runs on its own port starting "
+        "from the server port, and Nginx load balances across them.",
+    )
     parser.add_argument(
         "--certs-address",
         type=str,
@@ -756,6 +1154,7 @@ if __name__ == "__main__":
     restart_proxy = parse_args.restart_proxy
     use_nginx = parse_args.use_nginx
     use_local_telemetry = parse_args.use_local_telemetry
+    workers = parse_args.workers or cluster_config.get("server_workers") or 1
 
     # Update globally inside the module based on the args passed in or the cluster config
     den_auth = parse_args.use_den_auth or cluster_config.get("den_auth")
@@ -837,6 +1236,7 @@ if __name__ == "__main__":
             ssl_cert_path=ssl_certfile,
             use_https=use_https,
             force_reinstall=restart_proxy,
+            num_workers=workers,
         )
         nc.configure()
 
@@ -850,17 +1250,40 @@ if __name__ == "__main__":
     logger.info(
         f"Launching Runhouse API server with den_auth={den_auth} and "
         + f"use_local_telemetry={use_local_telemetry} "
-        + f"on host: {host} and port: {rh_server_port}"
+        + f"on host: {host} and port: {rh_server_port} with {workers} worker(s)"
     )
 
     # Only launch uvicorn with certs if HTTPS is enabled and not using Nginx
     uvicorn_cert = ssl_certfile if not use_nginx and use_https else None
     uvicorn_key = ssl_keyfile if not use_nginx and use_https else None
 
-    uvicorn.run(
-        app,
-        host=host,
-        port=rh_server_port,
-        ssl_certfile=uvicorn_cert,
-        ssl_keyfile=uvicorn_key,
-    )
+    if workers > 1:
+        # Each worker imports the app separately, and rebuilds the server state from this config
+        os.environ[HTTPServer.WORKER_CONFIG_ENV_VAR] = json.dumps(
+            {
+                "conda_env": conda_name,
+                "enable_local_span_collection": use_local_telemetry,
+                "den_auth": bool(den_auth),
+            }
+        )
+
+    if workers > 1 and use_nginx:
+        HTTPServer.run_workers(host=host, ports=nc.worker_ports)
+    elif workers > 1:
+        # The workers share the server port
+        uvicorn.run(
+            HTTPServer.APP_IMPORT_PATH,
+            host=host,
+            port=rh_server_port,
+            workers=workers,
+            ssl_certfile=uvicorn_cert,
+            ssl_keyfile=uvicorn_key,
+        )
+    else:
+        uvicorn.run(
+            app,
+            host=host,
+            port=rh_server_port,
+            ssl_certfile=uvicorn_cert,
+            ssl_keyfile=uvicorn_key,
+        )
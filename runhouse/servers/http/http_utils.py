@@ -1,8 +1,10 @@
 import codecs
+import json
 import logging
 import re
+import struct
 import sys
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, AsyncIterable, Dict, Iterable, List, Optional, Union
 
 from pydantic import BaseModel
 from ray import cloudpickle as pickle
@@ -18,6 +20,9 @@ class Message(BaseModel):
     save: Optional[bool] = False
     remote: Optional[bool] = False
     run_async: Optional[bool] = False
+    serialization: Optional[str] = "json"
+    data_key: Optional[str] = None
+    cache_key: Optional[str] = None
 
 
 class Args(BaseModel):
@@ -25,13 +30,32 @@ class Args(BaseModel):
     kwargs: Optional[Dict[str, Any]]
 
 
+class BatchCall(BaseModel):
+    module: str
+    method: Optional[str] = None
+    # pickle_b64 of [args, kwargs]
+    data: Optional[str] = None
+    env: Optional[str] = None
+
+
+class BatchMessage(BaseModel):
+    calls: List[BatchCall]
+
+
 class Response(BaseModel):
-    data: Union[None, str, List[str], Dict]
-    error: Optional[str]
-    traceback: Optional[str]
+    # Data, error, and traceback are pickle_b64 strings by default, or raw pickle bytes if the
+    # response is going to be sent back to the client in binary frames (see `frame_response`)
+    data: Union[None, str, List[str], Dict, bytes]
+    error: Optional[Union[str, bytes]]
+    traceback: Optional[Union[str, bytes]]
     output_type: str
 
 
+class BatchResponse(Response):
+    # Position of the call in the batch, since results are sent back in the order the calls finish
+    index: int
+
+
 class OutputType:
     EXCEPTION = "exception"
     STDOUT = "stdout"
@@ -41,11 +65,138 @@ class OutputType:
     CANCELLED = "cancelled"
     RESULT = "result"
     RESULT_LIST = "result_list"
+    RESULT_DICT = "result_dict"
     RESULT_STREAM = "result_stream"
     SUCCESS_STREAM = "success_stream"  # No output, but with generators
     CONFIG = "config"
 
 
+# Media type for the binary framed wire protocol. Clients opt in by including it in their Accept header,
+# and servers which don't support it will just respond with newline-delimited JSON.
+FRAMED_MEDIA_TYPE = "application/x-runhouse-frames"
+
+# Each frame is this header followed by the output type, data, error, and traceback payloads. The header holds
+# the length of the output type, the encoding and compression of the data payload, and the lengths of the three
+# payloads.
+FRAME_HEADER = struct.Struct("!BBBQQQ")
+
+
+class FrameEncoding:
+    NONE = 0
+    PICKLE = 1
+    JSON = 2
+
+
+# Header sent with binary call_module_method request bodies, holding the rest of the message as JSON
+MESSAGE_HEADER = "X-Runhouse-Message"
+
+# Compression is negotiated per request: the client lists the codecs it accepts for result frames (in order of
+# preference) along with its size threshold, and names the codec its own body is compressed with, if any.
+ACCEPT_COMPRESSION_HEADER = "X-Runhouse-Accept-Compression"
+COMPRESSION_THRESHOLD_HEADER = "X-Runhouse-Compression-Threshold"
+COMPRESSION_HEADER = "X-Runhouse-Compression"
+DEFAULT_COMPRESSION_THRESHOLD = 64 * 1024  # 64 KB
+
+
+class Compression:
+    NONE = 0
+    ZLIB = 1
+    LZ4 = 2
+    ZSTD = 3
+
+    CODECS = {"zlib": ZLIB, "lz4": LZ4, "zstd": ZSTD}
+    # Codecs used when compression is just turned on, fastest first. zlib is always available, but is usually
+    # slower than the link it would be saving time on, so it's only used if asked for explicitly.
+    PREFERRED = ["zstd", "lz4"]
+
+
+def compression_available(codec: str) -> bool:
+    if codec == "zlib":
+        return True
+    try:
+        if codec == "zstd":
+            import zstandard  # noqa: F401
+        elif codec == "lz4":
+            import lz4.frame  # noqa: F401
+        else:
+            return False
+    except ModuleNotFoundError:
+        return False
+    return True
+
+
+def compression_codecs(compression: Union[bool, str, None]) -> List[str]:
+    """Codecs to offer for a ``compression`` setting: ``True`` for the fastest installed ones, ``False`` or
+    ``None`` for none, or the name of a specific codec."""
+    if not compression:
+        return []
+    if compression is True:
+        return [
+            codec for codec in Compression.PREFERRED if compression_available(codec)
+        ]
+    if compression not in Compression.CODECS:
+        raise ValueError(
+            f"Unknown compression codec {compression}, must be one of {list(Compression.CODECS)}"
+        )
+    if not compression_available(compression):
+        raise ModuleNotFoundError(
+            f"Compression codec {compression} is not installed, run `pip install runhouse[compression]`"
+        )
+    return [compression]
+
+
+def negotiate_compression(accept_header: Optional[str]) -> Optional[str]:
+    """Pick the first codec listed in the Accept-Compression header which is installed here."""
+    for codec in (accept_header or "").split(","):
+        codec = codec.strip()
+        if codec in Compression.CODECS and compression_available(codec):
+            return codec
+    return None
+
+
+def compress(data, codec: str) -> bytes:
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=1).compress(data)
+    elif codec == "lz4":
+        import lz4.frame
+
+        return lz4.frame.compress(data)
+    elif codec == "zlib":
+        import zlib
+
+        return zlib.compress(data, 1)
+    raise ValueError(f"Unknown compression codec {codec}")
+
+
+def decompress(data, codec: str) -> bytearray:
+    """Decompress into a bytearray, so any arrays unpickled out-of-band from the result are writeable."""
+    if codec == "zstd":
+        import zstandard
+
+        return bytearray(zstandard.ZstdDecompressor().decompress(data))
+    elif codec == "lz4":
+        import lz4.frame
+
+        return bytearray(lz4.frame.decompress(data))
+    elif codec == "zlib":
+        import zlib
+
+        return bytearray(zlib.decompress(data))
+    raise ValueError(f"Unknown compression codec {codec}")
+
+
+def _codec_name(compression: int) -> str:
+    return next(name for name, val in Compression.CODECS.items() if val == compression)
+
+
+# Pickles with out-of-band buffers start with this magic and the number of parts (the pickle itself plus each
+# buffer), followed by the length of each part and then the parts themselves.
+OOB_HEADER = struct.Struct("!4sI")
+OOB_MAGIC = b"RHPB"
+
+
 def pickle_b64(picklable):
     return codecs.encode(pickle.dumps(picklable), "base64").decode()
 
@@ -54,27 +205,250 @@ def b64_unpickle(b64_pickled):
     return pickle.loads(codecs.decode(b64_pickled.encode(), "base64"))
 
 
+def pickle_oob(picklable) -> List[Union[bytes, memoryview]]:
+    """Pickle with protocol 5, keeping large buffers (e.g. NumPy arrays or Arrow buffers) out-of-band.
+    Returns the header, the pickle, and a view of each buffer, so they can be written out without copying.
+    If there are no out-of-band buffers, the pickle (``parts[1]``) is a plain pickle."""
+    buffers = []
+    pickled = pickle.dumps(picklable, protocol=5, buffer_callback=buffers.append)
+    parts = [pickled] + [buf.raw() for buf in buffers]
+    lengths = [memoryview(part).nbytes for part in parts]
+    header = OOB_HEADER.pack(OOB_MAGIC, len(parts)) + struct.pack(
+        f"!{len(parts)}Q", *lengths
+    )
+    return [header] + parts
+
+
+def unpickle_oob(data):
+    """Unpickle the output of `pickle_oob` (joined into one buffer). Out-of-band buffers are passed to pickle as
+    views into ``data``, so e.g. arrays are reconstructed in place rather than copied (and are writeable if
+    ``data`` is)."""
+    view = memoryview(data)
+    _, num_parts = OOB_HEADER.unpack_from(view)
+    lengths = struct.unpack_from(f"!{num_parts}Q", view, OOB_HEADER.size)
+    offset = OOB_HEADER.size + 8 * num_parts
+    parts = []
+    for length in lengths:
+        parts.append(view[offset : offset + length])
+        offset += length
+    return pickle.loads(parts[0], buffers=parts[1:])
+
+
+def serialize_data(data, serialization="json"):
+    """Pickle the data for a Response, either as a base64 string to be sent inside JSON ("json") or as raw
+    bytes with out-of-band buffers to be sent in a binary frame ("pickle")."""
+    if serialization == "pickle":
+        return b"".join(pickle_oob(data))
+    return pickle_b64(data)
+
+
+def deserialize_data(data):
+    """Unpickle data which was serialized with `serialize_data`, whichever serialization was used."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        if data[: len(OOB_MAGIC)] == OOB_MAGIC:
+            return unpickle_oob(data)
+        return pickle.loads(data)
+    return b64_unpickle(data)
+
+
+class FramedBody:
+    """Iterable request body which sends its parts without joining them into one buffer. It has a length so
+    requests sets the Content-Length, letting the server allocate the whole body up front."""
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def __len__(self):
+        return sum(memoryview(part).nbytes for part in self.parts)
+
+    def __iter__(self):
+        return iter(self.parts)
+
+
+def _pickled_bytes(field) -> bytes:
+    if field is None:
+        return b""
+    if isinstance(field, (bytes, bytearray, memoryview)):
+        return field
+    # Errors and tracebacks created before serialization was negotiated are still pickle_b64 strings
+    return codecs.decode(field.encode(), "base64")
+
+
+def frame_response(
+    resp: Response,
+    compression: Optional[str] = None,
+    compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+) -> List[bytes]:
+    """Encode a Response as a binary frame. The frame is returned as a list of non-empty byte strings (header
+    first) so large payloads can be written to the stream without being copied into one buffer. If a compression
+    codec is given, data payloads larger than ``compression_threshold`` bytes are compressed with it."""
+    output_type = resp.output_type.encode()
+    if resp.data is None:
+        encoding, data = FrameEncoding.NONE, b""
+    elif isinstance(resp.data, (bytes, bytearray, memoryview)):
+        encoding, data = FrameEncoding.PICKLE, resp.data
+    else:
+        encoding, data = FrameEncoding.JSON, json.dumps(resp.data).encode()
+
+    compressed = Compression.NONE
+    if compression and len(data) > compression_threshold:
+        compressed_data = compress(data, compression)
+        # Incompressible data (e.g. already compressed images) is sent as is
+        if len(compressed_data) < len(data):
+            compressed, data = Compression.CODECS[compression], compressed_data
+
+    error = _pickled_bytes(resp.error)
+    tb = _pickled_bytes(resp.traceback)
+    header = FRAME_HEADER.pack(
+        len(output_type), encoding, compressed, len(data), len(error), len(tb)
+    )
+    # Skip empty parts, as an empty chunk would end a chunked HTTP response
+    return [part for part in [header, output_type, data, error, tb] if part]
+
+
+def _decode_frame(lengths, payload: bytearray, stats: Optional[Dict] = None):
+    type_len, encoding, compressed, data_len, error_len, _ = lengths
+    view = memoryview(payload)
+    output_type = bytes(view[:type_len]).decode()
+    start = type_len
+    # Data is left as a view into the payload, so large pickles (and their out-of-band buffers) aren't copied
+    data = view[start : start + data_len]
+    start += data_len
+    error = bytes(view[start : start + error_len])
+    start += error_len
+    tb = bytes(view[start:])
+
+    if compressed != Compression.NONE:
+        codec = _codec_name(compressed)
+        data = decompress(data, codec)
+        if stats is not None:
+            record_compression(stats, codec, len(data), data_len)
+
+    if encoding == FrameEncoding.NONE:
+        data = None
+    elif encoding == FrameEncoding.JSON:
+        data = json.loads(bytes(data))
+
+    return {
+        "output_type": output_type,
+        "data": data,
+        "error": error or None,
+        "traceback": tb or None,
+    }
+
+
+def record_compression(stats: Dict, codec: str, size: int, compressed_size: int):
+    stats["codec"] = codec
+    stats["size"] = stats.get("size", 0) + size
+    stats["compressed_size"] = stats.get("compressed_size", 0) + compressed_size
+
+
+def compression_summary(stats: Dict) -> str:
+    """Describe the compression recorded in ``stats`` for the client's timing logs."""
+    if not stats:
+        return ""
+    mb = 1024 * 1024
+    return (
+        f" ({stats['codec']} compressed {round(stats['size'] / mb, 2)} MB "
+        f"to {round(stats['compressed_size'] / mb, 2)} MB)"
+    )
+
+
+class FrameReader:
+    """Incrementally decodes binary frames from byte chunks, into response dicts in the same format as the JSON
+    responses, with pickled payloads left as bytes for `handle_response`. Each frame's payload is allocated once
+    from its header and filled in place as chunks arrive. Compressed payloads are decompressed, and the sizes are
+    recorded in ``stats`` if given."""
+
+    def __init__(self, stats: Optional[Dict] = None):
+        self.stats = stats
+        self.header = bytearray()
+        self.lengths, self.payload, self.filled = None, None, 0
+
+    def feed(self, chunk):
+        """Yield the responses for the frames completed by this chunk."""
+        chunk = memoryview(chunk)
+        while len(chunk):
+            if self.payload is None:
+                needed = FRAME_HEADER.size - len(self.header)
+                self.header += chunk[:needed]
+                chunk = chunk[needed:]
+                if len(self.header) < FRAME_HEADER.size:
+                    break
+                self.lengths = FRAME_HEADER.unpack(self.header)
+                self.payload = bytearray(self.lengths[0] + sum(self.lengths[3:]))
+                self.filled = 0
+
+            n = min(len(self.payload) - self.filled, len(chunk))
+            self.payload[self.filled : self.filled + n] = chunk[:n]
+            self.filled += n
+            chunk = chunk[n:]
+            if self.filled == len(self.payload):
+                yield _decode_frame(self.lengths, self.payload, self.stats)
+                self.header, self.payload = bytearray(), None
+
+    def close(self):
+        if self.header or self.payload is not None:
+            raise ValueError("Stream from server ended in the middle of a frame")
+
+
+def read_frames(chunks: Iterable[bytes], stats: Optional[Dict] = None):
+    """Decode a stream of byte chunks (e.g. ``response.iter_content(chunk_size=None)``) into response dicts,
+    see `FrameReader`."""
+    reader = FrameReader(stats)
+    for chunk in chunks:
+        yield from reader.feed(chunk)
+    reader.close()
+
+
+async def read_frames_async(chunks: AsyncIterable[bytes], stats: Optional[Dict] = None):
+    """Async version of `read_frames`, e.g. for ``response.aiter_bytes()``."""
+    reader = FrameReader(stats)
+    async for chunk in chunks:
+        for resp in reader.feed(chunk):
+            yield resp
+    reader.close()
+
+
 def get_token_from_request(request):
     auth_headers = request.headers.get("Authorization", "")
     return auth_headers.split("Bearer ")[-1] if auth_headers else None
 
 
+# Cluster config file stamp and the rns address of the cluster it describes, see `load_current_cluster`
+_current_cluster_uri = (None, None)
+
+
 def load_current_cluster():
     from runhouse.resources.hardware import _current_cluster, _get_cluster_from
+    from runhouse.resources.hardware.utils import _cluster_config_stamp
+
+    global _current_cluster_uri
 
-    current_cluster = _get_cluster_from(_current_cluster("config"))
-    return current_cluster.rns_address if current_cluster else None
+    # This is called for every den auth check, so only rebuild the cluster from its config if the config changed
+    stamp = _cluster_config_stamp()
+    cached_stamp, uri = _current_cluster_uri
+    if stamp != cached_stamp:
+        current_cluster = _get_cluster_from(_current_cluster("config"))
+        uri = current_cluster.rns_address if current_cluster else None
+        _current_cluster_uri = (stamp, uri)
+    return uri
 
 
 def handle_response(response_data, output_type, err_str):
     if output_type in [OutputType.RESULT, OutputType.RESULT_STREAM]:
-        return b64_unpickle(response_data["data"])
+        return deserialize_data(response_data["data"])
     elif output_type == OutputType.CONFIG:
         # No need to unpickle since this was just sent as json
         return response_data["data"]
     elif output_type == OutputType.RESULT_LIST:
         # Map, starmap, and repeat return lists of results
-        return [b64_unpickle(val) for val in response_data["data"]]
+        return [deserialize_data(val) for val in response_data["data"]]
+    elif output_type == OutputType.RESULT_DICT:
+        # Bulk gets return a dict of keys to results
+        return {
+            key: deserialize_data(val) for key, val in response_data["data"].items()
+        }
     elif output_type == OutputType.NOT_FOUND:
         raise KeyError(f"{err_str}: key {response_data['data']} not found")
     elif output_type == OutputType.CANCELLED:
@@ -82,8 +456,8 @@ def handle_response(response_data, output_type, err_str):
     elif output_type in [OutputType.SUCCESS, OutputType.SUCCESS_STREAM]:
         return
     elif output_type == OutputType.EXCEPTION:
-        fn_exception = b64_unpickle(response_data["error"])
-        fn_traceback = b64_unpickle(response_data["traceback"])
+        fn_exception = deserialize_data(response_data["error"])
+        fn_traceback = deserialize_data(response_data["traceback"])
         logger.error(f"{err_str}: {fn_exception}")
         logger.error(f"Traceback: {fn_traceback}")
         raise fn_exception
@@ -9,6 +9,7 @@ logger = logging.getLogger(__name__)
 class NginxConfig:
     BASE_CONFIG_PATH = "/etc/nginx/sites-available/fastapi"
     RH_SERVER_PORT = 32300
+    UPSTREAM_NAME = "runhouse_server"
 
     # Helpful commands:
     # sudo systemctl restart nginx
@@ -25,10 +26,15 @@ class NginxConfig:
         ssl_key_path: str = None,
         use_https=False,
         force_reinstall=False,
+        num_workers: int = 1,
     ):
         self.use_https = use_https
         self.rh_server_port = rh_server_port or self.RH_SERVER_PORT
 
+        # With multiple API server workers, each listens on its own port starting from the server port, and Nginx
+        # load balances requests across them
+        self.num_workers = num_workers or 1
+
         self.ssl_cert_path = ssl_cert_path
         self.ssl_key_path = ssl_key_path
 
@@ -95,10 +101,29 @@ class NginxConfig:
             if result.returncode != 0:
                 raise RuntimeError(f"Failed to install nginx: {result.stderr}")
 
+    @property
+    def worker_ports(self):
+        return [self.rh_server_port + i for i in range(self.num_workers)]
+
+    def _upstream(self):
+        if self.num_workers <= 1:
+            return ""
+
+        servers = "".join(
+            f"    server 127.0.0.1:{port};\n" for port in self.worker_ports
+        )
+        # Calls can stream results for a long time, so send new requests to the least busy worker
+        return f"upstream {self.UPSTREAM_NAME} {{\n    least_conn;\n{servers}}}\n"
+
+    def _proxy_pass(self):
+        if self.num_workers <= 1:
+            return f"http://127.0.0.1:{self.rh_server_port}/"
+        return f"http://{self.UPSTREAM_NAME}/"
+
     def _http_template(self):
         template = textwrap.dedent(
             """
-        server {{
+        {upstream}server {{
             listen {app_port};
 
             server_name {server_name};
@@ -115,7 +140,8 @@ class NginxConfig:
 
         replace_dict = {
             "app_port": 80,
-            "proxy_pass": f"http://127.0.0.1:{self.rh_server_port}/",
+            "upstream": self._upstream(),
+            "proxy_pass": self._proxy_pass(),
             "server_name": self.address,
         }
 
@@ -125,7 +151,7 @@ class NginxConfig:
     def _https_template(self):
         template = textwrap.dedent(
             """
-        server {{
+        {upstream}server {{
             listen {app_port} ssl;
 
             server_name {server_name};
@@ -145,7 +171,8 @@ class NginxConfig:
 
         replace_dict = {
             "app_port": 443,
-            "proxy_pass": f"http://127.0.0.1:{self.rh_server_port}/",
+            "upstream": self._upstream(),
+            "proxy_pass": self._proxy_pass(),
             "server_name": self.address,
             "ssl_cert_path": self.ssl_cert_path,
             "ssl_key_path": self.ssl_key_path,
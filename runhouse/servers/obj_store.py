@@ -1,5 +1,10 @@
+import asyncio
+import json
 import logging
 import os
+import threading
+import time
+from collections import deque
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Union
 
@@ -8,6 +13,138 @@ import ray
 logger = logging.getLogger(__name__)
 
 
+class KeyEnvIndex:
+    """Index of which env servlet each key in the object store lives in, held in a detached actor shared across the
+    cluster. Every change bumps the index's version, so processes can keep a local replica of the index up to date
+    by waiting on ``changes_since``."""
+
+    # Number of recent changes kept for replicas to catch up on before they have to resync the whole index
+    MAX_CHANGES = 10000
+    # How long ``changes_since`` waits for a change before returning
+    WAIT_TIMEOUT = 30
+
+    def __init__(self):
+        from runhouse.resources.kvstores.sorted_key_dict import SortedKeyDict
+
+        self.data = SortedKeyDict()
+        self.version = 0
+        # (version, key, env) for each change, where env is None if the key was removed and key is None if the
+        # whole index was cleared
+        self.changes = deque(maxlen=self.MAX_CHANGES)
+        self._loop = None
+        self._waiters = []
+
+    def _record(self, key, env):
+        self.version += 1
+        self.changes.append((self.version, key, env))
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake_waiters)
+        return self.version
+
+    def _wake_waiters(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def put(self, key: str, env: str):
+        self.data[key] = env
+        return self._record(key, env)
+
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+
+    def pop(self, key: str, default=None):
+        if key not in self.data:
+            return None
+        self.data.pop(key)
+        return self._record(key, None)
+
+    def rename_key(self, old_key: str, new_key: str, default=None):
+        # Like dict.pop, if a default is given, new_key is set to it if old_key isn't found. Otherwise renaming a
+        # missing key changes nothing, so replicas have nothing to catch up on.
+        if old_key not in self.data and default is None:
+            return self.version
+        env = self.data.pop(old_key, default)
+        self.data[new_key] = env
+        self._record(old_key, None)
+        return self._record(new_key, env)
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def put_many(self, mapping: Dict[str, str]):
+        self.data.update(mapping)
+        for key, env in mapping.items():
+            self._record(key, env)
+        return self.version
+
+    def pop_many(self, keys: List[str]):
+        for key in keys:
+            if key in self.data:
+                self.data.pop(key)
+                self._record(key, None)
+        return self.version
+
+    def keys(
+        self,
+        prefix: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ):
+        if prefix is None and limit is None and cursor is None:
+            return list(self.data.keys())
+        return self.data.scan(prefix=prefix, limit=limit, cursor=cursor)
+
+    def contains(self, key: str):
+        return key in self.data
+
+    def clear(self):
+        self.data.clear()
+        return self._record(None, None)
+
+    async def changes_since(self, version: Optional[int], timeout: float = None):
+        """Wait until the index changes after ``version``, then return the current version and the
+        (key, env) changes since ``version``. If the changes are no longer available (or no version is given), instead
+        returns a snapshot of the whole index as a dict in place of the list of changes."""
+        if version == self.version:
+            self._loop = asyncio.get_running_loop()
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout or self.WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiters.remove(waiter)
+
+        if (
+            version is None
+            or version > self.version
+            or (self.changes and self.changes[0][0] > version + 1)
+        ):
+            return self.version, dict(self.data)
+
+        changes = []
+        for change_version, key, env in self.changes:
+            if change_version <= version:
+                continue
+            if key is None:
+                return self.version, dict(self.data)
+            changes.append((key, env))
+        return self.version, changes
+
+
+class SharedObject:
+    """Handle to a value published to Ray's object store (see `ObjStore.SHARED_OBJECT_THRESHOLD`), which
+    servlets return to each other in place of the value. Ray passes the ObjectRef inside through actor calls
+    rather than resolving it, so the reader can get the value from shared memory itself."""
+
+    __slots__ = ("ref",)
+
+    def __init__(self, ref: ray.ObjectRef):
+        self.ref = ref
+
+
 class ObjStore:
     """Class to handle object storage for Runhouse. Object storage for a cluster is
     stored in the Ray GCS, if available."""
@@ -17,29 +154,79 @@ class ObjStore:
     # https://docs.ray.io/en/latest/ray-core/package-ref.html#ray-get-actor
     LOGS_DIR = ".rh/logs"
     RH_LOGFILE_PATH = Path.home() / LOGS_DIR
+    ENV_INDEX_RETRY_INTERVAL = 1.0
+    SPILL_DIR = "~/.rh/spill"
+    SNAPSHOT_DIR = "~/.rh/snapshots"
+    SNAPSHOT_RUNTIME_ENV_NAME = "runtime_env.json"
+    DISK_STORE_DIR = "~/.rh/kv"
+    # Values at least this large (other than resources) are published to Ray's object store when another env gets
+    # them, so it reads them from shared memory rather than having the servlet pickle them back. They're published
+    # for each read rather than kept there, so other envs see the live value and it isn't stored twice.
+    SHARED_OBJECT_THRESHOLD = 1 * 1024 * 1024  # 1 MB
 
     def __init__(self):
         self.servlet_name = None
         self._kv_store = None
         self._env_for_key = None
+        # Local replica of the env_for_key index, kept in sync by a background thread, so looking up which env a
+        # key lives in usually doesn't need a round trip to the actor. See `_local_env_index`. Once synced, this is a
+        # SortedKeyDict, so keys can be listed by prefix from the replica too.
+        self._env_index = {}
+        self._env_index_version = None
+        # Keys this process wrote to the index, with the index version of the write and the env, so the replica
+        # reflects our own writes before the sync thread catches up to them
+        self._env_index_writes = {}
+        self._env_index_cleared = 0
+        self._env_index_lock = threading.Lock()
+        self._env_index_thread = None
         self.imported_modules = {}
+        self.imported_module_stamps = {}
         self.installed_envs = {}
         self._auth_cache = None
-
-    def set_name(self, servlet_name: str):
+        self._local_auth_cache = None
+        self._auth_updates_thread = None
+        # Durable snapshot of the keys put in this process (see `SnapshotLog`), and the keys in it which haven't
+        # been loaded back into the store since a restart
+        self._snapshot = None
+        self._unrestored = set()
+        self._restore_lock = threading.Lock()
+
+    def set_name(
+        self,
+        servlet_name: str,
+        memory_limit: Optional[int] = None,
+        snapshots: bool = False,
+        backend: str = "memory",
+    ):
         # This needs to be in a separate method so the HTTPServer actually
         # initalizes the obj_store, and it doesn't get created and destroyed when
         # nginx runs http_server.py as a module.
+        # If memory_limit (in bytes) is set, values past it are spilled to disk (see `TieredDict`).
+        # If snapshots is set, keys put with ``snapshot=True`` are snapshotted to disk and restored after a restart
+        # (see `SnapshotLog`).
+        # If backend is "disk", values are stored in an embedded database on local disk (see `DiskDict`).
         from runhouse.resources.kvstores import Kvstore
-        from runhouse.servers.http.auth import AuthCache
+        from runhouse.servers.http.auth import AuthCache, LocalAuthCache
 
         self.servlet_name = servlet_name or "base"
         num_gpus = ray.cluster_resources().get("GPU", 0)
         cuda_visible_devices = list(range(int(num_gpus)))
         os.environ["CUDA_VISIBLE_DEVICES"] = ",".join(map(str, cuda_visible_devices))
-        self._kv_store = Kvstore()
+        if backend == "disk":
+            self._kv_store = Kvstore(
+                backend="disk",
+                path=str(Path(self.DISK_STORE_DIR) / self.servlet_name / "data.db"),
+            )
+            # Values left by a previous process aren't in the env_for_key index, so they couldn't be found anyway.
+            # Restoring the store after a restart is what snapshots are for.
+            self._kv_store.clear()
+        else:
+            self._kv_store = Kvstore(
+                memory_limit=memory_limit,
+                spill_dir=str(Path(self.SPILL_DIR) / self.servlet_name),
+            )
         self._env_for_key = (
-            ray.remote(Kvstore)
+            ray.remote(KeyEnvIndex)
             .options(
                 name="env_for_key",
                 get_if_exists=True,
@@ -58,6 +245,83 @@ class ObjStore:
             )
             .remote()
         )
+        self._local_auth_cache = LocalAuthCache()
+        if snapshots:
+            self._open_snapshot()
+
+    def _open_snapshot(self):
+        """Open this servlet's snapshot, and register the keys in it as living in this servlet. They're loaded back
+        into the store lazily, on the first get (or pop or rename) of each key."""
+        from runhouse.servers.snapshot_log import SnapshotLog
+
+        self._snapshot = SnapshotLog(Path(self.SNAPSHOT_DIR) / self.servlet_name)
+        self._unrestored = set(self._snapshot.keys())
+        if self._unrestored:
+            logger.info(
+                f"Restoring {len(self._unrestored)} keys in {self.servlet_name} from snapshot"
+            )
+            envs = {key: self.servlet_name for key in self._unrestored}
+            version = self.call_kv_method(self._env_for_key, "put_many", envs)
+            self._write_env_index(envs, version)
+
+    @classmethod
+    def snapshotted_envs(cls) -> Dict[str, Dict]:
+        """Names of the envs with snapshots on disk (e.g. from before the server restarted), and the runtime env
+        each one's servlet was created with (see `save_snapshot_runtime_env`)."""
+        from runhouse.servers.snapshot_log import SnapshotLog
+
+        snapshot_dir = Path(cls.SNAPSHOT_DIR).expanduser()
+        if not snapshot_dir.is_dir():
+            return {}
+        envs = {}
+        for env_dir in snapshot_dir.iterdir():
+            if not (env_dir / SnapshotLog.LOG_NAME).exists():
+                continue
+            runtime_env_path = env_dir / cls.SNAPSHOT_RUNTIME_ENV_NAME
+            envs[env_dir.name] = (
+                json.loads(runtime_env_path.read_text())
+                if runtime_env_path.exists()
+                else {}
+            )
+        return envs
+
+    @classmethod
+    def save_snapshot_runtime_env(cls, env_name: str, runtime_env: Dict):
+        """Record the runtime env an env's servlet is created with, so it can be created the same way to restore
+        its snapshot after a restart."""
+        env_dir = Path(cls.SNAPSHOT_DIR).expanduser() / env_name
+        env_dir.mkdir(parents=True, exist_ok=True)
+        (env_dir / cls.SNAPSHOT_RUNTIME_ENV_NAME).write_text(json.dumps(runtime_env))
+
+    def _restore(self, keys: List[Any]):
+        """Load any of the keys which haven't been restored since a restart from the snapshot into the store."""
+        with self._restore_lock:
+            for key in keys:
+                if key not in self._unrestored:
+                    continue
+                self._unrestored.discard(key)
+                try:
+                    value = self._snapshot.load(key)
+                except KeyError:
+                    continue
+                except Exception as e:
+                    logger.error(f"Failed to restore {key} from snapshot: {e}")
+                    continue
+                self._put_local(key, value)
+
+    def _snapshot_put(self, mapping: Dict[Any, Any], snapshot: bool):
+        if self._snapshot is not None:
+            self._unrestored.difference_update(mapping)
+            if snapshot:
+                self._snapshot.put_many(mapping)
+            else:
+                # Don't restore a key's previous snapshot in place of a value which isn't snapshotted
+                self._snapshot.delete([key for key in mapping if key in self._snapshot])
+
+    def _snapshot_delete(self, keys: List[Any]):
+        if self._snapshot is not None:
+            self._unrestored.difference_update(keys)
+            self._snapshot.delete(keys)
 
     @staticmethod
     def call_kv_method(store, method, *args, **kwargs):
@@ -70,13 +334,79 @@ class ObjStore:
         else:
             return getattr(store, method)(*args, **kwargs)
 
+    @staticmethod
+    async def call_kv_method_async(store, method, *args, **kwargs):
+        """Like `call_kv_method`, but awaits the actor call rather than blocking on it (e.g. in the server's
+        event loop)."""
+        if store is None:
+            raise ValueError(
+                "Object store not initialized, may be running inside process without a servlet."
+            )
+        if isinstance(store, ray.actor.ActorHandle):
+            return await getattr(store, method).remote(*args, **kwargs)
+        else:
+            return getattr(store, method)(*args, **kwargs)
+
     def resource_access_level(self, token_hash: str, resource_uri: str):
-        return ray.get(
-            self._auth_cache.lookup_access_level.remote(token_hash, resource_uri)
+        return self.user_resources(token_hash).get(resource_uri)
+
+    def user_resources(self, token_hash: str, token: Optional[str] = None) -> dict:
+        """Resources the user has access to, mapped to their access levels. These are cached in this process, and
+        otherwise read from the shared auth cache, or loaded from Den if they aren't in it and the user's token is
+        provided."""
+        if token is None:
+            return self._local_auth_cache.get(
+                token_hash,
+                lambda: ray.get(self._auth_cache.get_user_resources.remote(token_hash)),
+            )
+        return self._local_auth_cache.get(
+            token_hash, lambda: ray.get(self._auth_cache.get_or_add_user.remote(token))
         )
 
-    def user_resources(self, token_hash: str):
-        return ray.get(self._auth_cache.get_user_resources.remote(token_hash))
+    def register_for_auth_updates(self):
+        """Have the shared auth cache tell this servlet when a user's resources change, so its local cache
+        doesn't keep serving stale access levels."""
+        self._auth_cache.register_servlet.remote(self.servlet_name)
+
+    def follow_auth_updates(self):
+        """Like `register_for_auth_updates`, for processes which aren't servlets (e.g. the API server workers),
+        so the shared auth cache can't call them. Instead a background thread waits for changes to users'
+        resources and drops them from the local cache."""
+        if self._auth_updates_thread is None:
+            self._auth_updates_thread = threading.Thread(
+                target=self._sync_auth_updates, name="auth-cache-sync", daemon=True
+            )
+            self._auth_updates_thread.start()
+
+    def _sync_auth_updates(self):
+        version = None
+        while True:
+            try:
+                new_version, token_hashes = ray.get(
+                    self._auth_cache.invalidations_since.remote(version)
+                )
+            except AttributeError:
+                # The auth cache actor was started by an older version of Runhouse, which doesn't track changes
+                logger.debug("auth_cache actor does not support syncing changes")
+                return
+            except Exception as e:
+                logger.warning(
+                    f"Lost sync with the auth cache, dropping locally cached resources: {e}"
+                )
+                self._local_auth_cache.invalidate()
+                version = None
+                time.sleep(self.ENV_INDEX_RETRY_INTERVAL)
+                continue
+
+            if token_hashes is None and version is not None:
+                # We missed some changes, so any of the cached resources could be stale
+                self._local_auth_cache.invalidate()
+            for token_hash in token_hashes or []:
+                self._local_auth_cache.invalidate(token_hash)
+            version = new_version
+
+    def invalidate_user_resources(self, token_hash: Optional[str] = None):
+        self._local_auth_cache.invalidate(token_hash)
 
     def has_resource_access(self, token_hash: str, resource_uri=None) -> bool:
         """Checks whether user has read or write access to a given module saved on the cluster."""
@@ -88,7 +418,8 @@ class ObjStore:
             return False
 
         cluster_uri = load_current_cluster()
-        cluster_access = self.resource_access_level(token_hash, cluster_uri)
+        resources = self.user_resources(token_hash)
+        cluster_access = resources.get(cluster_uri)
         if cluster_access == ResourceAccess.WRITE:
             # if user has write access to cluster will have access to all resources
             return True
@@ -100,23 +431,175 @@ class ObjStore:
             # If module does not have a name, must have access to the cluster
             return False
 
-        resource_access_level = self.resource_access_level(token_hash, resource_uri)
+        resource_access_level = resources.get(resource_uri)
         if resource_access_level not in [ResourceAccess.WRITE, ResourceAccess.READ]:
             return False
 
         return True
 
-    def keys(self):
-        # Return keys across the cluster, not only in this process
-        return self.call_kv_method(self._env_for_key, "keys")
+    def _local_env_index(self) -> Optional[dict]:
+        """Return the local replica of the env_for_key index, or None if it isn't in sync with the actor, in which
+        case lookups should go to the actor. Starts syncing the replica on first use."""
+        if not isinstance(self._env_for_key, ray.actor.ActorHandle):
+            return None
+
+        if self._env_index_thread is None:
+            with self._env_index_lock:
+                if self._env_index_thread is None:
+                    self._env_index_thread = threading.Thread(
+                        target=self._sync_env_index,
+                        name="env-for-key-sync",
+                        daemon=True,
+                    )
+                    self._env_index_thread.start()
+
+        return self._env_index if self._env_index_version is not None else None
+
+    def _sync_env_index(self):
+        from runhouse.resources.kvstores.sorted_key_dict import SortedKeyDict
+
+        version = None
+        while True:
+            try:
+                new_version, changes = ray.get(
+                    self._env_for_key.changes_since.remote(version)
+                )
+            except AttributeError:
+                # The index actor was started by an older version of Runhouse, so we can't keep a replica of it
+                logger.debug("env_for_key actor does not support syncing changes")
+                return
+            except Exception as e:
+                logger.warning(
+                    f"Lost sync with the env_for_key index, looking up keys in the actor until it's restored: {e}"
+                )
+                self._env_index_version = None
+                self._env_index_cleared = 0
+                version = None
+                time.sleep(self.ENV_INDEX_RETRY_INTERVAL)
+                continue
+
+            with self._env_index_lock:
+                if new_version < self._env_index_cleared:
+                    # Changes from before we cleared the index, the next sync will be past the clear
+                    version = new_version
+                    continue
+
+                # Our own writes after this version haven't reached the replica yet, so don't overwrite them
+                pending = {
+                    key: env
+                    for key, (write_version, env) in self._env_index_writes.items()
+                    if write_version > new_version
+                }
+                self._env_index_writes = {
+                    key: write
+                    for key, write in self._env_index_writes.items()
+                    if key in pending
+                }
+
+                if isinstance(changes, dict):
+                    index = SortedKeyDict(changes)
+                    changes = list(pending.items())
+                else:
+                    index = self._env_index
+                    changes = [(key, env) for key, env in changes if key not in pending]
+
+                for key, env in changes:
+                    if env is None:
+                        index.pop(key, None)
+                    else:
+                        index[key] = env
+                self._env_index = index
+                self._env_index_version = new_version
+            version = new_version
+
+    def _write_env_index(self, envs: Dict[str, Optional[str]], version):
+        """Apply writes we made to the env_for_key actor to the local replica, where an env of None means the key
+        was removed."""
+        if not isinstance(version, int) or self._env_index_version is None:
+            return
+        with self._env_index_lock:
+            for key, env in envs.items():
+                self._env_index_writes[key] = (version, env)
+                if env is None:
+                    self._env_index.pop(key, None)
+                else:
+                    self._env_index[key] = env
+
+    def _scan_local_env_index(self, prefix, limit, cursor) -> Optional[List[Any]]:
+        index = self._local_env_index()
+        if index is None:
+            return None
+        # The replica is updated from other threads as it syncs, so copy out of it under the lock
+        with self._env_index_lock:
+            if prefix is None and limit is None and cursor is None:
+                return list(index.keys())
+            return index.scan(prefix=prefix, limit=limit, cursor=cursor)
+
+    def keys(
+        self,
+        prefix: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ):
+        """Keys across the cluster, not only in this process. If a ``prefix``, ``limit`` or ``cursor`` (the last
+        key of the previous page) is given, only the matching keys are listed, in sorted order."""
+        keys = self._scan_local_env_index(prefix, limit, cursor)
+        if keys is not None:
+            return keys
+        return self.call_kv_method(self._env_for_key, "keys", prefix, limit, cursor)
+
+    async def keys_async(
+        self,
+        prefix: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ):
+        keys = self._scan_local_env_index(prefix, limit, cursor)
+        if keys is not None:
+            return keys
+        return await self.call_kv_method_async(
+            self._env_for_key, "keys", prefix, limit, cursor
+        )
 
     def get_env(self, key):
+        # Keys missing from the replica may have only just been put, so double check with the actor
+        env = (self._local_env_index() or {}).get(key)
+        if env is not None:
+            return env
         return self.call_kv_method(self._env_for_key, "get", key, None)
 
+    async def get_env_async(self, key):
+        env = (self._local_env_index() or {}).get(key)
+        if env is not None:
+            return env
+        return await self.call_kv_method_async(self._env_for_key, "get", key, None)
+
+    def get_envs(self, keys: List[str]) -> Dict[str, str]:
+        """Look up which env each of the keys lives in, omitting keys which aren't in the object store."""
+        index = self._local_env_index() or {}
+        envs = {key: index[key] for key in keys if key in index}
+        missing = [key for key in keys if key not in envs]
+        if missing:
+            envs.update(self.call_kv_method(self._env_for_key, "get_many", missing))
+        return envs
+
+    async def get_envs_async(self, keys: List[str]) -> Dict[str, str]:
+        index = self._local_env_index() or {}
+        envs = {key: index[key] for key in keys if key in index}
+        missing = [key for key in keys if key not in envs]
+        if missing:
+            envs.update(
+                await self.call_kv_method_async(self._env_for_key, "get_many", missing)
+            )
+        return envs
+
     def put_env(self, key, value):
-        return self.call_kv_method(self._env_for_key, "put", key, value)
+        version = self.call_kv_method(self._env_for_key, "put", key, value)
+        self._write_env_index({key: value}, version)
 
-    def put(self, key: str, value: Any, env=None):
+    def put(self, key: str, value: Any, env=None, snapshot: bool = False):
+        # If snapshot is set and snapshots are enabled (see `set_name`), the key is snapshotted to be restored after
+        # a restart. This is for keys put explicitly by the user, rather than e.g. run results or cached calls.
         # First check if it's in the Python kv store
         if env and not self.servlet_name == env:
             servlet = self.get_env_servlet(env)
@@ -126,22 +609,90 @@ class ObjStore:
                 else:
                     servlet.put(key, value, _intra_cluster=True)
 
-        self.call_kv_method(self._kv_store, "put", key, value)
+        self._put_local(key, value)
         self.put_env(key, self.servlet_name)
+        self._snapshot_put({key: value}, snapshot)
+
+    def _put_local(self, key, value):
+        self.call_kv_method(self._kv_store, "put", key, value)
+        # Drop any ref previously put for the key with `put_obj_ref`
+        self.call_kv_method(self._kv_store, "pop", self._ref_key(key), None)
+
+    def _should_share(self, value: Any) -> bool:
+        from runhouse.resources.kvstores.tiered_dict import estimate_size
+        from runhouse.resources.resource import Resource
+
+        # Resources are kept as live objects (e.g. modules with state), so are never shared as copies
+        return (
+            not isinstance(value, Resource)
+            and ray.is_initialized()
+            and estimate_size(value) >= self.SHARED_OBJECT_THRESHOLD
+        )
+
+    def put_many(self, mapping: Dict[str, Any], env=None, snapshot: bool = False):
+        """Put many objects at once, with one call to the env's servlet and to the env_for_key index. See `put`
+        for ``snapshot``."""
+        if env and not self.servlet_name == env:
+            servlet = self.get_env_servlet(env)
+            if servlet is not None:
+                if isinstance(servlet, ray.actor.ActorHandle):
+                    ray.get(servlet.put_many.remote(mapping, _intra_cluster=True))
+                else:
+                    servlet.put_many(mapping, _intra_cluster=True)
+
+        self.call_kv_method(self._kv_store, "put_many", mapping)
+        # Drop any refs previously put for the keys with `put_obj_ref`
+        self.call_kv_method(
+            self._kv_store, "pop_many", [self._ref_key(key) for key in mapping]
+        )
+        envs = {key: self.servlet_name for key in mapping}
+        version = self.call_kv_method(self._env_for_key, "put_many", envs)
+        self._write_env_index(envs, version)
+        self._snapshot_put(mapping, snapshot)
+
+    @staticmethod
+    def _ref_key(key) -> str:
+        return f"{key}_ref"
 
     def put_obj_ref(self, key, obj_ref):
         # Need to wrap the obj_ref in a dict so ray doesn't dereference it
         # FYI: https://docs.ray.io/en/latest/ray-core/objects.html#closure-capture-of-objects
-        self.call_kv_method(self._kv_store, "put", key + "_ref", [obj_ref])
+        self.call_kv_method(self._kv_store, "put", self._ref_key(key), [obj_ref])
+        self.call_kv_method(self._kv_store, "pop", key, None)
         self.put_env(key, self.servlet_name)
 
     def rename(self, old_key, new_key, default=None):
+        if self._unrestored:
+            self._restore([old_key])
         # By passing default, we don't throw an error if the key is not found
-        self.call_kv_method(self._kv_store, "rename_key", old_key, new_key, default)
-        self.call_kv_method(self._env_for_key, "rename_key", old_key, new_key, default)
+        if self.get_obj_ref(old_key) is None:
+            self.call_kv_method(self._kv_store, "pop", self._ref_key(new_key), None)
+            self.call_kv_method(self._kv_store, "rename_key", old_key, new_key, default)
+        else:
+            # Put with `put_obj_ref`, so there's only the ref
+            self.call_kv_method(
+                self._kv_store,
+                "rename_key",
+                self._ref_key(old_key),
+                self._ref_key(new_key),
+            )
+            self.call_kv_method(self._kv_store, "pop", new_key, None)
+        env = self.get_env(old_key)
+        version = self.call_kv_method(
+            self._env_for_key, "rename_key", old_key, new_key, default
+        )
+        if env is not None or default is not None:
+            self._write_env_index({old_key: None, new_key: env or default}, version)
+        if self._snapshot is not None:
+            self._unrestored.discard(new_key)
+            self._snapshot.rename(old_key, new_key)
 
     def get_obj_ref(self, key):
-        return self.call_kv_method(self._kv_store, "get", key + "_ref", [None])[0]
+        return self.call_kv_method(self._kv_store, "get", self._ref_key(key), [None])[0]
+
+    def _get_shared(self, key) -> Optional[SharedObject]:
+        ref = self.get_obj_ref(key)
+        return SharedObject(ref) if isinstance(ref, ray.ObjectRef) else None
 
     @staticmethod
     def get_env_servlet(env_name):
@@ -161,15 +712,27 @@ class ObjStore:
         key: str,
         default: Optional[Any] = None,
         check_other_envs: bool = True,
+        resolve_refs: bool = True,
     ):
         # TODO change this to look up which env the object lives in by default, with an opt out
         # First check if it's in the Python kv store
+        # If resolve_refs is False, large values are published to Ray's object store and returned as SharedObjects
+        # (e.g. for servlets to return to each other), otherwise the live value is returned
+        if self._unrestored:
+            self._restore([key])
         try:
             val = self.call_kv_method(self._kv_store, "get", key, KeyError)
+            if not resolve_refs and self._should_share(val):
+                return SharedObject(ray.put(val))
             return val
         except KeyError as e:
             key_err = e
 
+        # Put with `put_obj_ref`, so there's only the ref
+        shared = self._get_shared(key)
+        if shared is not None:
+            return ray.get(shared.ref) if resolve_refs else shared
+
         if not check_other_envs:
             if default == KeyError:
                 raise key_err
@@ -191,47 +754,174 @@ class ObjStore:
 
         try:
             if isinstance(servlet, ray.actor.ActorHandle):
-                return ray.get(servlet.get.remote(key, _intra_cluster=True))
+                val = ray.get(servlet.get.remote(key, _intra_cluster=True))
             else:
-                return servlet.get(key, _intra_cluster=True, timeout=None)
+                val = servlet.get(key, _intra_cluster=True, timeout=None)
+            if isinstance(val, SharedObject) and resolve_refs:
+                # Read from shared memory rather than having the servlet pickle the value back to us
+                return ray.get(val.ref)
+            return val
         except KeyError as e:
             if default == KeyError:
                 raise e
 
         return default
 
+    def get_many(
+        self, keys: List[str], check_other_envs: bool = True, resolve_refs: bool = True
+    ) -> Dict[str, Any]:
+        """Get many objects at once, omitting keys which aren't found. Objects in other envs are fetched with one
+        call to each env's servlet, and objects in Ray's object store with one ``ray.get``."""
+        if self._unrestored:
+            self._restore(keys)
+        found = self.call_kv_method(self._kv_store, "get_many", keys)
+        if not resolve_refs:
+            found.update(
+                {
+                    key: SharedObject(ray.put(val))
+                    for key, val in found.items()
+                    if self._should_share(val)
+                }
+            )
+        # Values put with `put_obj_ref` only have the ref
+        ref_keys = {self._ref_key(key): key for key in keys if key not in found}
+        if ref_keys:
+            refs = self.call_kv_method(self._kv_store, "get_many", list(ref_keys))
+            for ref_key, (ref,) in refs.items():
+                if isinstance(ref, ray.ObjectRef):
+                    found[ref_keys[ref_key]] = SharedObject(ref)
+        missing = [key for key in keys if key not in found]
+        if not missing or not check_other_envs:
+            return self._resolve_shared(found) if resolve_refs else found
+
+        keys_for_env = {}
+        for key, env in self.get_envs(missing).items():
+            if env != self.servlet_name:
+                keys_for_env.setdefault(env, []).append(key)
+
+        obj_refs = []
+        for env, env_keys in keys_for_env.items():
+            logger.info(f"Getting {len(env_keys)} keys from servlet {env}")
+            servlet = self.get_env_servlet(env)
+            if servlet is None:
+                continue
+            if isinstance(servlet, ray.actor.ActorHandle):
+                obj_refs.append(servlet.get_many.remote(env_keys, _intra_cluster=True))
+            else:
+                found.update(servlet.get_many(env_keys, _intra_cluster=True))
+        for env_found in ray.get(obj_refs):
+            found.update(env_found)
+        return self._resolve_shared(found) if resolve_refs else found
+
+    @staticmethod
+    def _resolve_shared(found: Dict[str, Any]) -> Dict[str, Any]:
+        shared = {
+            key: val.ref for key, val in found.items() if isinstance(val, SharedObject)
+        }
+        if shared:
+            found.update(zip(shared.keys(), ray.get(list(shared.values()))))
+        return found
+
     def get_list(self, keys: List[str], default: Optional[Any] = None):
-        return [self.get(key, default=default or key) for key in keys]
+        found = self.get_many(keys)
+        return [found.get(key, default or key) for key in keys]
 
     def get_obj_refs_list(self, keys: List):
-        return [
-            self.get(key, default=key) if isinstance(key, str) else key for key in keys
-        ]
+        found = self.get_many([key for key in keys if isinstance(key, str)])
+        return [found.get(key, key) if isinstance(key, str) else key for key in keys]
 
     def get_obj_refs_dict(self, d: Dict):
-        return {
-            k: self.get(v, default=v) if isinstance(v, str) else v for k, v in d.items()
-        }
+        found = self.get_many([v for v in d.values() if isinstance(v, str)])
+        return {k: found.get(v, v) if isinstance(v, str) else v for k, v in d.items()}
 
     def pop_env(self, key: str, default: Optional[Any] = None):
-        self.call_kv_method(self._env_for_key, "pop", key, default)
+        version = self.call_kv_method(self._env_for_key, "pop", key, default)
+        self._write_env_index({key: None}, version)
 
     def delete(self, key: Union[str, List[str]]):
         if isinstance(key, str):
             key = [key]
-        for k in key:
-            self.pop(k, None)
-            self.pop_env(k, None)
+        self.delete_many(key)
+
+    def delete_many(self, keys: List[str], check_other_envs: bool = True):
+        """Delete many keys at once, with one call to each env's servlet holding some of the keys and one call to
+        the env_for_key index."""
+        if check_other_envs:
+            keys_for_env = {}
+            for key, env in self.get_envs(keys).items():
+                if env != self.servlet_name:
+                    keys_for_env.setdefault(env, []).append(key)
+
+            obj_refs = []
+            for env, env_keys in keys_for_env.items():
+                servlet = self.get_env_servlet(env)
+                if servlet is None:
+                    continue
+                if isinstance(servlet, ray.actor.ActorHandle):
+                    obj_refs.append(
+                        servlet.delete_obj.remote(env_keys, _intra_cluster=True)
+                    )
+                else:
+                    servlet.delete_obj(env_keys, _intra_cluster=True)
+            ray.get(obj_refs)
+
+        self.call_kv_method(
+            self._kv_store, "pop_many", keys + [self._ref_key(key) for key in keys]
+        )
+        version = self.call_kv_method(self._env_for_key, "pop_many", keys)
+        self._write_env_index({key: None for key in keys}, version)
+        self._snapshot_delete(keys)
+
+    async def delete_async(self, key: Union[str, List[str]]):
+        if isinstance(key, str):
+            key = [key]
+        self.call_kv_method(
+            self._kv_store, "pop_many", key + [self._ref_key(k) for k in key]
+        )
+        version = await self.call_kv_method_async(self._env_for_key, "pop_many", key)
+        self._write_env_index({k: None for k in key}, version)
+        self._snapshot_delete(key)
 
     def pop(self, key: str, default: Optional[Any] = None):
+        if self._unrestored:
+            self._restore([key])
+        self._snapshot_delete([key])
+        ref = self.call_kv_method(self._kv_store, "pop", self._ref_key(key), [None])[0]
+        if isinstance(ref, ray.ObjectRef) and not self.call_kv_method(
+            self._kv_store, "contains", key
+        ):
+            # Put with `put_obj_ref`, so there's only the ref
+            return ray.get(ref)
         return self.call_kv_method(self._kv_store, "pop", key, default)
 
     def clear_env(self):
-        self.call_kv_method(self._env_for_key, "clear")
+        version = self.call_kv_method(self._env_for_key, "clear")
+        if isinstance(version, int):
+            with self._env_index_lock:
+                # Look up keys in the actor until the replica has synced past the clear
+                self._env_index_cleared = version
+                self._env_index_version = None
 
     def clear(self):
         self.call_kv_method(self._kv_store, "clear")
         self.clear_env()
+        if self._snapshot is not None:
+            self._unrestored.clear()
+            self._snapshot.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Key count, memory and disk usage, spill/reload counters and per-key sizes of this process's store, and
+        its snapshot's stats if snapshots are enabled."""
+        stats = {
+            **self.call_kv_method(self._kv_store, "stats"),
+            "sizes": self.call_kv_method(self._kv_store, "sizes"),
+        }
+        if self._snapshot is not None:
+            stats["snapshot"] = {
+                **self._snapshot.stats(),
+                "unrestored": len(self._unrestored),
+            }
+        return stats
 
     def cancel(self, key: str, force: bool = False, recursive: bool = True):
         # TODO wire up properly
@@ -246,8 +936,15 @@ class ObjStore:
             self.cancel(key, force=force, recursive=recursive)
 
     def contains(self, key: str):
+        if key in (self._local_env_index() or {}):
+            return True
         return self.call_kv_method(self._env_for_key, "contains", key)
 
+    async def contains_async(self, key: str):
+        if key in (self._local_env_index() or {}):
+            return True
+        return await self.call_kv_method_async(self._env_for_key, "contains", key)
+
     def get_logfiles(self, key: str, log_type=None):
         # TODO remove
         # Info on ray logfiles: https://docs.ray.io/en/releases-2.2.0/ray-observability/ray-logging.html#id1
@@ -1,19 +1,25 @@
 import asyncio
+import concurrent.futures
 import inspect
 import json
 import logging
+import mmap
 import signal
+import tempfile
 import threading
 import time
 import traceback
+from collections import OrderedDict
 from pathlib import Path
 from typing import List, Union
 
 from sky.skylet.autostop_lib import set_last_active_time_to_now
 
-from runhouse.globals import configs, obj_store
+from runhouse.globals import call_cache, configs, obj_store
 
 from runhouse.resources.blobs import blob, Blob
+from runhouse.resources.hardware import _current_cluster
+from runhouse.resources.kvstores.tiered_dict import estimate_size
 from runhouse.resources.module import Module
 from runhouse.resources.provenance import run, RunStatus
 from runhouse.resources.queues import Queue
@@ -22,34 +28,136 @@ from runhouse.resources.resource import Resource
 from runhouse.rns.utils.names import _generate_default_name
 from runhouse.servers.http.http_utils import (
     b64_unpickle,
+    deserialize_data,
     Message,
     OutputType,
     pickle_b64,
     Response,
+    serialize_data,
 )
 
 logger = logging.getLogger(__name__)
 
 
+class StagedData:
+    """Buffer for call args uploaded in chunks (see `HTTPClient.upload_data`), which is kept in memory until
+    it passes `spill_threshold` bytes and then spilled to a temporary file."""
+
+    def __init__(self, spill_threshold):
+        self.spill_threshold = spill_threshold
+        self.size = 0
+        self.buf = bytearray()
+        self.file = None
+        self.last_write = time.time()
+
+    def write(self, chunk):
+        self.last_write = time.time()
+        self.size += len(chunk)
+        if self.file is None and self.size > self.spill_threshold:
+            self.file = tempfile.TemporaryFile()
+            self.file.write(self.buf)
+            self.buf = None
+        if self.file is not None:
+            self.file.write(chunk)
+        else:
+            self.buf += chunk
+
+    def read(self) -> Union[bytearray, memoryview]:
+        """Return the staged bytes as one buffer, which the args are then unpickled from in place. Spilled bytes
+        are memory-mapped rather than read back in, so arrays in the args are views onto the file, paged in as
+        they're used. The mapping is copy-on-write, so the arrays are writeable without changing the file."""
+        if self.file is None:
+            return self.buf
+        self.file.flush()
+        data = memoryview(mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_COPY))
+        # The mapping stays valid once the file is closed (and deleted), until the args are garbage collected
+        self.close()
+        return data
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
 class EnvServlet:
     MAX_MESSAGE_LENGTH = 1 * 1024 * 1024 * 1024  # 1 GB
     LOGGING_WAIT_TIME = 1.0
     SKY_YAML = str(Path("~/.sky/sky_ray.yml").expanduser())
     LOGS_DIR = ".rh/logs"
     RH_LOGFILE_PATH = Path.home() / LOGS_DIR
+    STAGING_SPILL_THRESHOLD = 256 * 1024 * 1024  # 256 MB
+    # Staged args which haven't been written to for this long are discarded, e.g. if the call never arrives
+    STAGING_TTL = 10 * 60
+    RESULTS_SWEEP_INTERVAL = 60
 
     def __init__(self, env_name, *args, **kwargs):
         self.env_name = env_name
 
-        obj_store.set_name(self.env_name)
+        cluster_config = _current_cluster("config") or {}
+        obj_store.set_name(
+            self.env_name,
+            memory_limit=cluster_config.get("obj_store_memory_limit"),
+            snapshots=cluster_config.get("obj_store_snapshots", False),
+            backend=cluster_config.get("obj_store_backend") or "memory",
+        )
+        obj_store.register_for_auth_updates()
+        call_cache.configure(
+            self.env_name,
+            max_age=cluster_config.get("call_cache_max_age"),
+            max_count=cluster_config.get("call_cache_max_count"),
+            max_bytes=cluster_config.get("call_cache_max_bytes"),
+        )
 
         self.output_types = {}
         self.thread_ids = {}
+        self.staged_data = {}
+
+        # Results of finished runs which the servlet may reclaim, oldest first, as key -> (finished time, size).
+        # Saved results, and keys the user has put, renamed or deleted themselves, aren't tracked.
+        self.results = OrderedDict()
+        self.results_lock = threading.Lock()
+        self.results_retention = {
+            "max_age": cluster_config.get("results_max_age"),
+            "max_count": cluster_config.get("results_max_count"),
+            "max_bytes": cluster_config.get("results_max_bytes"),
+        }
+        self.results_stats = {"sweeps": 0, "reclaimed": 0, "reclaimed_bytes": 0}
+        if any(limit is not None for limit in self.results_retention.values()):
+            threading.Thread(
+                target=self._sweep_results_forever,
+                name=f"{self.env_name}-results-sweeper",
+                daemon=True,
+            ).start()
+        # Notified whenever a call's result state changes, so `get` can wait on it rather than polling
+        self.results_updated = threading.Condition()
+
+        # Coroutine and async generator methods run on this long-lived event loop in its own thread, so they run
+        # concurrently with each other and can hold on to loop-bound resources (e.g. async clients) across calls
+        self.event_loop = asyncio.new_event_loop()
+        self.event_loop_thread = threading.Thread(
+            target=self.event_loop.run_forever,
+            name=f"{self.env_name}-event-loop",
+            daemon=True,
+        )
+        self.event_loop_thread.start()
+        self.running_coroutines = {}
 
     @staticmethod
     def register_activity():
         set_last_active_time_to_now()
 
+    def _run_coroutine(self, coro, key=None):
+        """Run a coroutine on the servlet's event loop and wait for its result. If a run key is given, the
+        coroutine can be cancelled with `cancel_run`."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.event_loop)
+        if key:
+            self.running_coroutines[key] = future
+        try:
+            return future.result()
+        finally:
+            if key:
+                self.running_coroutines.pop(key, None)
+
     def put_resource(self, message: Message):
         self.register_activity()
         try:
@@ -81,7 +189,8 @@ class EnvServlet:
                 resource.rename(name)
             else:
                 resource.name = name
-            obj_store.put(resource.name, resource)
+            obj_store.put(resource.name, resource, snapshot=True)
+            self._forget_results([resource.name])
 
             self.register_activity()
             # Return the name in case we had to set it
@@ -95,6 +204,50 @@ class EnvServlet:
                 output_type=OutputType.EXCEPTION,
             )
 
+    def _notify_results(self):
+        """Wake up any `get` calls waiting on a result, e.g. after a call is stored, streams a value, or ends."""
+        with self.results_updated:
+            self.results_updated.notify_all()
+
+    def _wait_for_results(self, predicate):
+        """Wait until predicate is true, for at most LOGGING_WAIT_TIME so the server can stream logs meanwhile."""
+        with self.results_updated:
+            return self.results_updated.wait_for(
+                predicate, timeout=self.LOGGING_WAIT_TIME
+            )
+
+    def _result_ready(self, key, result_queue: Queue):
+        status = (
+            result_queue.provenance.status
+            if result_queue.provenance
+            else RunStatus.NOT_STARTED
+        )
+        if status in [RunStatus.COMPLETED, RunStatus.ERROR, RunStatus.CANCELLED]:
+            return True
+        # We need the output type to return a value, which isn't set until a generator starts or the call ends
+        return key in self.output_types and not result_queue.empty()
+
+    def stage_data(self, key, chunk):
+        """Append a chunk of uploaded call args to the staging buffer for key."""
+        self.register_activity()
+        if key not in self.staged_data:
+            self._discard_stale_staged_data()
+            self.staged_data[key] = StagedData(self.STAGING_SPILL_THRESHOLD)
+        self.staged_data[key].write(chunk)
+
+    def _discard_stale_staged_data(self):
+        """Discard uploads past the `STAGING_TTL` whose call never arrived, checked whenever a new upload starts."""
+        cutoff = time.time() - self.STAGING_TTL
+        for key, staged in list(self.staged_data.items()):
+            if staged.last_write < cutoff:
+                logger.info(f"Discarding args uploaded for {key}, as no call used them")
+                self.discard_staged_data(key)
+
+    def discard_staged_data(self, key):
+        staged = self.staged_data.pop(key, None)
+        if staged:
+            staged.close()
+
     def call_module_method(
         self,
         module_name,
@@ -118,6 +271,7 @@ class EnvServlet:
             # Remove output types from previous runs
             self.output_types.pop(message.key, None)
             result_resource = Queue(name=message.key, persist=persist)
+            result_resource.subscribe(lambda _: self._notify_results())
             result_resource.provenance = run(
                 name=message.key,
                 log_dest="file" if message.stream_logs else None,
@@ -129,16 +283,13 @@ class EnvServlet:
             if message.save:
                 result_resource.save()
 
-            args, kwargs = b64_unpickle(message.data) if message.data else ([], {})
-            # Resolve any resources which need to be resolved
-            args = [
-                arg.fetch() if (isinstance(arg, Module) and arg._resolve) else arg
-                for arg in args
-            ]
-            kwargs = {
-                k: v.fetch() if (isinstance(v, Module) and v._resolve) else v
-                for k, v in kwargs.items()
-            }
+            data = message.data
+            data_key = getattr(message, "data_key", None)
+            if data_key:
+                # Args were uploaded ahead of the call in chunks
+                if data_key not in self.staged_data:
+                    raise KeyError(f"No uploaded data found for key {data_key}")
+                data = self.staged_data.pop(data_key).read()
             module = obj_store.get(module_name, default=KeyError)
 
             # If method_name is None, return the module itself as this is a "get" request
@@ -174,31 +325,73 @@ class EnvServlet:
                 )
                 callable_method = False
 
+            # Results of deterministic calls may already be cached, see `CallCache`. The key is computed from the
+            # pickled args, so a hit doesn't pay for unpickling them or fetching the resources in them.
+            cache_key = (
+                call_cache.key_for(
+                    module_name,
+                    module,
+                    method_name,
+                    data,
+                    getattr(message, "cache_key", None),
+                )
+                if callable_method and self._should_cache(module, method_name, message)
+                else None
+            )
+            cached, result = (
+                call_cache.lookup(cache_key) if cache_key else (False, None)
+            )
+
+            args, kwargs = [], {}
+            if not cached:
+                # Args are a bytearray with out-of-band buffers if the client sent a binary body (see `pickle_oob`)
+                args, kwargs = deserialize_data(data) if data else ([], {})
+                # Resolve any resources which need to be resolved
+                args = [
+                    arg.fetch() if (isinstance(arg, Module) and arg._resolve) else arg
+                    for arg in args
+                ]
+                kwargs = {
+                    k: v.fetch() if (isinstance(v, Module) and v._resolve) else v
+                    for k, v in kwargs.items()
+                }
+
             if not callable_method and kwargs and "new_value" in kwargs:
                 # If new_value was passed, that means we're setting a property
                 setattr(module, method_name, kwargs["new_value"])
                 result_resource.pin()
                 self.output_types[message.key] = OutputType.SUCCESS
                 result_resource.provenance.__exit__(None, None, None)
+                self._notify_results()
                 return Response(output_type=OutputType.SUCCESS)
 
             if persist or message.stream_logs:
                 result_resource.pin()
+                self._notify_results()
 
-            # If method is a property, `method = getattr(module, method_name, None)` above already
-            # got our result
-            if inspect.iscoroutinefunction(method):
-                # If method is a coroutine, we need to await it
-                logger.debug(
-                    f"{self.env_name} servlet: Method {method_name} on module {module_name} is a coroutine"
+            if cached:
+                logger.info(
+                    f"{self.env_name} servlet: Returning cached result of {module_name}.{method_name}"
                 )
-                result = asyncio.run(method(*args, **kwargs))
             else:
+                # If method is a property, `method = getattr(module, method_name, None)` above already
+                # got our result
                 result = method(*args, **kwargs) if callable_method else method
 
-            # TODO do we need the branch above if we do this?
-            if inspect.iscoroutine(result):
-                result = asyncio.run(result)
+                if inspect.iscoroutine(result):
+                    # If method is a coroutine, we need to await it
+                    logger.debug(
+                        f"{self.env_name} servlet: Method {method_name} on module {module_name} is a coroutine"
+                    )
+                    result = self._run_coroutine(result, message.key)
+
+                # Generators can only be consumed once, and resources returned are renamed to the run key below
+                if cache_key and not (
+                    inspect.isgenerator(result)
+                    or inspect.isasyncgen(result)
+                    or isinstance(result, Resource)
+                ):
+                    call_cache.store(cache_key, result)
 
             if inspect.isgenerator(result) or inspect.isasyncgen(result):
                 result_resource.pin()
@@ -207,13 +400,16 @@ class EnvServlet:
                     f"Streaming back results of generator {module_name}.{method_name}"
                 )
                 self.output_types[message.key] = OutputType.RESULT_STREAM
+                self._notify_results()
                 if inspect.isasyncgen(result):
-                    while True:
-                        try:
+
+                    async def stream_results():
+                        # Drive the whole generator on the event loop, rather than hopping to it for each item
+                        async for val in result:
                             self.register_activity()
-                            result_resource.put(asyncio.run(result.__anext__()))
-                        except StopAsyncIteration:
-                            break
+                            result_resource.put(val)
+
+                    self._run_coroutine(stream_results(), message.key)
                 else:
                     for val in result:
                         self.register_activity()
@@ -222,6 +418,7 @@ class EnvServlet:
 
                 # Set run status to COMPLETED to indicate end of stream
                 result_resource.provenance.__exit__(None, None, None)
+                self._notify_results()
 
                 # Resave with new status
                 if message.save:
@@ -253,7 +450,9 @@ class EnvServlet:
                         # we can return the result to the user immediately
                         result_resource.provenance.__exit__(None, None, None)
                         return Response(
-                            data=pickle_b64(result),
+                            data=serialize_data(
+                                result, getattr(message, "serialization", "json")
+                            ),
                             output_type=OutputType.RESULT,
                         )
                     # Put the result in the queue so we can retrieve it once
@@ -262,10 +461,20 @@ class EnvServlet:
                 # If not a generator, the method was already called above and completed
                 self.output_types[message.key] = OutputType.RESULT
                 result_resource.provenance.__exit__(None, None, None)
+                self._notify_results()
 
                 if message.save:
                     result_resource.save()
                 self.register_activity()
+        except concurrent.futures.CancelledError:
+            # The run's coroutine was cancelled with `cancel_run`, which isn't an error
+            logger.info(f"{self.env_name} servlet: Run {message.key} was cancelled")
+            self.register_activity()
+            self.output_types[message.key] = OutputType.CANCELLED
+            result_resource.provenance.status = RunStatus.CANCELLED
+            result_resource.pin()
+            result_resource.provenance.__exit__(None, None, None)
+            self._notify_results()
         except Exception as e:
             logger.exception(e)
             self.register_activity()
@@ -278,19 +487,126 @@ class EnvServlet:
             result_resource.provenance.__exit__(
                 type(e), e, traceback.format_exc()
             )  # TODO use format_tb instead?
+            self._notify_results()
+        finally:
+            self.thread_ids.pop(message.key, None)
+            # Results which were pinned to the object store (rather than returned directly) can be reclaimed once
+            # they're past the retention limits, unless they were saved
+            if message.key in self.output_types and not message.save:
+                self._record_result(message.key, result_resource)
+
+    @staticmethod
+    def _should_cache(module, method_name, message) -> bool:
+        """Whether to serve a call from the cache: if the call has a ``cache_key``, or is a call to a Function
+        created with ``cache=True``."""
+        from runhouse.resources.function import Function
+
+        if getattr(message, "cache_key", None) is not None:
+            return True
+        return (
+            isinstance(module, Function)
+            and method_name == "call"
+            and getattr(module, "cache", False)
+        )
 
-    def get(self, key, remote=False, stream=False, timeout=None, _intra_cluster=False):
+    def _record_result(self, key, result_resource):
+        if all(limit is None for limit in self.results_retention.values()):
+            # No sweeper is running to reclaim results, so there's no need to track them
+            return
+        # Results are only sized if there's a limit on their total bytes
+        size = (
+            estimate_size(result_resource)
+            if self.results_retention["max_bytes"] is not None
+            else 0
+        )
+        with self.results_lock:
+            self.results.pop(key, None)
+            self.results[key] = (time.time(), size)
+
+    def _forget_results(self, keys):
+        """Stop tracking keys for reclaiming, e.g. because the user has put, renamed or deleted them."""
+        with self.results_lock:
+            for key in keys:
+                self.results.pop(key, None)
+
+    def _sweep_results(self):
+        """Reclaim finished results past the max age, and then the oldest results past the max count or total
+        bytes, deleting them from the object store along with the servlet's state for their runs."""
+        max_age = self.results_retention["max_age"]
+        max_count = self.results_retention["max_count"]
+        max_bytes = self.results_retention["max_bytes"]
+        with self.results_lock:
+            total_bytes = sum(size for _, size in self.results.values())
+            expired = []
+            for key, (finished, size) in self.results.items():
+                if (
+                    (max_age is not None and time.time() - finished > max_age)
+                    or (
+                        max_count is not None
+                        and len(self.results) - len(expired) > max_count
+                    )
+                    or (max_bytes is not None and total_bytes > max_bytes)
+                ):
+                    expired.append(key)
+                    total_bytes -= size
+                else:
+                    # Results are oldest first, so the rest are within the limits
+                    break
+            reclaimed_bytes = sum(self.results.pop(key)[1] for key in expired)
+
+        if expired:
+            obj_store.delete_many(expired, check_other_envs=False)
+            for key in expired:
+                self.output_types.pop(key, None)
+            logger.info(
+                f"Reclaimed {len(expired)} results ({reclaimed_bytes} bytes) in {self.env_name} servlet"
+            )
+        self.results_stats["sweeps"] += 1
+        self.results_stats["reclaimed"] += len(expired)
+        self.results_stats["reclaimed_bytes"] += reclaimed_bytes
+
+    def _sweep_results_forever(self):
+        while True:
+            time.sleep(self.RESULTS_SWEEP_INTERVAL)
+            try:
+                self._sweep_results()
+            except Exception as e:
+                logger.exception(e)
+
+    def get(
+        self,
+        key,
+        remote=False,
+        stream=False,
+        timeout=None,
+        _intra_cluster=False,
+        serialization="json",
+        wait=False,
+    ):
         """Get an object from the servlet's object store.
 
         Args:
             key (str): The key of the object to get.
             remote (bool): Whether to return the object or it's config to construct a remote object.
             stream (bool): Whether to stream results as available (if the key points to a queue).
+            serialization (str): "json" to return pickle_b64 strings, or "pickle" to return raw pickled bytes
+                for the binary framed protocol.
+            wait (bool): Whether to wait for a call in progress to store the key, rather than raising a KeyError
+                if it's not there yet. Returns None if it isn't stored within LOGGING_WAIT_TIME.
         """
         self.register_activity()
         try:
+            # The call producing this key may not have stored its result yet, so wait to be notified that it has
+            if wait:
+                if not self._wait_for_results(lambda: obj_store.contains(key)):
+                    return
+
+            # Other servlets get large values by their ref in Ray's object store, see `ObjStore.get`
             ret_obj = obj_store.get(
-                key, default=KeyError, check_other_envs=not _intra_cluster
+                key,
+                default=KeyError,
+                check_other_envs=not _intra_cluster,
+                resolve_refs=not _intra_cluster,
             )
             logger.debug(
                 f"Servlet {self.env_name} got object of type "
@@ -303,6 +619,16 @@ class EnvServlet:
 
             # If the request doesn't want a stream, we can just return the queue object in same way as any other, below
             if isinstance(ret_obj, Queue) and stream:
+                # If we're waiting for a result, wait to be notified that the call has put one in the queue or
+                # finished (or for a remote request, that we know its output type). If that doesn't happen within
+                # LOGGING_WAIT_TIME, return None so the server can stream the logs and ask again.
+                if ret_obj.empty():
+                    if not self._wait_for_results(
+                        lambda: self._result_ready(key, ret_obj)
+                        or (remote and key in self.output_types)
+                    ):
+                        return
+
                 if remote and self.output_types.get(key) in [
                     OutputType.RESULT_STREAM,
                     OutputType.SUCCESS_STREAM,
@@ -316,22 +642,13 @@ class EnvServlet:
                         output_type=OutputType.CONFIG,
                     )
 
-                # If we're waiting for a result, this will block until one is available, which will either
-                # cause the server's ray.get to timeout so it can try again, or return None as soon as the result is
-                # available so the server can try requesting again now that it's ready.
                 if ret_obj.empty():
                     if (
-                        not ret_obj.provenance
-                        or ret_obj.provenance.status == RunStatus.NOT_STARTED
+                        obj_store.get(key, default=None, check_other_envs=False)
+                        is not ret_obj
                     ):
-                        while key not in self.output_types:
-                            time.sleep(0.1)
-                        return
-
-                    # This allows us to return the results of a generator as they become available, rather than
-                    # waiting a full second for the ray.get in the server to timeout before trying again.
-                    if ret_obj.provenance.status == RunStatus.RUNNING:
-                        time.sleep(0.1)
+                        # The result was stored as a different resource (e.g. a Blob if it's being saved or
+                        # returned as a remote), so return None for the server to ask for that instead
                         return
 
                     if ret_obj.provenance.status == RunStatus.COMPLETED:
@@ -345,20 +662,27 @@ class EnvServlet:
 
                     if ret_obj.provenance.status == RunStatus.ERROR:
                         return Response(
-                            error=pickle_b64(ret_obj.provenance.error),
-                            traceback=pickle_b64(ret_obj.provenance.traceback),
+                            error=serialize_data(
+                                ret_obj.provenance.error, serialization
+                            ),
+                            traceback=serialize_data(
+                                ret_obj.provenance.traceback, serialization
+                            ),
                             output_type=OutputType.EXCEPTION,
                         )
 
                     if ret_obj.provenance.status == RunStatus.CANCELLED:
                         return Response(output_type=OutputType.CANCELLED)
 
+                    # Still running (e.g. we were only waiting for the output type), so ask again
+                    return
+
                 res = ret_obj.get(block=True, timeout=timeout)
                 # There's no OutputType.EXCEPTION case to handle here, because if an exception were thrown the
                 # provenance.status would be RunStatus.ERROR, and we want to continue retrieving results until the
                 # queue is empty, and then will return the exception and traceback in the empty case above.
                 return Response(
-                    data=pickle_b64(res),
+                    data=serialize_data(res, serialization),
                     output_type=self.output_types[key],
                 )
 
@@ -376,8 +700,10 @@ class EnvServlet:
 
                 if ret_obj.provenance and ret_obj.provenance.status == RunStatus.ERROR:
                     return Response(
-                        error=pickle_b64(ret_obj.provenance.error),
-                        traceback=pickle_b64(ret_obj.provenance.traceback),
+                        error=serialize_data(ret_obj.provenance.error, serialization),
+                        traceback=serialize_data(
+                            ret_obj.provenance.traceback, serialization
+                        ),
                         output_type=OutputType.EXCEPTION,
                     )
 
@@ -393,8 +719,10 @@ class EnvServlet:
             if isinstance(ret_obj, Resource) and ret_obj.provenance:
                 if ret_obj.provenance.status == RunStatus.ERROR:
                     return Response(
-                        error=pickle_b64(ret_obj.provenance.error),
-                        traceback=pickle_b64(ret_obj.provenance.traceback),
+                        error=serialize_data(ret_obj.provenance.error, serialization),
+                        traceback=serialize_data(
+                            ret_obj.provenance.traceback, serialization
+                        ),
                         output_type=OutputType.EXCEPTION,
                     )
                 # Includes the case where the user called a method with remote or save, where even if the original
@@ -403,7 +731,7 @@ class EnvServlet:
                 # so it'll still be returned unwrapped.
                 if ret_obj.provenance.status == RunStatus.COMPLETED:
                     return Response(
-                        data=pickle_b64(ret_obj),
+                        data=serialize_data(ret_obj, serialization),
                         output_type=OutputType.RESULT,
                     )
 
@@ -416,7 +744,7 @@ class EnvServlet:
                 # created immediately), the ret_obj wouldn't be found in the obj_store.
 
             return Response(
-                data=pickle_b64(ret_obj),
+                data=serialize_data(ret_obj, serialization),
                 output_type=OutputType.RESULT,
             )
         except Exception as e:
@@ -424,8 +752,8 @@ class EnvServlet:
                 raise e
 
             return Response(
-                error=pickle_b64(e),
-                traceback=pickle_b64(traceback.format_exc()),
+                error=serialize_data(e, serialization),
+                traceback=serialize_data(traceback.format_exc(), serialization),
                 output_type=OutputType.EXCEPTION,
             )
 
@@ -442,7 +770,8 @@ class EnvServlet:
             obj = b64_unpickle(value)
         logger.info(f"Message received from client to put object: {key}")
         try:
-            obj_store.put(key, obj)
+            obj_store.put(key, obj, snapshot=True)
+            self._forget_results([key])
             return Response(output_type=OutputType.SUCCESS)
         except Exception as e:
             logger.exception(e)
@@ -453,6 +782,45 @@ class EnvServlet:
                 output_type=OutputType.EXCEPTION,
             )
 
+    def put_many(self, mapping, _intra_cluster=False):
+        self.register_activity()
+        if not _intra_cluster:
+            mapping = b64_unpickle(mapping)
+        logger.info(f"Message received from client to put {len(mapping)} objects")
+        try:
+            obj_store.put_many(mapping, snapshot=True)
+            self._forget_results(mapping)
+            return Response(output_type=OutputType.SUCCESS)
+        except Exception as e:
+            logger.exception(e)
+            self.register_activity()
+            return Response(
+                error=pickle_b64(e),
+                traceback=pickle_b64(traceback.format_exc()),
+                output_type=OutputType.EXCEPTION,
+            )
+
+    def get_many(self, keys: List[str], _intra_cluster=False):
+        self.register_activity()
+        if _intra_cluster:
+            return obj_store.get_many(keys, check_other_envs=False, resolve_refs=False)
+        logger.info(f"Message received from client to get {len(keys)} objects")
+        try:
+            # The server only sends us the keys which live in this env
+            found = obj_store.get_many(keys, check_other_envs=False)
+            return Response(
+                data={key: pickle_b64(value) for key, value in found.items()},
+                output_type=OutputType.RESULT_DICT,
+            )
+        except Exception as e:
+            logger.exception(e)
+            self.register_activity()
+            return Response(
+                error=pickle_b64(e),
+                traceback=pickle_b64(traceback.format_exc()),
+                output_type=OutputType.EXCEPTION,
+            )
+
     def rename_object(self, message: Message):
         self.register_activity()
         # We may not want to deserialize the object here in case the object requires dependencies
@@ -463,6 +831,7 @@ class EnvServlet:
         )
         try:
             obj_store.rename(old_key, new_key)
+            self._forget_results([old_key, new_key])
             return Response(output_type=OutputType.SUCCESS)
         except Exception as e:
             logger.exception(e)
@@ -476,16 +845,17 @@ class EnvServlet:
     def delete_obj(self, message: Union[Message, List], _intra_cluster=False):
         self.register_activity()
         keys = b64_unpickle(message.data) if not _intra_cluster else message
-        logger.info(f"Message received from client to delete keys: {keys or 'all'}")
+        logger.info(
+            f"Message received from client to delete {len(keys) if keys else 'all'} keys"
+        )
         try:
-            cleared = []
             if keys:
-                for pin in keys:
-                    obj_store.delete(pin)
-                    cleared.append(pin)
+                obj_store.delete_many(keys, check_other_envs=not _intra_cluster)
+                cleared = list(keys)
             else:
                 cleared = list(obj_store.keys())
                 obj_store.clear()
+            self._forget_results(cleared)
             return Response(data=pickle_b64(cleared), output_type=OutputType.RESULT)
         except Exception as e:
             logger.exception(e)
@@ -504,6 +874,16 @@ class EnvServlet:
         logger.info(f"Message received from client to cancel runs: {message.key}")
 
         def kill_thread(key, sigterm=False):
+            # Coroutines run on the event loop rather than in the call's thread, so cancel them there
+            future = self.running_coroutines.get(key)
+            if future is not None:
+                logging.info(f"Cancelling coroutine for run {key}")
+                if obj_store.contains(key):
+                    obj_store.get(key).provenance.status = RunStatus.CANCELLED
+                future.cancel()
+                self._notify_results()
+                return
+
             thread_id = self.thread_ids.get(key)
             if not thread_id:
                 return
@@ -525,11 +905,12 @@ class EnvServlet:
                 if obj_store.contains(key):
                     obj = obj_store.get(key)
                     obj.provenance.status = RunStatus.CANCELLED
+                    self._notify_results()
             self.thread_ids.pop(thread_id, None)
 
         try:
             if message.key == "all":
-                for key in self.thread_ids:
+                for key in list(self.thread_ids):
                     kill_thread(key, force)
             else:
                 kill_thread(message.key, force)
@@ -544,11 +925,33 @@ class EnvServlet:
                 output_type=OutputType.EXCEPTION,
             )
 
-    def get_keys(self):
+    def invalidate_auth_cache(self, token_hash=None):
+        obj_store.invalidate_user_resources(token_hash)
+
+    def get_keys(self, prefix=None, limit=None, cursor=None):
         self.register_activity()
-        keys: list = list(obj_store.keys())
+        keys: list = list(obj_store.keys(prefix=prefix, limit=limit, cursor=cursor))
         return Response(data=pickle_b64(keys), output_type=OutputType.RESULT)
 
+    def get_obj_store_stats(self):
+        self.register_activity()
+        with self.results_lock:
+            results = {
+                "tracked": len(self.results),
+                "tracked_bytes": sum(size for _, size in self.results.values()),
+            }
+        results.update(self.results_stats)
+        return Response(
+            data=pickle_b64(
+                {
+                    **obj_store.stats(),
+                    "results": results,
+                    "call_cache": call_cache.stats(),
+                }
+            ),
+            output_type=OutputType.RESULT,
+        )
+
     def add_secrets(self, message: Message):
         from runhouse import Secrets
 
@@ -597,8 +1000,12 @@ class EnvServlet:
         serialization="json",
         token_hash=None,
         den_auth=False,
+        data=None,
     ):
         self.register_activity()
+        if data is not None:
+            # Args sent pickled rather than as json, e.g. in a batch call
+            args, kwargs = deserialize_data(data)
         module = obj_store.get(module_name, default=KeyError)
         if den_auth:
             resource_uri = (
@@ -612,6 +1019,17 @@ class EnvServlet:
         if method:
             fn = getattr(module, method)
             result = fn(*(args or []), **(kwargs or {}))
+            if inspect.iscoroutine(result):
+                result = self._run_coroutine(result)
+            if serialization != "None" and (
+                inspect.isgenerator(result) or inspect.isasyncgen(result)
+            ):
+                # Only `call_module_method` streams back a generator's results, a call here (e.g. in a batch)
+                # would fail to serialize it
+                raise TypeError(
+                    f"{module_name}.{method} returned a generator, whose results can't be returned from this "
+                    "call (e.g. in a batch). Call the method on its own to stream its results."
+                )
         else:
             result = module
 
@@ -0,0 +1,241 @@
+import logging
+import os
+import pickle
+import struct
+import threading
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotLog:
+    """Durable snapshot of an object store's keys in a local directory, so the store can be restored after the
+    server (and Ray) restarts. Each put value is pickled (with `pickle_oob`) when it's put, so later changes to
+    it don't leave a torn copy, and written to its own file, and puts, renames and deletes are recorded in an
+    append-only log of which file holds each key. Writes happen in a background thread in the order they're made,
+    so putting a large value doesn't wait on the disk. Once the log holds ``COMPACT_THRESHOLD`` records more than
+    there are live keys, it's rewritten with only the live keys.
+
+    A value which fails to pickle isn't snapshotted, and an error is logged. The key's previous snapshot (if any)
+    is kept."""
+
+    COMPACT_THRESHOLD = 1000
+    LOG_NAME = "log"
+    VALUES_DIR = "values"
+    # Each log record is a pickled (op, key, filename, size) tuple preceded by its length
+    RECORD_HEADER = struct.Struct("!I")
+    PUT, DELETE, RENAME, CLEAR = "put", "delete", "rename", "clear"
+
+    def __init__(self, path: str):
+        self.path = Path(path).expanduser()
+        self.values_dir = self.path / self.VALUES_DIR
+        self.values_dir.mkdir(parents=True, exist_ok=True)
+        self.log_path = self.path / self.LOG_NAME
+
+        self.index = {}  # Key -> (filename, size)
+        self.num_records = 0
+        self._read_log()
+        # Keys in the snapshot once the writes made so far are written out
+        self._keys = set(self.index)
+        # Clean up value files whose put didn't make it into the log, e.g. if the process died mid-write
+        self._compact()
+
+        self.writes = 0
+        self.written_bytes = 0
+        self.loads = 0
+        self.compactions = 0
+
+        self._ops = deque()
+        self._lock = threading.Lock()
+        self._ops_updated = threading.Condition()
+        self._pending = 0
+        self._writer = threading.Thread(
+            target=self._write_forever, name="snapshot-writer", daemon=True
+        )
+        self._writer.start()
+
+    def keys(self) -> List[Any]:
+        with self._lock:
+            return list(self.index)
+
+    def __contains__(self, key) -> bool:
+        with self._ops_updated:
+            return key in self._keys
+
+    def load(self, key) -> Any:
+        """Load the snapshotted value of a key, raising a KeyError if there isn't one."""
+        from runhouse.servers.http.http_utils import unpickle_oob
+
+        with self._lock:
+            filename, size = self.index[key]
+            data = bytearray(size)
+            with open(self.values_dir / filename, "rb") as f:
+                f.readinto(data)
+            self.loads += 1
+        return unpickle_oob(data)
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def put_many(self, mapping: Dict[Any, Any]):
+        from runhouse.servers.http.http_utils import pickle_oob
+
+        for key, value in mapping.items():
+            try:
+                data = b"".join(pickle_oob(value))
+            except Exception as e:
+                # E.g. modules holding locks or connections
+                logger.error(
+                    f"Failed to snapshot {key}, as it can't be pickled (keeping its previous snapshot, if any): {e}"
+                )
+                continue
+            self._enqueue((self.PUT, key, data))
+
+    def delete(self, keys: List[Any]):
+        for key in keys:
+            self._enqueue((self.DELETE, key, None))
+
+    def rename(self, old_key, new_key):
+        self._enqueue((self.RENAME, old_key, new_key))
+
+    def clear(self):
+        self._enqueue((self.CLEAR, None, None))
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait for the writes made so far to be written out. Returns False if that didn't happen within
+        ``timeout`` seconds."""
+        with self._ops_updated:
+            return self._ops_updated.wait_for(lambda: not self._pending, timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "keys": len(self.index),
+                "bytes": sum(size for _, size in self.index.values()),
+                "pending_writes": self._pending,
+                "writes": self.writes,
+                "written_bytes": self.written_bytes,
+                "loads": self.loads,
+                "compactions": self.compactions,
+            }
+
+    def _enqueue(self, op):
+        with self._ops_updated:
+            kind, key, value = op
+            if kind == self.PUT:
+                self._keys.add(key)
+            elif kind == self.DELETE:
+                self._keys.discard(key)
+            elif kind == self.RENAME:
+                self._keys.discard(value)
+                if key in self._keys:
+                    self._keys.discard(key)
+                    self._keys.add(value)
+            elif kind == self.CLEAR:
+                self._keys.clear()
+            self._ops.append(op)
+            self._pending += 1
+            self._ops_updated.notify_all()
+
+    def _write_forever(self):
+        while True:
+            with self._ops_updated:
+                self._ops_updated.wait_for(lambda: self._ops)
+                ops = list(self._ops)
+                self._ops.clear()
+            try:
+                self._write(ops)
+            except Exception as e:
+                logger.exception(e)
+            with self._ops_updated:
+                self._pending -= len(ops)
+                self._ops_updated.notify_all()
+
+    def _write(self, ops):
+        records = []
+        for op, key, value in ops:
+            if op == self.PUT:
+                filename = uuid.uuid4().hex
+                with open(self.values_dir / filename, "wb") as f:
+                    f.write(value)
+                    f.flush()
+                    os.fsync(f.fileno())
+                size = len(value)
+                records.append((self.PUT, key, filename, size))
+                self.writes += 1
+                self.written_bytes += size
+            else:
+                records.append((op, key, value, None))
+
+        with open(self.log_path, "ab") as f:
+            for record in records:
+                pickled = pickle.dumps(record)
+                f.write(self.RECORD_HEADER.pack(len(pickled)) + pickled)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self._lock:
+            for record in records:
+                for filename in self._apply(record):
+                    (self.values_dir / filename).unlink()
+            self.num_records += len(records)
+            if self.num_records - len(self.index) > self.COMPACT_THRESHOLD:
+                self._compact()
+                self.compactions += 1
+
+    def _apply(self, record) -> List[str]:
+        """Apply a log record to the index, returning the files of any values it replaced or deleted."""
+        op, key, value, size = record
+        if op == self.PUT:
+            old = self.index.pop(key, None)
+            self.index[key] = (value, size)
+            return [old[0]] if old else []
+        if op == self.DELETE:
+            old = self.index.pop(key, None)
+            return [old[0]] if old else []
+        if op == self.RENAME:
+            replaced = self.index.pop(value, None)
+            if key in self.index:
+                self.index[value] = self.index.pop(key)
+            return [replaced[0]] if replaced else []
+        if op == self.CLEAR:
+            files = [filename for filename, _ in self.index.values()]
+            self.index.clear()
+            return files
+        return []
+
+    def _read_log(self):
+        if not self.log_path.exists():
+            return
+        with open(self.log_path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + self.RECORD_HEADER.size <= len(data):
+            (length,) = self.RECORD_HEADER.unpack_from(data, offset)
+            start = offset + self.RECORD_HEADER.size
+            if start + length > len(data):
+                # The last record was cut off by the process dying mid-write
+                break
+            self._apply(pickle.loads(data[start : start + length]))
+            self.num_records += 1
+            offset = start + length
+
+    def _compact(self):
+        """Rewrite the log with a put for each live key, and delete the files no longer referenced by it."""
+        tmp_path = self.log_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            for key, (filename, size) in self.index.items():
+                pickled = pickle.dumps((self.PUT, key, filename, size))
+                f.write(self.RECORD_HEADER.pack(len(pickled)) + pickled)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_path)
+        self.num_records = len(self.index)
+
+        live = {filename for filename, _ in self.index.values()}
+        for path in self.values_dir.iterdir():
+            if path.name not in live:
+                path.unlink()
@@ -65,6 +65,7 @@ install_requires = [
     "python-dotenv",
     "fastapi",
     "fsspec<=2023.5.0",
+    "httpx",
     "pyarrow",
     "pyOpenSSL>=21.1.0",
     "rich",
@@ -92,6 +93,7 @@ extras_require = {
     "azure": ["azure-cli==2.31.0", "azure-core"],
     "gcp": ["google-api-python-client", "google-cloud-storage", "gcsfs"],
     "docker": ["docker"],
+    "compression": ["zstandard", "lz4"],
     "sagemaker": [
         # https://github.com/aws-samples/sagemaker-ssh-helper
         "sagemaker_ssh_helper",
@@ -1,3 +1,4 @@
+import json
 import logging
 import time
 import unittest
@@ -7,6 +8,8 @@ import requests
 
 from runhouse.globals import rns_client
 
+from tests.test_servers.conftest import base_servlet  # noqa: F401
+
 logger = logging.getLogger(__name__)
 
 
@@ -60,5 +63,96 @@ def test_https_roundtrip_performance(summer_func_with_auth):
     run_performance_tests(summer_func_with_auth)
 
 
+@pytest.mark.level("unit")
+def test_den_auth_cluster_config_performance(tmp_path, monkeypatch):
+    """Den auth checks look up the current cluster on every request, which should only parse the cluster
+    config when it changes."""
+    from runhouse.resources.hardware import utils
+    from runhouse.rns.utils.api import ResourceAccess
+    from runhouse.servers.http import http_utils
+    from runhouse.servers.obj_store import ObjStore
+
+    monkeypatch.setenv("HOME", str(tmp_path))
+    config_path = tmp_path / ".rh" / "cluster_config.yaml"
+    config_path.parent.mkdir()
+    config = {
+        "name": "/test-user/perf-cluster",
+        "resource_type": "cluster",
+        "resource_subtype": "Cluster",
+        "ips": ["1.2.3.4"],
+    }
+    config_path.write_text(json.dumps(config))
+
+    obj_store = ObjStore()
+    monkeypatch.setattr(
+        obj_store,
+        "user_resources",
+        lambda *args: {config["name"]: ResourceAccess.WRITE},
+    )
+
+    def uncached_access_check():
+        utils._cluster_config_cache.clear()
+        http_utils._current_cluster_uri = (None, None)
+        return obj_store.has_resource_access("token_hash")
+
+    times_list, uncached_avg = profile(uncached_access_check, reps=50)
+    print(f"Access check without config cache took {round(uncached_avg, 2)} ms")
+
+    times_list, cached_avg = profile(
+        lambda: obj_store.has_resource_access("token_hash"), reps=50
+    )
+    print(f"Access check with config cache took {round(cached_avg, 2)} ms")
+
+    assert http_utils.load_current_cluster() == "/test-user/perf-cluster"
+
+    # Rewriting the config invalidates the cache
+    config["name"] = "/test-user/renamed-perf-cluster"
+    config_path.write_text(json.dumps(config))
+    assert http_utils.load_current_cluster() == "/test-user/renamed-perf-cluster"
+    assert utils._current_cluster("cluster_name") == "renamed-perf-cluster"
+
+
+@pytest.mark.level("unit")
+def test_sharded_kvstore_throughput(base_servlet):  # noqa: F811
+    """Concurrent bulk reads and writes to a Kvstore, which should scale with its number of shards (up to the
+    number of CPUs available to the shard actors), and at least not slow down with more of them."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from runhouse.resources.kvstores import Kvstore
+
+    num_clients, num_batches, batch_size = 8, 20, 100
+    value = b"0" * 1024
+
+    def client(kv, client_index):
+        for batch in range(num_batches):
+            keys = [f"{client_index}-{batch}-{i}" for i in range(batch_size)]
+            kv.put_many({key: value for key in keys})
+            assert len(kv.get_many(keys)) == batch_size
+
+    elapsed = {}
+    for num_shards in [1, 2, 4]:
+        kv = Kvstore(num_shards=num_shards)
+        # Wait for the shard actors to start
+        assert len(kv) == 0
+        start = time.time()
+        with ThreadPoolExecutor(num_clients) as executor:
+            list(executor.map(lambda i: client(kv, i), range(num_clients)))
+        elapsed[num_shards] = time.time() - start
+
+        num_ops = 2 * num_clients * num_batches * batch_size
+        print(
+            f"{num_shards} shards: {round(num_ops / elapsed[num_shards])} ops/s "
+            f"({num_ops} ops in {round(elapsed[num_shards], 2)} s)"
+        )
+        assert len(kv) == num_clients * num_batches * batch_size
+        assert len(kv.keys(prefix="0-0-", limit=10)) == 10
+        assert kv.keys(limit=0) == []
+        kv.clear()
+
+    # Fanning out to more shards shouldn't cost more than it gains, even with few CPUs
+    for num_shards in [2, 4]:
+        assert elapsed[num_shards] < 1.5 * elapsed[1]
+
+
 if __name__ == "__main__":
     unittest.main()
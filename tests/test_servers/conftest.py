@@ -13,6 +13,7 @@ BASE_URL = "http://localhost:32300"
 
 BASE_ENV_ACTOR_NAME = "base"
 CACHE_ENV_ACTOR_NAME = "auth_cache"
+LOCAL_ENV_NAME = "local_servlet_env"
 
 
 # -------- HELPERS ----------- #
@@ -92,6 +93,37 @@ def cache_servlet():
     yield get_ray_servlet(CACHE_ENV_ACTOR_NAME)
 
 
+@pytest.fixture(scope="function")
+def local_servlet(base_servlet, monkeypatch):
+    """Factory for env servlets which run in the test process rather than as Ray actors, so tests can call them
+    and inspect their state directly. Keyword args are used as the cluster config, e.g. ``results_max_count``."""
+    from runhouse.globals import call_cache, obj_store
+    from runhouse.servers.servlet import EnvServlet
+
+    # The servlet takes over the process' object store and call cache, so restore them afterwards
+    obj_store_state, call_cache_state = dict(vars(obj_store)), dict(vars(call_cache))
+    servlets = []
+
+    def make_servlet(env_name=LOCAL_ENV_NAME, **cluster_config):
+        monkeypatch.setattr(
+            "runhouse.servers.servlet._current_cluster",
+            lambda key="name": cluster_config if key == "config" else None,
+        )
+        servlet = EnvServlet(env_name)
+        servlets.append(servlet)
+        return servlet
+
+    yield make_servlet
+
+    for servlet in servlets:
+        # Stop the servlet's background sweeps and event loop
+        servlet.results_retention = dict.fromkeys(servlet.results_retention)
+        servlet.event_loop.call_soon_threadsafe(servlet.event_loop.stop)
+    obj_store.clear()
+    vars(obj_store).update(obj_store_state)
+    vars(call_cache).update(call_cache_state)
+
+
 @pytest.fixture(scope="session")
 def obj_store(request):
     base_obj_store = ObjStore()
@@ -3,13 +3,29 @@ import json
 import unittest
 from unittest.mock import ANY, MagicMock, Mock, mock_open, patch
 
+import httpx
 import pytest
 
 import runhouse as rh
 from runhouse.globals import rns_client
 
 from runhouse.servers.http import HTTPClient
-from runhouse.servers.http.http_utils import pickle_b64
+from runhouse.servers.http.http_utils import (
+    ACCEPT_COMPRESSION_HEADER,
+    b64_unpickle,
+    COMPRESSION_HEADER,
+    COMPRESSION_THRESHOLD_HEADER,
+    decompress,
+    deserialize_data,
+    frame_response,
+    FRAMED_MEDIA_TYPE,
+    FramedBody,
+    MESSAGE_HEADER,
+    OutputType,
+    pickle_b64,
+    Response,
+    serialize_data,
+)
 
 
 class TestHTTPClient:
@@ -17,10 +33,16 @@ class TestHTTPClient:
     def init_fixtures(self):
         args = dict(name="local-cluster", host="localhost", server_host="0.0.0.0")
         self.local_cluster = rh.cluster(**args)
-        self.client = HTTPClient("localhost", HTTPClient.DEFAULT_PORT)
+        self.client = HTTPClient(
+            "localhost", HTTPClient.DEFAULT_PORT, compression=False
+        )
+        self.expected_call_headers = {
+            **rns_client.request_headers,
+            "Accept": f"{FRAMED_MEDIA_TYPE}, application/json",
+        }
 
     @pytest.mark.level("unit")
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_check_server(self, mock_get):
         mock_response = Mock()
         mock_response.status_code = 200
@@ -36,6 +58,39 @@ class TestHTTPClient:
             verify=False,
         )
 
+    @pytest.mark.level("unit")
+    def test_session_pool(self):
+        adapter = self.client.session.get_adapter(self.client._formatted_url("check"))
+        assert adapter._pool_maxsize == HTTPClient.DEFAULT_POOL_SIZE
+
+        client = HTTPClient("localhost", HTTPClient.DEFAULT_PORT, pool_size=32)
+        adapter = client.session.get_adapter(client._formatted_url("check"))
+        assert adapter._pool_maxsize == 32
+
+        session = client.session
+        client.reset_session()
+        assert client.session is not session
+
+    @pytest.mark.level("unit")
+    def test_close_closes_async_clients(self):
+        import asyncio
+
+        client = HTTPClient("localhost", HTTPClient.DEFAULT_PORT)
+
+        async def get_async_client():
+            return client._async_client()
+
+        loop = asyncio.new_event_loop()
+        try:
+            async_client = loop.run_until_complete(get_async_client())
+            assert not async_client.is_closed
+
+            client.close()
+            assert async_client.is_closed
+            assert loop.run_until_complete(get_async_client()) is not async_client
+        finally:
+            loop.close()
+
     @pytest.mark.level("unit")
     @patch("runhouse.servers.http.HTTPClient.request")
     @patch("pathlib.Path.mkdir")  # Mock the mkdir method
@@ -101,7 +156,7 @@ class TestHTTPClient:
         assert not client.verify
 
     @pytest.mark.level("unit")
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_call_module_method(self, mock_post):
         response_sequence = [
             json.dumps({"output_type": "log", "data": "Log message"}),
@@ -117,6 +172,7 @@ class TestHTTPClient:
         # Mock the response to iter_lines to return our simulated server response
         mock_response = Mock()
         mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "application/json"}
         mock_response.iter_lines.return_value = iter(response_sequence)
         mock_post.return_value = mock_response
 
@@ -144,7 +200,7 @@ class TestHTTPClient:
             "remote": False,
             "run_async": False,
         }
-        expected_headers = rns_client.request_headers
+        expected_headers = self.expected_call_headers
         expected_verify = self.client.verify
 
         mock_post.assert_called_once_with(
@@ -156,10 +212,75 @@ class TestHTTPClient:
         )
 
     @pytest.mark.level("unit")
-    @patch("requests.post")
+    @patch("requests.Session.post")
+    def test_call_module_method_framed(self, mock_post):
+        responses = [
+            Response(output_type="stdout", data=["Log message\n"]),
+            Response(
+                output_type="result_stream",
+                data=serialize_data("stream_result_1", "pickle"),
+            ),
+            Response(output_type="result", data=serialize_data(b"\x00" * 10, "pickle")),
+        ]
+        stream = b"".join(part for resp in responses for part in frame_response(resp))
+
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": FRAMED_MEDIA_TYPE}
+        # Split the stream at arbitrary points to make sure frames are reassembled across chunks
+        mock_response.iter_content.return_value = iter(
+            [stream[i : i + 5] for i in range(0, len(stream), 5)]
+        )
+        mock_post.return_value = mock_response
+
+        results = list(self.client.call_module_method("base_env", "install"))
+        assert results == ["stream_result_1", b"\x00" * 10]
+        mock_response.iter_lines.assert_not_called()
+
+    @pytest.mark.level("unit")
+    @pytest.mark.asyncio
+    @patch("httpx.AsyncClient.send")
+    async def test_call_module_method_async(self, mock_send):
+        responses = [
+            Response(output_type="stdout", data=["Log message\n"]),
+            Response(
+                output_type="result_stream",
+                data=serialize_data("stream_result_1", "pickle"),
+            ),
+            Response(output_type="result", data=serialize_data("result", "pickle")),
+        ]
+        stream = b"".join(part for resp in responses for part in frame_response(resp))
+        mock_send.return_value = httpx.Response(
+            200, headers={"Content-Type": FRAMED_MEDIA_TYPE}, content=stream
+        )
+
+        results = await self.client.call_module_method_async(
+            "module", "gen", args=[1], kwargs={}
+        )
+        assert [result async for result in results] == ["stream_result_1", "result"]
+
+        request = mock_send.call_args[0][0]
+        assert request.url == self.client._formatted_url("module/gen")
+        assert json.loads(request.content)["stream_logs"] is True
+
+        mock_send.return_value = httpx.Response(
+            200,
+            headers={"Content-Type": "application/json"},
+            content=json.dumps(
+                {"output_type": "result", "data": pickle_b64(3)}
+            ).encode(),
+        )
+        assert (
+            await self.client.call_module_method_async("module", "add", args=[1, 2])
+            == 3
+        )
+
+    @pytest.mark.level("unit")
+    @patch("requests.Session.post")
     def test_call_module_method_with_args_kwargs(self, mock_post):
         mock_response = MagicMock()
         mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "application/json"}
         # Set up iter_lines to return an iterator
         mock_response.iter_lines.return_value = iter(
             [
@@ -188,7 +309,7 @@ class TestHTTPClient:
             "run_async": False,
         }
         expected_url = f"http://localhost:32300/{module_name}/{method_name}"
-        expected_headers = rns_client.request_headers
+        expected_headers = self.expected_call_headers
         expected_verify = False
 
         mock_post.assert_called_with(
@@ -200,7 +321,151 @@ class TestHTTPClient:
         )
 
     @pytest.mark.level("unit")
-    @patch("requests.post")
+    @patch("requests.Session.post")
+    def test_call_module_method_with_cache_key(self, mock_post):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "application/json"}
+        mock_response.iter_lines.return_value = iter([])
+        mock_post.return_value = mock_response
+
+        self.client.call_module_method("module", "call", cache_key="batch_1")
+        _, call_kwargs = mock_post.call_args
+        assert call_kwargs["json"]["cache_key"] == "batch_1"
+
+    @pytest.mark.level("unit")
+    @patch("requests.Session.post")
+    def test_call_module_method_out_of_band_args(self, mock_post):
+        import numpy as np
+
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "application/json"}
+        mock_response.iter_lines.return_value = iter([])
+        mock_post.return_value = mock_response
+
+        arr = np.arange(1000, dtype=np.float64)
+        self.client.call_module_method("module", "method", args=[arr], kwargs={})
+
+        _, call_kwargs = mock_post.call_args
+        assert "json" not in call_kwargs
+        body = call_kwargs["data"]
+        assert isinstance(body, FramedBody)
+        # The array's memory is sent as-is rather than copied into the pickle
+        assert any(
+            isinstance(part, memoryview) and part.obj is arr for part in body.parts
+        )
+        headers = call_kwargs["headers"]
+        assert headers["Content-Type"] == FRAMED_MEDIA_TYPE
+        assert json.loads(headers[MESSAGE_HEADER])["run_async"] is False
+
+        # Server side, the body is read into a bytearray and the array is rebuilt on top of it
+        data = bytearray(b"".join(body.parts))
+        (args, kwargs) = deserialize_data(data)
+        assert np.array_equal(args[0], arr)
+        assert args[0].flags.writeable
+
+    @pytest.mark.level("unit")
+    @patch("requests.Session.post")
+    def test_call_module_method_streamed_upload(self, mock_post):
+        upload_response = Mock()
+        upload_response.status_code = 200
+        upload_response.json.return_value = {"output_type": "success"}
+        call_response = MagicMock()
+        call_response.status_code = 200
+        call_response.headers = {"Content-Type": "application/json"}
+        call_response.iter_lines.return_value = iter([])
+        mock_post.side_effect = [upload_response, call_response]
+
+        self.client.STREAM_UPLOAD_THRESHOLD = 100
+        self.client.UPLOAD_CHUNK_SIZE = 64
+        args = [b"x" * 1000]
+        self.client.call_module_method("module", "method", env="env", args=args)
+
+        (upload_url,), upload_kwargs = mock_post.call_args_list[0]
+        data_key = upload_url.split("/")[-1]
+        assert upload_url == f"http://localhost:32300/upload/module/{data_key}"
+        assert upload_kwargs["params"] == {"env": "env"}
+        chunks = upload_kwargs["data"].parts
+        assert all(len(chunk) <= 64 for chunk in chunks)
+        assert deserialize_data(bytearray(b"".join(chunks))) == [args, None]
+
+        # The call itself only references the uploaded args by key
+        _, call_kwargs = mock_post.call_args_list[1]
+        assert call_kwargs["json"]["data"] is None
+        assert call_kwargs["json"]["data_key"] == data_key
+
+    @pytest.mark.level("unit")
+    @patch("requests.Session.post")
+    def test_call_module_method_compression(self, mock_post):
+        client = HTTPClient(
+            "localhost",
+            HTTPClient.DEFAULT_PORT,
+            compression="zlib",
+            compression_threshold=1000,
+        )
+        result = "result" * 1000
+        responses = [
+            Response(output_type="stdout", data=["Log message\n"]),
+            Response(output_type="result", data=serialize_data(result, "pickle")),
+        ]
+        stream = b"".join(
+            part
+            for resp in responses
+            for part in frame_response(
+                resp, compression="zlib", compression_threshold=1000
+            )
+        )
+        # The small log frame is sent as is, and only the result is compressed
+        assert len(stream) < len(result)
+
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": FRAMED_MEDIA_TYPE}
+        mock_response.iter_content.return_value = iter([stream])
+        mock_post.return_value = mock_response
+
+        args = ["arg" * 1000]
+        assert client.call_module_method("module", "method", args=args) == result
+
+        _, call_kwargs = mock_post.call_args
+        headers = call_kwargs["headers"]
+        assert headers[ACCEPT_COMPRESSION_HEADER] == "zlib"
+        assert headers[COMPRESSION_THRESHOLD_HEADER] == "1000"
+        assert headers[COMPRESSION_HEADER] == "zlib"
+        assert deserialize_data(decompress(call_kwargs["data"], "zlib")) == [
+            args,
+            None,
+        ]
+
+    @pytest.mark.level("unit")
+    @patch("requests.Session.post")
+    def test_call_module_method_compression_unsupported(self, mock_post):
+        client = HTTPClient(
+            "localhost",
+            HTTPClient.DEFAULT_PORT,
+            compression="zlib",
+            compression_threshold=1000,
+        )
+        unsupported = Mock()
+        unsupported.status_code = 415
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "application/json"}
+        mock_response.iter_lines.return_value = iter([])
+        mock_post.side_effect = [unsupported, mock_response]
+
+        args = ["arg" * 1000]
+        client.call_module_method("module", "method", args=args)
+
+        # The args are resent uncompressed, and aren't compressed for later calls
+        _, call_kwargs = mock_post.call_args
+        assert COMPRESSION_HEADER not in call_kwargs["headers"]
+        assert call_kwargs["json"]["data"] == pickle_b64([args, None])
+        assert not client.compress_args
+
+    @pytest.mark.level("unit")
+    @patch("requests.Session.post")
     def test_call_module_method_error_handling(self, mock_post):
         mock_response = Mock()
         mock_response.status_code = 500
@@ -211,7 +476,7 @@ class TestHTTPClient:
             self.client.call_module_method("module", "method")
 
     @pytest.mark.level("unit")
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_call_module_method_stream_logs(self, mock_post):
         # Setup the mock response with a log in the stream
         response_sequence = [
@@ -221,6 +486,7 @@ class TestHTTPClient:
         ]
         mock_response = Mock()
         mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "application/json"}
         mock_response.iter_lines.return_value = iter(response_sequence)
         mock_post.return_value = mock_response
 
@@ -230,11 +496,12 @@ class TestHTTPClient:
         assert next(res) == "Log message"
 
     @pytest.mark.level("unit")
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_call_module_method_config(self, mock_post):
         test_data = self.local_cluster.config_for_rns
         mock_response = Mock()
         mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "application/json"}
         mock_response.iter_lines.return_value = iter(
             [
                 json.dumps({"output_type": "config", "data": test_data}),
@@ -246,10 +513,11 @@ class TestHTTPClient:
         assert cluster.config_for_rns == test_data
 
     @pytest.mark.level("unit")
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_call_module_method_not_found_error(self, mock_post):
         mock_response = Mock()
         mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "application/json"}
         missing_key = "missing_key"
         mock_response.iter_lines.return_value = iter(
             [
@@ -263,6 +531,76 @@ class TestHTTPClient:
 
         assert f"key {missing_key} not found" in str(context)
 
+    @pytest.mark.level("unit")
+    @patch("requests.Session.post")
+    def test_call_batch(self, mock_post):
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "application/json"}
+        # Results come back in the order the calls finish
+        mock_response.iter_lines.return_value = iter(
+            [
+                json.dumps(
+                    {"index": 2, "output_type": "result", "data": pickle_b64(None)}
+                ),
+                json.dumps(
+                    {
+                        "index": 0,
+                        "output_type": "exception",
+                        "error": pickle_b64(ValueError("boom")),
+                        "traceback": pickle_b64("Traceback"),
+                    }
+                ),
+                json.dumps(
+                    {"index": 1, "output_type": "result", "data": pickle_b64(3)}
+                ),
+            ]
+        )
+        mock_post.return_value = mock_response
+
+        calls = [("module", "fail"), ("module", "add", [1, 2]), ("module", "reset")]
+        results = self.client.call_batch(calls, return_exceptions=True)
+        assert isinstance(results[0], ValueError)
+        assert results[1:] == [3, None]
+
+        mock_post.assert_called_once()
+        _, kwargs = mock_post.call_args
+        sent = kwargs["json"]["calls"]
+        assert [(c["module"], c["method"]) for c in sent] == [c[:2] for c in calls]
+        assert deserialize_data(sent[1]["data"]) == [[1, 2], {}]
+
+        mock_response.iter_lines.return_value = iter(
+            [
+                json.dumps(
+                    {
+                        "index": 0,
+                        "output_type": "exception",
+                        "error": pickle_b64(ValueError("boom")),
+                        "traceback": pickle_b64("Traceback"),
+                    }
+                ),
+            ]
+        )
+        with pytest.raises(ValueError):
+            self.client.call_batch([("module", "fail")])
+
+    @pytest.mark.level("unit")
+    @patch("runhouse.Cluster.call")
+    def test_cluster_submit(self, mock_call):
+        mock_call.side_effect = lambda module_name, method_name, x: x * 2
+
+        futures = [self.local_cluster.submit("module", "double", i) for i in range(20)]
+        results = sorted(future.result() for future in rh.as_completed(futures))
+        assert results == [i * 2 for i in range(20)]
+
+        done, not_done = rh.wait(futures, timeout=1)
+        assert len(done) == 20 and not not_done
+
+        # Calls share the cluster's pool, sized to its client's connection pool
+        executor = self.local_cluster.executor
+        assert executor is self.local_cluster.executor
+        assert executor._max_workers == HTTPClient.DEFAULT_POOL_SIZE
+
     @pytest.mark.level("unit")
     @patch("runhouse.servers.http.HTTPClient.request")
     def test_put_object(self, mock_request):
@@ -296,6 +634,13 @@ class TestHTTPClient:
         self.client.keys(env=test_env)
         mock_request.assert_called_with(f"keys/?env={test_env}", req_type="get")
 
+        mock_request.reset_mock()
+
+        self.client.keys(env=test_env, prefix="run_", limit=10, cursor="run_09")
+        mock_request.assert_called_with(
+            f"keys/?env={test_env}&prefix=run_&limit=10&cursor=run_09", req_type="get"
+        )
+
     @pytest.mark.level("unit")
     @patch("runhouse.servers.http.HTTPClient.request")
     def test_delete(self, mock_request):
@@ -315,6 +660,38 @@ class TestHTTPClient:
         actual_data = mock_request.call_args[1]["data"]
         assert actual_data == expected_data
 
+    @pytest.mark.level("unit")
+    @patch("runhouse.servers.http.HTTPClient.request")
+    def test_put_many(self, mock_request):
+        mapping = {"key1": [1, 2], "key2": "a string"}
+
+        self.client.put_many(mapping, env="test_env")
+
+        mock_request.assert_called_once_with(
+            "put_many",
+            req_type="post",
+            data=pickle_b64(mapping),
+            env="test_env",
+            err_str="Error putting 2 objects",
+        )
+
+    @pytest.mark.level("unit")
+    @patch("requests.Session.post")
+    def test_get_many(self, mock_post):
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            "data": {"key1": pickle_b64([1, 2]), "key2": pickle_b64("a string")},
+            "output_type": OutputType.RESULT_DICT,
+        }
+        mock_post.return_value = mock_response
+
+        res = self.client.get_many(["key1", "key2", "missing_key"])
+        assert res == {"key1": [1, 2], "key2": "a string"}
+
+        sent_keys = b64_unpickle(mock_post.call_args[1]["json"]["data"])
+        assert sent_keys == ["key1", "key2", "missing_key"]
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -251,6 +251,20 @@ class TestNginxConfiguration:
         expected_template = self.https_config._https_template()
         file_handle.write.assert_called_once_with(expected_template)
 
+    @pytest.mark.level("unit")
+    def test_template_load_balances_workers(self):
+        config = NginxConfig(address="127.0.0.1", num_workers=3)
+        template = config._http_template()
+
+        assert config.worker_ports == [32300, 32301, 32302]
+        assert f"upstream {config.UPSTREAM_NAME} {{" in template
+        for port in config.worker_ports:
+            assert f"server 127.0.0.1:{port};" in template
+        assert f"proxy_pass http://{config.UPSTREAM_NAME}/;" in template
+
+        # A single worker is proxied to directly
+        assert "upstream" not in self.http_config._http_template()
+
     @pytest.mark.level("unit")
     @patch("subprocess.run")
     @patch("builtins.open", new_callable=mock_open)
@@ -1,6 +1,22 @@
+import asyncio
+import threading
+import time
+
 import pytest
 
-from runhouse.servers.http.auth import hash_token, update_cache_for_user
+from runhouse.resources.blobs import Blob
+from runhouse.resources.kvstores import Kvstore
+from runhouse.resources.kvstores.disk_dict import DiskDict
+from runhouse.resources.kvstores.sorted_key_dict import scan_keys, SortedKeyDict
+from runhouse.resources.kvstores.tiered_dict import TieredDict
+from runhouse.servers.http.auth import (
+    AuthCache,
+    hash_token,
+    LocalAuthCache,
+    update_cache_for_user,
+)
+from runhouse.servers.obj_store import KeyEnvIndex, ObjStore, SharedObject
+from runhouse.servers.snapshot_log import SnapshotLog
 
 from tests.test_servers.conftest import BASE_ENV_ACTOR_NAME, CACHE_ENV_ACTOR_NAME
 
@@ -68,6 +84,77 @@ class TestBaseEnvObjStore:
         res = obj_store.get(key)
         assert res == value
 
+    @pytest.mark.level("unit")
+    def test_put_and_get_large_object(self, obj_store):
+        import numpy as np
+        import ray
+
+        key = "large_key"
+        value = np.arange(obj_store.SHARED_OBJECT_THRESHOLD // 8 + 1, dtype=np.float64)
+        obj_store.put(key, value)
+
+        # Large values are published to Ray's object store when read for other envs, but only stored once
+        assert obj_store.get_obj_ref(key) is None
+        shared = obj_store.get(key, resolve_refs=False)
+        assert isinstance(shared, SharedObject)
+        assert np.array_equal(ray.get(shared.ref), value)
+        assert isinstance(
+            obj_store.get_many([key], resolve_refs=False)[key], SharedObject
+        )
+
+        # The owning env gets the live value back, so changes to it are kept
+        assert obj_store.get(key) is value
+        assert obj_store.get(key, check_other_envs=False) is value
+        assert obj_store.get_many([key])[key] is value
+        obj_store.get(key)[0] = -1.0
+        assert obj_store.get(key)[0] == -1.0
+
+        obj_store.rename(key, "large_key_renamed")
+        assert obj_store.get("large_key_renamed") is value
+        assert obj_store.pop("large_key_renamed") is value
+
+        obj_store.put(key, value)
+        obj_store.delete(key)
+        assert obj_store.get(key) is None
+
+    @pytest.mark.level("unit")
+    def test_large_object_changes_seen_by_other_envs(self, obj_store):
+        import numpy as np
+
+        from runhouse.globals import env_servlets
+
+        env_for_key = KeyEnvIndex()
+
+        def env_obj_store(servlet_name):
+            store = ObjStore()
+            store.servlet_name = servlet_name
+            store._kv_store = Kvstore()
+            store._env_for_key = env_for_key
+            return store
+
+        class LocalServlet:
+            def __init__(self, store):
+                self.store = store
+
+            def get(self, key, _intra_cluster=False, timeout=None):
+                return self.store.get(
+                    key, default=KeyError, check_other_envs=False, resolve_refs=False
+                )
+
+        owner = env_obj_store("large_owner_env")
+        reader = env_obj_store("large_reader_env")
+        env_servlets["large_owner_env"] = LocalServlet(owner)
+        try:
+            value = np.zeros(obj_store.SHARED_OBJECT_THRESHOLD // 8 + 1)
+            owner.put("large_key", value)
+            assert reader.get("large_key")[0] == 0.0
+
+            # Changes made in place in the owning env are seen by the next read from another env
+            owner.get("large_key")[0] = 1.0
+            assert reader.get("large_key")[0] == 1.0
+        finally:
+            env_servlets.pop("large_owner_env")
+
     @pytest.mark.level("unit")
     def test_get_nonexistent_key(self, obj_store):
         key = "nonexistent_key"
@@ -81,6 +168,19 @@ class TestBaseEnvObjStore:
         assert isinstance(keys, list)
         assert "k1" in keys
 
+    @pytest.mark.level("unit")
+    def test_list_keys_by_prefix(self, obj_store):
+        obj_store.put_many({f"scan_{i}": i for i in range(5)})
+        assert obj_store.keys(prefix="scan_") == [f"scan_{i}" for i in range(5)]
+
+        page = obj_store.keys(prefix="scan_", limit=2)
+        assert page == ["scan_0", "scan_1"]
+        assert obj_store.keys(prefix="scan_", limit=2, cursor=page[-1]) == [
+            "scan_2",
+            "scan_3",
+        ]
+        obj_store.delete_many([f"scan_{i}" for i in range(5)])
+
     @pytest.mark.level("unit")
     def test_delete_key(self, obj_store):
         key = "k1"
@@ -224,3 +324,475 @@ class TestAuthCacheObjStore:
                 hash_token(token), resource_uri
             )
             assert access_level is None
+
+    @pytest.mark.level("unit")
+    def test_revoked_access_reaches_workers(self, obj_store):
+        import ray
+
+        # Like an API server worker, which isn't a servlet the auth cache can call
+        obj_store.follow_auth_updates()
+        token_hash = hash_token("revoked_token")
+        obj_store._local_auth_cache.get(token_hash, lambda: {"/user/cluster": "write"})
+        time.sleep(0.5)
+        assert obj_store.resource_access_level(token_hash, "/user/cluster") == "write"
+
+        # The user's resources are reloaded without the cluster
+        ray.get(obj_store._auth_cache._invalidate_servlets.remote(token_hash))
+        deadline = time.time() + 5
+        while obj_store.resource_access_level(token_hash, "/user/cluster"):
+            assert time.time() < deadline
+            time.sleep(0.05)
+
+
+class TestAuthCache:
+    """Shared auth cache, run in the local process rather than as an actor"""
+
+    @pytest.mark.level("unit")
+    def test_reads_cache_before_den(self, monkeypatch):
+        import runhouse.servers.http.auth as auth
+
+        den_calls = []
+        monkeypatch.setattr(
+            auth.requests, "get", lambda *args, **kwargs: den_calls.append(1)
+        )
+        token_hash = hash_token("cached_token")
+        monkeypatch.setitem(AuthCache.CACHE, token_hash, {"/user/cluster": "read"})
+        monkeypatch.setitem(AuthCache.LOADED_AT, token_hash, time.monotonic())
+
+        assert AuthCache.get_or_add_user("cached_token") == {"/user/cluster": "read"}
+        assert not den_calls
+
+        # Expired resources are reloaded from Den
+        monkeypatch.setitem(
+            AuthCache.LOADED_AT, token_hash, time.monotonic() - AuthCache.TTL
+        )
+        with pytest.raises(AttributeError):
+            AuthCache.get_or_add_user("cached_token")
+        assert den_calls
+
+
+class TestLocalAuthCache:
+    """In-process auth cache in front of the shared auth cache actor"""
+
+    @pytest.mark.level("unit")
+    def test_caches_resources(self):
+        cache = LocalAuthCache()
+        loads = []
+
+        def load():
+            loads.append(1)
+            return {"/user/cluster": "write"}
+
+        assert cache.get("token_hash", load) == {"/user/cluster": "write"}
+        assert cache.get("token_hash", load) == {"/user/cluster": "write"}
+        assert len(loads) == 1
+
+        cache.invalidate("token_hash")
+        cache.get("token_hash", load)
+        assert len(loads) == 2
+
+    @pytest.mark.level("unit")
+    def test_negative_caching(self):
+        cache = LocalAuthCache(ttl=60, negative_ttl=0.05)
+        loads = []
+
+        def load():
+            loads.append(1)
+            return None
+
+        assert cache.get("invalid_token_hash", load) == {}
+        assert cache.get("invalid_token_hash", load) == {}
+        assert len(loads) == 1
+
+        time.sleep(0.1)
+        cache.get("invalid_token_hash", load)
+        assert len(loads) == 2
+
+    @pytest.mark.level("unit")
+    def test_refreshes_in_background_before_expiry(self):
+        cache = LocalAuthCache(ttl=0.2)
+        cache.get("token_hash", lambda: {"/user/cluster": "read"})
+
+        time.sleep(0.18)
+        refreshed = threading.Event()
+
+        def reload():
+            refreshed.set()
+            return {"/user/cluster": "write"}
+
+        # The cached resources are returned while they're reloaded in the background
+        assert cache.get("token_hash", reload) == {"/user/cluster": "read"}
+        assert refreshed.wait(timeout=5)
+        time.sleep(0.05)
+        assert cache.get("token_hash", reload) == {"/user/cluster": "write"}
+
+    @pytest.mark.level("unit")
+    def test_evicts_least_recently_used(self):
+        cache = LocalAuthCache(max_size=2)
+        cache.get("a", lambda: {"/a": "read"})
+        cache.get("b", lambda: {"/b": "read"})
+        cache.get("a", lambda: {})
+        cache.get("c", lambda: {"/c": "read"})
+
+        assert cache.get("a", lambda: {}) == {"/a": "read"}
+        assert cache.get("b", lambda: {}) == {}
+
+
+class TestKeyEnvIndex:
+    """Index of which env each key lives in, which processes keep local replicas of"""
+
+    @pytest.mark.level("unit")
+    @pytest.mark.asyncio
+    async def test_changes_since(self):
+        index = KeyEnvIndex()
+        index.put("k1", "env1")
+
+        # With no version, a snapshot of the whole index is returned
+        version, snapshot = await index.changes_since(None)
+        assert snapshot == {"k1": "env1"}
+
+        index.put("k2", "env2")
+        index.pop("k1")
+        new_version, changes = await index.changes_since(version)
+        assert new_version == version + 2
+        assert changes == [("k2", "env2"), ("k1", None)]
+
+        # Clearing the index means replicas need a new snapshot
+        index.clear()
+        index.put("k3", "env1")
+        _, snapshot = await index.changes_since(new_version)
+        assert snapshot == {"k3": "env1"}
+
+    @pytest.mark.level("unit")
+    @pytest.mark.asyncio
+    async def test_changes_since_waits_for_change(self):
+        index = KeyEnvIndex()
+        version, _ = await index.changes_since(None)
+
+        waiting = asyncio.ensure_future(index.changes_since(version, timeout=5))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+
+        index.put("k1", "env1")
+        _, changes = await asyncio.wait_for(waiting, timeout=1)
+        assert changes == [("k1", "env1")]
+
+        # Returns unchanged after the timeout
+        assert await index.changes_since(version + 1, timeout=0.05) == (
+            version + 1,
+            [],
+        )
+
+    @pytest.mark.level("unit")
+    def test_keys_by_prefix(self):
+        index = KeyEnvIndex()
+        index.put_many({"run_2": "env1", "run_1": "env2", "model": "env1"})
+        assert index.keys(prefix="run_") == ["run_1", "run_2"]
+        assert index.keys(limit=1, cursor="model") == ["run_1"]
+
+        index.rename_key("run_1", "run_3")
+        assert index.keys(prefix="run_") == ["run_2", "run_3"]
+
+        # Renaming a missing key is a no-op, so there's no change for replicas to apply
+        version = index.version
+        assert index.rename_key("missing", "run_4") == version
+        assert index.keys(prefix="run_") == ["run_2", "run_3"]
+        assert not index.contains("run_4") and index.version == version
+        index.clear()
+        assert index.keys(prefix="run_") == []
+
+
+class TestTieredDict:
+    """Memory-bounded dict which servlet object stores use to spill least recently used values to disk"""
+
+    @pytest.mark.level("unit")
+    def test_spills_and_reloads_lru_values(self, tmp_path):
+        data = TieredDict(memory_limit=2500, spill_dir=str(tmp_path))
+        for i in range(3):
+            data[f"k{i}"] = bytes([i]) * 1000
+
+        # k0 is least recently used, so it's spilled to make room for k2
+        stats = data.stats()
+        assert stats["memory_keys"] == 2 and stats["disk_keys"] == 1
+        assert stats["spills"] == 1 and stats["memory_usage"] <= 2500
+        assert len(list(tmp_path.iterdir())) == 1
+        assert "k0" in data and len(data) == 3
+
+        # Accessing k0 reloads it, spilling k1 which is now least recently used
+        assert data["k0"] == bytes([0]) * 1000
+        assert data.stats()["reloads"] == 1
+        assert data.get("k1") == bytes([1]) * 1000
+        assert set(data.sizes()) == {"k0", "k1", "k2"}
+
+        del data["k2"]
+        data.pop("k0")
+        assert list(data) == ["k1"]
+        data.clear()
+        assert len(data) == 0 and data.stats()["disk_usage"] == 0
+        assert not list(tmp_path.iterdir())
+
+    @pytest.mark.level("unit")
+    def test_keeps_unspillable_values_in_memory(self, tmp_path):
+        data = TieredDict(memory_limit=100, spill_dir=str(tmp_path))
+        data["lock"] = threading.Lock()
+        result = Blob()
+        result.data = b"1" * 1000
+        data["result"] = result
+        data["value"] = b"1" * 1000
+
+        # Locks can't be pickled, but Blobs (e.g. persisted results) can be spilled
+        assert data.stats()["disk_keys"] == 1
+        assert isinstance(data["lock"], type(threading.Lock()))
+        assert data["result"].data == b"1" * 1000
+
+
+class TestSortedKeyDict:
+    """Dict which Kvstores and the env_for_key index use to list keys by prefix, a page at a time"""
+
+    @pytest.mark.level("unit")
+    def test_scan_pages(self):
+        data = SortedKeyDict({f"run_{i:02d}": i for i in range(20)})
+        data["model"] = "m"
+
+        assert data.scan(prefix="run_1") == [f"run_{i}" for i in range(10, 20)]
+        pages, cursor = [], None
+        while True:
+            page = data.scan(prefix="run_", limit=8, cursor=cursor)
+            if not page:
+                break
+            pages.append(page)
+            cursor = page[-1]
+        assert [len(page) for page in pages] == [8, 8, 4]
+        assert sum(pages, []) == [f"run_{i:02d}" for i in range(20)]
+
+    @pytest.mark.level("unit")
+    def test_scan_after_changes(self):
+        data = SortedKeyDict(b=1)
+        assert data.scan() == ["b"]
+
+        # The index is kept up to date once built
+        data["a"] = 1
+        data.update({"c": 1, 10: 1})
+        data.setdefault("d", 1)
+        data.pop("b")
+        del data["c"]
+        assert data.scan() == [10, "a", "d"]
+        assert scan_keys(list(data), limit=2) == [10, "a"]
+
+        # Keys are ordered by their string form, so other types can be listed alongside strings
+        data["10"] = 1
+        assert data.scan(prefix="1") == ["10", 10]
+        data.clear()
+        assert data.scan() == []
+
+
+class TestDiskDict:
+    """Disk-backed dict used by Kvstores (and servlet object stores) with the disk backend"""
+
+    @pytest.mark.level("unit")
+    def test_put_get_and_persist(self, tmp_path):
+        np = pytest.importorskip("numpy")
+
+        path = str(tmp_path / "data.db")
+        data = DiskDict(path=path)
+        data["array"] = np.arange(1000)
+        data.put_many({f"run_{i}": i for i in range(5)})
+        data[10] = "ten"
+
+        # Arrays are read as views into the row read, rather than copied again
+        array = data["array"]
+        assert array.sum() == np.arange(1000).sum() and not array.flags.writeable
+        assert data.get_many(["run_1", 10, "missing"]) == {"run_1": 1, 10: "ten"}
+        assert 10 in data and "missing" not in data
+        assert data.pop("run_0") == 0 and data.pop("run_0", None) is None
+        assert len(data) == 6
+
+        # Keys can be listed by prefix a page at a time, like a SortedKeyDict
+        assert data.scan(prefix="run_", limit=2) == ["run_1", "run_2"]
+        assert data.scan(prefix="run_", cursor="run_2") == ["run_3", "run_4"]
+        assert data.scan(limit=2) == [10, "array"]
+
+        # Values persist for the next DiskDict opened on the path
+        data.close()
+        reopened = DiskDict(path=path)
+        assert reopened["run_4"] == 4 and len(reopened) == 6
+        assert reopened.stats()["disk_keys"] == 6
+
+    @pytest.mark.level("unit")
+    def test_keeps_unstorable_values_in_memory(self, tmp_path):
+        data = DiskDict(path=str(tmp_path / "data.db"))
+        lock = threading.Lock()
+        data["lock"] = lock
+        data["value"] = b"1" * 1000
+
+        assert data["lock"] is lock
+        stats = data.stats()
+        assert stats["memory_keys"] == 1 and stats["disk_keys"] == 1
+        assert data.scan() == ["lock", "value"]
+
+        # Putting a storable value over it moves the key to disk
+        data["lock"] = "unlocked"
+        assert data.stats()["memory_keys"] == 0 and data["lock"] == "unlocked"
+        data.clear()
+        assert len(data) == 0
+
+    @pytest.mark.level("unit")
+    def test_keeps_run_results_live(self, tmp_path):
+        from runhouse.resources.provenance import run, RunStatus
+
+        data = DiskDict(path=str(tmp_path / "data.db"))
+        result = Blob(name="finished_run", data="result")
+        result.provenance = run(name="finished_run", log_dest=None, load=False)
+        result.provenance.__enter__()
+        # Results are pinned while the run is in progress, and completed after
+        data["finished_run"] = result
+        result.provenance.__exit__(None, None, None)
+
+        assert data["finished_run"] is result
+        assert data["finished_run"].provenance.status == RunStatus.COMPLETED
+        assert data.stats()["memory_keys"] == 1
+
+    @pytest.mark.level("unit")
+    def test_kvstore_backend(self, tmp_path):
+        kv = Kvstore(backend="disk", path=str(tmp_path / "data.db"))
+        kv.put_many({"k1": 1, "k2": 2})
+        kv.rename_key("k1", "k3")
+        assert kv.keys(prefix="k") == ["k2", "k3"]
+        assert kv.stats()["keys"] == 2 and set(kv.sizes()) == {"k2", "k3"}
+
+        with pytest.raises(ValueError):
+            Kvstore(backend="disk", memory_limit=100)
+        with pytest.raises(ValueError):
+            Kvstore(backend="redis")
+
+
+class TestSnapshotLog:
+    """Durable snapshot of a servlet's object store, which is restored from after a restart"""
+
+    @pytest.mark.level("unit")
+    def test_replays_log(self, tmp_path):
+        snapshot = SnapshotLog(str(tmp_path))
+        value = [1, 2]
+        snapshot.put_many({"k1": "v1", "k2": value, "k3": "v3"})
+        # Values are pickled when they're put, so later changes aren't snapshotted
+        value.append(3)
+        snapshot.put("lock", threading.Lock())
+        snapshot.delete(["k3"])
+        snapshot.rename("k1", "k4")
+        assert snapshot.flush(timeout=5)
+        assert "k4" in snapshot and "k1" not in snapshot
+
+        # Unpicklable values aren't snapshotted
+        restored = SnapshotLog(str(tmp_path))
+        assert sorted(restored.keys()) == ["k2", "k4"]
+        assert restored.load("k4") == "v1" and restored.load("k2") == [1, 2]
+        with pytest.raises(KeyError):
+            restored.load("k3")
+
+        restored.clear()
+        assert restored.flush(timeout=5)
+        assert SnapshotLog(str(tmp_path)).keys() == []
+        assert not list((tmp_path / SnapshotLog.VALUES_DIR).iterdir())
+
+    @pytest.mark.level("unit")
+    def test_keeps_snapshot_of_unpicklable_value(self, tmp_path, caplog):
+        snapshot = SnapshotLog(str(tmp_path))
+        snapshot.put("k1", "v1")
+        snapshot.put("k1", threading.Lock())
+        assert snapshot.flush(timeout=5)
+
+        assert "Failed to snapshot k1" in caplog.text
+        assert SnapshotLog(str(tmp_path)).load("k1") == "v1"
+
+    @pytest.mark.level("unit")
+    def test_compacts_log(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(SnapshotLog, "COMPACT_THRESHOLD", 5)
+        snapshot = SnapshotLog(str(tmp_path))
+        for i in range(20):
+            snapshot.put("k1", i)
+            assert snapshot.flush(timeout=5)
+
+        assert snapshot.stats()["compactions"] > 0
+        assert snapshot.num_records <= 6
+        assert len(list((tmp_path / SnapshotLog.VALUES_DIR).iterdir())) == 1
+        assert SnapshotLog(str(tmp_path)).load("k1") == 19
+
+    @pytest.mark.level("unit")
+    def test_obj_store_restores_lazily(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(ObjStore, "SNAPSHOT_DIR", str(tmp_path))
+
+        def restarted_obj_store():
+            store = ObjStore()
+            store.servlet_name = "snapshot_env"
+            store._kv_store = Kvstore()
+            store._env_for_key = KeyEnvIndex()
+            store._open_snapshot()
+            return store
+
+        store = restarted_obj_store()
+        store.put("k1", "v1", snapshot=True)
+        store.put_many({"k2": "v2", "k3": "v3"}, snapshot=True)
+        store.delete("k3")
+        # Only keys put explicitly are snapshotted, not e.g. run results, and putting a key without snapshotting
+        # it drops its previous snapshot
+        store.put("run_result", "result")
+        store.put_many({"k4": "v4"}, snapshot=True)
+        store.put("k4", "unsnapshotted")
+        assert store._snapshot.flush(timeout=5)
+
+        store = restarted_obj_store()
+        # Keys are registered as living in the env, but only loaded on first get
+        assert sorted(store.keys()) == ["k1", "k2"]
+        assert store._kv_store.keys() == []
+        assert store.get("k1") == "v1"
+        assert store._kv_store.keys() == ["k1"]
+        assert store.stats()["snapshot"]["unrestored"] == 1
+
+    @pytest.mark.level("unit")
+    def test_server_restores_non_base_env(self, tmp_path, monkeypatch):
+        from runhouse.globals import env_servlets
+        from runhouse.servers.http.http_server import HTTPServer
+
+        monkeypatch.setattr(ObjStore, "SNAPSHOT_DIR", str(tmp_path))
+        env_for_key = KeyEnvIndex()
+
+        def restarted_obj_store(servlet_name):
+            store = ObjStore()
+            store.servlet_name = servlet_name
+            store._kv_store = Kvstore()
+            store._env_for_key = env_for_key
+            store._open_snapshot()
+            return store
+
+        class LocalServlet:
+            def __init__(self, env_name):
+                self.store = restarted_obj_store(env_name)
+
+            def get(self, key, _intra_cluster=False, timeout=None):
+                return self.store.get(
+                    key, default=KeyError, check_other_envs=False, resolve_refs=False
+                )
+
+        store = restarted_obj_store("other_env")
+        store.put("k1", "v1", snapshot=True)
+        assert store._snapshot.flush(timeout=5)
+        ObjStore.save_snapshot_runtime_env("other_env", {"env_vars": {"A": "1"}})
+        assert ObjStore.snapshotted_envs() == {"other_env": {"env_vars": {"A": "1"}}}
+
+        # After a restart, the server creates the servlet of each env with a snapshot (with the runtime env it was
+        # created with), which registers the keys in it so they can be found from other envs
+        env_for_key = KeyEnvIndex()
+        created = {}
+
+        def get_env_servlet(env_name, create=False, runtime_env=None):
+            created[env_name] = runtime_env
+            monkeypatch.setitem(env_servlets, env_name, LocalServlet(env_name))
+            return env_servlets[env_name]
+
+        monkeypatch.setattr(HTTPServer, "get_env_servlet", get_env_servlet)
+        HTTPServer._restore_snapshotted_envs()
+        assert created == {"other_env": {"env_vars": {"A": "1"}}}
+
+        base_store = restarted_obj_store("base")
+        assert base_store.get_env("k1") == "other_env"
+        assert base_store.get("k1") == "v1"
@@ -109,6 +109,18 @@ class TestServlet:
         assert resp.output_type == "exception"
         assert isinstance(b64_unpickle(resp.error), KeyError)
 
+    @pytest.mark.level("unit")
+    def test_get_obj_wait_for_key(self, base_servlet):
+        remote = False
+        stream = True
+        # Waiting for a call to store the key returns None if it doesn't, rather than raising a KeyError
+        resp = HTTPServer.call_servlet_method(
+            base_servlet,
+            "get",
+            ["abcdefg", remote, stream, None, False, "json", True],
+        )
+        assert resp is None
+
     @pytest.mark.level("unit")
     def test_get_keys(self, base_servlet):
         resp = HTTPServer.call_servlet_method(base_servlet, "get_keys", [])
@@ -263,3 +275,279 @@ class TestServlet:
     @pytest.mark.level("unit")
     def cancel_run(self, base_servlet):
         pass
+
+
+class TestResultsRetention:
+    @staticmethod
+    def _record_result(servlet, key, result):
+        from runhouse.globals import obj_store
+
+        obj_store.put(key, result)
+        servlet.output_types[key] = "result"
+        servlet._record_result(key, result)
+
+    @pytest.mark.level("unit")
+    def test_sweep_results_by_count_and_bytes(self, local_servlet):
+        from runhouse.globals import obj_store
+
+        servlet = local_servlet(results_max_count=3, results_max_bytes=2500)
+        for i in range(5):
+            self._record_result(servlet, f"run{i}", b"0" * 1000)
+
+        # The user putting a key over a result exempts it from being reclaimed
+        servlet._forget_results(["run0"])
+        servlet._sweep_results()
+
+        # Count would allow 3 of the 4 tracked results, and bytes only the newest 2
+        assert obj_store.keys(prefix="run") == ["run0", "run3", "run4"]
+        assert list(servlet.results) == ["run3", "run4"]
+        assert "run1" not in servlet.output_types and "run3" in servlet.output_types
+        assert servlet.results_stats["reclaimed"] == 2
+        assert servlet.results_stats["reclaimed_bytes"] > 2000
+
+    @pytest.mark.level("unit")
+    def test_sweep_results_by_age(self, local_servlet):
+        from runhouse.globals import obj_store
+
+        servlet = local_servlet(results_max_age=60)
+        self._record_result(servlet, "old_run", "result")
+        servlet.results["old_run"] = (0, servlet.results["old_run"][1])
+        self._record_result(servlet, "new_run", "result")
+
+        servlet._sweep_results()
+        assert obj_store.keys(prefix="new_run") == ["new_run"]
+        assert not obj_store.contains("old_run")
+        assert list(servlet.results) == ["new_run"]
+
+    @pytest.mark.level("unit")
+    def test_results_only_tracked_with_limits(self, local_servlet):
+        servlet = local_servlet()
+        servlet._record_result("run", b"0" * 1000)
+        assert not servlet.results
+
+        # Results are only sized if there's a limit on their bytes
+        servlet = local_servlet(results_max_count=10)
+        servlet._record_result("run", b"0" * 1000)
+        assert servlet.results["run"][1] == 0
+
+
+class TestCallCache:
+    class Preprocessor:
+        def normalize(self, x):
+            return x / 10
+
+        def tokenize(self, x):
+            return x.split()
+
+    @staticmethod
+    def _cache(monkeypatch, **limits):
+        from runhouse.servers.call_cache import CallCache
+
+        store = {}
+
+        def get(key, default=None, check_other_envs=True):
+            if key not in store and default is KeyError:
+                raise KeyError(key)
+            return store.get(key, default)
+
+        def delete_many(keys, check_other_envs=True):
+            for key in keys:
+                store.pop(key, None)
+
+        monkeypatch.setattr(
+            "runhouse.globals.obj_store.put",
+            lambda key, value: store.update({key: value}),
+        )
+        monkeypatch.setattr("runhouse.globals.obj_store.get", get)
+        monkeypatch.setattr("runhouse.globals.obj_store.delete_many", delete_many)
+        monkeypatch.setattr("runhouse.globals.obj_store.keys", lambda prefix=None: [])
+
+        cache = CallCache()
+        cache.configure("cache_env", **limits)
+        return cache, store
+
+    @pytest.mark.level("unit")
+    def test_keys_by_function_and_args(self, monkeypatch):
+        cache, _ = self._cache(monkeypatch)
+        module = self.Preprocessor()
+
+        key = cache.key_for("prep", module, "normalize", pickle_b64([[1], {}]))
+        assert key.startswith("_rh_call_cache:cache_env:prep:")
+        assert key == cache.key_for("prep", module, "normalize", pickle_b64([[1], {}]))
+        assert key != cache.key_for("prep", module, "normalize", pickle_b64([[2], {}]))
+        # Different code means different results
+        assert key != cache.key_for("prep", module, "tokenize", pickle_b64([[1], {}]))
+
+        # A cache key replaces the args
+        by_cache_key = cache.key_for("prep", module, "normalize", None, "batch_1")
+        assert by_cache_key == cache.key_for(
+            "prep", module, "normalize", pickle_b64([[2], {}]), "batch_1"
+        )
+
+    @pytest.mark.level("unit")
+    def test_hits_misses_and_eviction(self, monkeypatch):
+        cache, store = self._cache(monkeypatch, max_count=2)
+        assert cache.lookup("k1") == (False, None)
+
+        cache.store("k1", 1)
+        cache.store("k2", 2)
+        assert cache.lookup("k1") == (True, 1)
+
+        # k2 is least recently used, so it's evicted to make room for k3
+        cache.store("k3", 3)
+        assert set(store) == {"k1", "k3"}
+        assert cache.lookup("k2") == (False, None)
+
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 2
+        assert stats["stores"] == 3 and stats["evictions"] == 1
+
+    @pytest.mark.level("unit")
+    def test_expiry_size_limit_and_invalidation(self, monkeypatch):
+        cache, store = self._cache(monkeypatch, max_age=60, max_bytes=5000)
+        module = self.Preprocessor()
+        key = cache.key_for("prep", module, "normalize", None, "batch_1")
+        other_key = cache.key_for("other", module, "normalize", None, "batch_1")
+
+        cache.store(key, "result")
+        cache.entries[key] = (0, cache.entries[key][1])
+        assert cache.lookup(key) == (False, None)
+        assert key not in store and cache.stats()["expirations"] == 1
+
+        # Results bigger than the cache aren't cached
+        cache.store(key, b"0" * 10000)
+        assert key not in store
+
+        cache.store(key, "result")
+        cache.store(other_key, "result")
+        assert cache.invalidate("prep") == 1
+        assert list(store) == [other_key]
+        assert cache.invalidate() == 1 and not store
+
+    @pytest.mark.level("unit")
+    def test_hit_skips_unpickling_args(self, local_servlet, monkeypatch):
+        from runhouse.globals import call_cache, obj_store
+
+        servlet = local_servlet()
+        obj_store.put("prep", self.Preprocessor())
+
+        def call():
+            message = Message(
+                data=pickle_b64([[10], {}]),
+                key="normalize_run",
+                stream_logs=False,
+                cache_key="batch_1",
+            )
+            resp = servlet.call_module_method("prep", "normalize", message, None, False)
+            return b64_unpickle(resp.data)
+
+        assert call() == 1
+
+        def deserialize_data(data):
+            raise AssertionError("Args were unpickled for a cached call")
+
+        monkeypatch.setattr(
+            "runhouse.servers.servlet.deserialize_data", deserialize_data
+        )
+        assert call() == 1
+        assert call_cache.stats()["hits"] == 1
+
+
+class TestBatchCall:
+    class Counter:
+        def count(self, n):
+            return n
+
+        def count_up(self, n):
+            yield from range(n)
+
+    @pytest.mark.level("unit")
+    def test_generator_rejected(self, local_servlet):
+        from runhouse.globals import obj_store
+
+        servlet = local_servlet()
+        obj_store.put("counter", self.Counter())
+
+        data = pickle_b64([[3], {}])
+        result = servlet.call("counter", "count", serialization="pickle", data=data)
+        assert b64_unpickle(result) == 3
+
+        with pytest.raises(TypeError, match="counter.count_up returned a generator"):
+            servlet.call("counter", "count_up", serialization="pickle", data=data)
+
+
+class TestCancelRun:
+    class Sleeper:
+        async def sleep(self, seconds):
+            import asyncio
+
+            await asyncio.sleep(seconds)
+            return seconds
+
+    @pytest.mark.level("unit")
+    def test_cancel_coroutine_run(self, local_servlet, monkeypatch):
+        import threading
+
+        from runhouse.globals import obj_store
+        from runhouse.resources.provenance import RunStatus
+        from runhouse.servers.http.http_utils import OutputType
+
+        monkeypatch.setattr(
+            "runhouse.resources.hardware.utils._current_cluster",
+            lambda key="name": "cancel_cluster",
+        )
+        servlet = local_servlet()
+        obj_store.put("sleeper", self.Sleeper())
+
+        message = Message(
+            data=pickle_b64([[60], {}]), key="sleep_run", stream_logs=False
+        )
+        call = threading.Thread(
+            target=servlet.call_module_method,
+            args=("sleeper", "sleep", message, None, False),
+        )
+        call.start()
+        while "sleep_run" not in servlet.running_coroutines:
+            call.join(timeout=0.01)
+
+        servlet.cancel_run(Message(data=pickle_b64(False), key="sleep_run"))
+        call.join(timeout=5)
+        assert not call.is_alive()
+
+        # Cancelling isn't an error, so the run ends as cancelled rather than with an exception
+        assert servlet.output_types["sleep_run"] == OutputType.CANCELLED
+        assert obj_store.get("sleep_run").provenance.status == RunStatus.CANCELLED
+
+
+class TestStagedData:
+    @pytest.mark.level("unit")
+    def test_spilled_args_are_mapped(self):
+        import numpy as np
+
+        from runhouse.servers.http.http_utils import deserialize_data, pickle_oob
+        from runhouse.servers.servlet import StagedData
+
+        array = np.arange(1000, dtype=np.float64)
+        staged = StagedData(spill_threshold=1024)
+        for part in pickle_oob([[array], {}]):
+            staged.write(part)
+        assert staged.file is not None
+
+        data = staged.read()
+        assert isinstance(data, memoryview)
+        (arg,), _ = deserialize_data(data)
+        assert np.array_equal(arg, array)
+        # Copy-on-write, so the args can be changed in place
+        arg[0] = -1.0
+        assert arg[0] == -1.0
+
+    @pytest.mark.level("unit")
+    def test_stale_uploads_are_discarded(self, local_servlet):
+        from runhouse.servers.servlet import EnvServlet
+
+        servlet = local_servlet()
+        servlet.stage_data("abandoned", b"args")
+        servlet.staged_data["abandoned"].last_write -= EnvServlet.STAGING_TTL + 1
+        servlet.stage_data("in_progress", b"args")
+        servlet.stage_data("new", b"args")
+        assert sorted(servlet.staged_data) == ["in_progress", "new"]